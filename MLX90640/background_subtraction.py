@@ -1,16 +1,19 @@
 import copy
+from functools import partial
 
 import cv2 as cv
 import matplotlib.pyplot as plt
 import numpy as np
-from numpy import array, column_stack
+from numpy import column_stack
 from tqdm import tqdm
 
 from config import bg_subtraction_gifs_path, bg_subtraction_pics_path
-from file_utils import (basename, create_folder_if_absent, get_all_files,
-                        get_frame, get_frame_GREY, get_frame_RGB, normalize_frame)
+from file_utils import (basename, build_frame_matrix, create_folder_if_absent,
+                        get_all_files, get_frame, get_frame_GREY, get_frame_RGB,
+                        normalize_frame)
 from foreground_probability import foreground_probability
-from godec import get_reshaped_frames, godec, plot_godec, set_data
+from godec import (OnlineGoDec, WarmStartGoDec, get_reshaped_frames, godec,
+                   plot_godec, set_data)
 from kalman_filter import FrameKalmanFilter
 from visualizer import init_comparison_plot, update_comparison_plot, write_gif
 
@@ -20,41 +23,77 @@ Background Subtraction with Godec
 """
 
 
-def create_godec_input(files, normalize=True, rgb=False):
-    i = 0
-    M = None
-    frame = None
-    for f in files:
-        if type(f) == str:
-            if rgb:
-                frame = get_frame_RGB(f)
-            elif normalize:
-                frame = get_frame_GREY(f)
-            else:
-                frame = get_frame(f)
-        else:
-            frame = files[i]
-        # Stack frames as column vectors
-        F = frame.T.reshape(-1)
-        
-        if i == 0:
-            M = array([F]).T
-        else:
-            M = column_stack((M, F))
-        i+=1
+def read_godec_frame(f, normalize=True, rgb=False):
+    if type(f) == str:
+        if rgb:
+            return get_frame_RGB(f)
+        elif normalize:
+            return get_frame_GREY(f)
+        return get_frame(f)
+    return f
 
-    return M, frame
+def create_godec_input(files, normalize=True, rgb=False, out_path=None, workers=None):
+    """Stack frames as column vectors of M, see build_frame_matrix for out_path and workers"""
+    loader = partial(read_godec_frame, normalize=normalize, rgb=rgb)
+    return build_frame_matrix(files, loader, out_path=out_path, workers=workers)
 
-def bs_godec(files, debug=False, gif_name=False, normalize=True, rgb=False):
-    M , frame = create_godec_input(files, normalize, rgb)
-    L, S, LS, RMSE = godec(M, iterated_power=5)
+def bs_godec(files, debug=False, gif_name=False, normalize=True, rgb=False, decomposer=None,
+             out_path=None, workers=None):
+    """Background subtraction of a window of frames with GoDec.
+
+    Keyword Arguments:
+        decomposer {WarmStartGoDec} -- engine reused across consecutive windows, it is warm-started
+            from the background of the previous window. (default: {None}, plain godec)
+        out_path {str} -- memory-map the input matrix M to this .npy file (default: {None})
+        workers {int} -- number of threads loading frames from files (default: {None})
+    """
+    M , frame = create_godec_input(files, normalize, rgb, out_path, workers)
+    if decomposer is None:
+        L, S, LS, RMSE = godec(M, iterated_power=5)
+    else:
+        L, S, LS, RMSE = decomposer(M)
     height, width = frame.shape
     return M, LS, L, S, width, height
 
-def bs_godec_trained(files, noise, debug=False):
-    M, frame = create_godec_input(files)
+def bs_godec_trained(files, noise, debug=False, workers=None):
+    M, frame = create_godec_input(files, workers=workers)
     R = M - noise
     return M, R
+
+def bs_godec_stream(files, rank=1, card=None, normalize=True, rgb=False, batch_size=1):
+    """Online background subtraction, the streaming counterpart of bs_godec.
+
+    Frames are decomposed as they arrive with OnlineGoDec, so only the background
+    subspace is kept in memory instead of the whole (768, n_frames) matrix.
+
+    Arguments:
+        files {iterable} -- file paths or frames, may be a generator of live frames
+
+    Keyword Arguments:
+        batch_size {int} -- number of frames decomposed together (default: {1})
+
+    Yields:
+        (L_frame, S_frame) -- low-rank and sparse parts of every frame, in input order
+    """
+    decomposer = None
+    batch = []
+    for f in files:
+        frame = read_godec_frame(f, normalize, rgb)
+        if decomposer is None:
+            height, width = frame.shape
+            decomposer = OnlineGoDec(width * height, rank=rank, card=card)
+        # Stack frames as column vectors
+        batch.append(frame.T.reshape(-1))
+        if len(batch) == batch_size:
+            yield from decompose_godec_batch(decomposer, batch, width, height)
+            batch = []
+    if batch:
+        yield from decompose_godec_batch(decomposer, batch, width, height)
+
+def decompose_godec_batch(decomposer, batch, width, height):
+    L, S = decomposer.partial_fit(column_stack(batch))
+    for i in range(len(batch)):
+        yield L[:, i].reshape(width, height).T, S[:, i].reshape(width, height).T
     
 """
 Comparison Methods
@@ -195,7 +234,7 @@ def bs_pipeline(files, debug=False, save=False):
     4. naive detection / optical flow. 
 
     Arguments:
-        files {[str]} -- Array obtained from get_all_files(data_path)
+        files {[str] or FrameStore} -- Array obtained from get_all_files(data_path), or a FrameStore recording
 
     Keyword Arguments:
         debug {bool} -- [description] (default: {False})
@@ -1,6 +1,6 @@
 import time
 
-from background_subtraction import (bs_godec, bs_godec_trained, bs_pipeline,
+from background_subtraction import (bs_godec, bs_godec_stream, bs_godec_trained, bs_pipeline,
                                     cleaned_godec_img, compare_gaussian_blur,
                                     compare_median_blur,
                                     get_centroid_from_contour, postprocess_img)
@@ -11,6 +11,7 @@ from config import (bg_subtraction_gifs_path, bg_subtraction_pics_path,
 from file_utils import (basename, create_folder_if_absent, get_all_files,
                         get_frame, get_frame_GREY, normalize_frame, save_npy)
 from godec import plot_bs_results, plot_godec
+from synthetic_scene import recording_or_synthetic
 from timer import Timer
 from visualizer import init_comparison_plot, update_comparison_plot, write_gif
 import matplotlib.pyplot as plt
@@ -70,6 +71,21 @@ def test_bs_godec(files, save_data=False, save_gif=False, gif_name=None, fps=60)
     
     print("The entire process has taken: ", t.timers['accumulate'], " seconds")
 
+def test_bs_godec_stream(files, batch_size=1):
+    """Test bs_godec_stream Implementation
+    ---
+    Frames are decomposed one mini-batch at a time, the sparse part of every frame is available
+    as soon as its batch has been read.
+    """
+    t = Timer("accumulate")
+    t.start()
+    num_frames = 0
+    for L_frame, S_frame in bs_godec_stream(files, batch_size=batch_size):
+        assert L_frame.shape == S_frame.shape
+        num_frames += 1
+    t.stop("Time taken to run online background subtraction with godec: ")
+    assert num_frames == len(files)
+
 def test_godec_over_multiple_iterations(frames_per_iterations=30):
     ims = init_comparison_plot(get_frame_GREY(files[0]), subplt_titles=["Original", "L_frame", "S_Frame", "Cleaned_Frame", "L_fram_%", "S_frame_%"], num_rows=2, num_columns=3)
     for j in range(0, len(files), frames_per_iterations):
@@ -136,13 +152,14 @@ Initialization of test parameters
 """ 
 
 data_path = "data/teck_calib_2"
-files = get_all_files(data_path)
+files = recording_or_synthetic(data_path)
     
 """
 Test godec implementation
 """ 
 # test_bs_godec(files)
 # test_bs_godec(gif_name=basename(data_path)+".gif", fps=30, save_gif=True)
+# test_bs_godec_stream(files)
 
 """
 Test preobtained noise from godec with upcoming data
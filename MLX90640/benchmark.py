@@ -0,0 +1,245 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from os.path import dirname, exists, join, realpath
+
+import numpy as np
+
+from background_subtraction import cleaned_godec_img, create_godec_input, postprocess_img
+from centroid_history import Interpolator, append_centroid_history
+from file_utils import create_folder_if_absent, get_all_files, get_frame, normalize_frame
+from frame_store import TIME_FORMAT
+from godec import godec
+from kalman_filter import FrameKalmanFilter
+from naive_presence_detection import naive_detection_by_frame, naive_likelihoods
+from synthetic_scene import SyntheticScene, save_npy_folder
+
+"""
+Stage by stage benchmark of the analysis pipeline, from the frame files to the activity levels.
+
+Every stage is run on the first 100, 1800 and 7200 frames (under a minute, 15 minutes and an
+hour at 2 fps) of a recording, or of a SyntheticScene when no recording is given. The inputs of a
+stage are computed beforehand by the stages before it, so only the stage itself is measured:
+- wall time, the best of `repeat` runs,
+- peak memory allocated during one more run under tracemalloc, which numpy reports to.
+
+Results are saved as json in benchmark_results/, named after the commit they were measured at,
+and compare() prints the ratio of every stage between two result files:
+
+    python benchmark.py [data path] [output json]
+    python benchmark.py compare <old json> <new json>
+
+get_activity_levels lives in NUC/ and is only benchmarked when that folder is next to this one.
+"""
+
+WINDOWS = (100, 1800, 7200)
+RESULTS_PATH = "benchmark_results"
+NUC_PATH = join(dirname(dirname(realpath(__file__))), "NUC")
+
+
+def measure(function, args, repeat=1):
+    """
+    Returns:
+        (dict, any): wall_seconds and peak_memory_bytes of function(*args), and its result
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"wall_seconds": best, "peak_memory_bytes": peak}, result
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=dirname(realpath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+"""
+Stages, each one taking the outputs of the previous ones
+"""
+
+def stage_create_godec_input(files):
+    return create_godec_input(files)
+
+def stage_godec(M):
+    return godec(M)
+
+def godec_frames(M, L, S, frames):
+    """Normalized low rank and sparse frames, like displacement_history does before cleaned_godec_img"""
+    height, width = frames.shape[1:]
+    return [(normalize_frame(L[:, i].reshape(width, height).T), normalize_frame(S[:, i].reshape(width, height).T))
+            for i in range(M.shape[1])]
+
+def stage_cleaned_godec_img(ls_frames, frames):
+    return [cleaned_godec_img(L_frame, S_frame, frame) for (L_frame, S_frame), frame in zip(ls_frames, frames)]
+
+def stage_postprocess_img(images):
+    return [postprocess_img(img, all_images=False)[1] for img in images]
+
+def stage_centroid_history(centroids):
+    history = []
+    for i, frame_centroids in enumerate(centroids):
+        append_centroid_history(frame_centroids, i, history)
+    interpolator = Interpolator(history)
+    for i, centroid in enumerate(history):
+        interpolator.none_checker(centroid, i)
+    return interpolator.history
+
+def stage_kalman_filter(frames):
+    noise_remover = FrameKalmanFilter(frames.shape[1:])
+    return [noise_remover.process_frame(frame) for frame in frames]
+
+def stage_naive_detection(frames):
+    return [naive_detection_by_frame(frame) for frame in frames]
+
+def displacement_payload(history, start_time, fps=2):
+    """Compiled displacement dictionary of one room visit, the input of get_activity_levels"""
+    displacements, timestamps = [], []
+    for i in range(1, len(history)):
+        if history[i] is not None and history[i - 1] is not None:
+            displacements.append(float(np.hypot(history[i][0] - history[i - 1][0], history[i][1] - history[i - 1][1])))
+            timestamps.append(i / fps)
+    seconds = len(history) / fps
+    return {"1": {"start": time.strftime(TIME_FORMAT, time.localtime(start_time)),
+                  "end": time.strftime(TIME_FORMAT, time.localtime(start_time + seconds)),
+                  "timeElapsedInSeconds": seconds, "numFrames": len(history),
+                  "frames": displacements, "timestamps": timestamps}}
+
+def stage_activity_levels(get_activity_levels, data, output_dir):
+    # get_activity_levels saves to analysis_results/ in the working directory
+    cwd = os.getcwd()
+    os.chdir(output_dir)
+    try:
+        get_activity_levels(data, name=data["1"]["start"][:10] + " bedroom")
+    finally:
+        os.chdir(cwd)
+
+def load_get_activity_levels():
+    if not exists(join(NUC_PATH, "activity_levels.py")):
+        return None
+    if NUC_PATH not in sys.path:
+        sys.path.append(NUC_PATH)  # appended, so that modules of this folder are not shadowed
+    from activity_levels import get_activity_levels
+    return get_activity_levels
+
+
+def benchmark_window(files, window, repeat=1, get_activity_levels=None, start_time=0):
+    """Run every stage on the first `window` files
+
+    Returns:
+        list: one dict per stage, with its name, number of frames, wall time and peak memory
+    """
+    files = files[:window]
+    frames = np.array([get_frame(f) for f in files])
+    results = []
+
+    def run(name, function, *args):
+        stats, result = measure(function, args, repeat)
+        stats = dict(stage=name, frames=len(files), us_per_frame=stats["wall_seconds"] / len(files) * 1e6, **stats)
+        print("{:>20} {:>5} frames: {:8.3f}s {:8.1f} us/frame {:8.1f} MB".format(
+            name, len(files), stats["wall_seconds"], stats["us_per_frame"], stats["peak_memory_bytes"] / 2 ** 20))
+        results.append(stats)
+        return result
+
+    M, _ = run("create_godec_input", stage_create_godec_input, files)
+    L, S, LS, RMSE = run("godec", stage_godec, M)
+    images = run("cleaned_godec_img", stage_cleaned_godec_img, godec_frames(M, L, S, frames), frames)
+    centroids = run("postprocess_img", stage_postprocess_img, images)
+    history = run("centroid_history", stage_centroid_history, centroids)
+    run("kalman_filter", stage_kalman_filter, frames)
+    run("naive_detection", stage_naive_detection, frames)
+    run("naive_likelihoods", naive_likelihoods, frames)
+    if get_activity_levels is not None:
+        output_dir = tempfile.mkdtemp()
+        run("activity_levels", stage_activity_levels, get_activity_levels, displacement_payload(history, start_time), output_dir)
+        shutil.rmtree(output_dir)
+    return results
+
+def run_benchmark(data_path=None, windows=WINDOWS, repeat=1, output_path=None, seed=0):
+    """Benchmark every stage at every window length and save the results as json
+
+    Args:
+        data_path (str, optional): folder of a recording. Defaults to None, a SyntheticScene.
+        windows (tuple, optional): numbers of frames. Defaults to WINDOWS.
+        repeat (int, optional): runs of each stage, the fastest one is kept. Defaults to 1.
+        output_path (str, optional): Defaults to None, benchmark_results/<commit>.json.
+        seed (int, optional): of the SyntheticScene. Defaults to 0.
+
+    Returns:
+        dict: the saved results
+    """
+    synthetic_path = None
+    start_time = 0
+    if data_path is None:
+        scene = SyntheticScene(seed=seed, dropout=0)  # like recordings, saved after frame_repair
+        start_time = scene.start_time
+        synthetic_path = tempfile.mkdtemp()
+        files = save_npy_folder(scene, synthetic_path, max(windows))
+    else:
+        files = [f for f in get_all_files(data_path) if f.endswith(".npy")]
+
+    get_activity_levels = load_get_activity_levels()
+    if get_activity_levels is None:
+        print("{} not found, activity_levels is not benchmarked".format(NUC_PATH))
+    results = {
+        "commit": git_commit(),
+        "time": time.strftime(TIME_FORMAT),
+        "data": data_path or "synthetic seed {}".format(seed),
+        "repeat": repeat,
+        "stages": [],
+    }
+    try:
+        for window in windows:
+            if window > len(files):
+                print("Only {} frames, skipping the window of {}".format(len(files), window))
+                continue
+            results["stages"].extend(benchmark_window(files, window, repeat, get_activity_levels, start_time))
+    finally:
+        if synthetic_path:
+            shutil.rmtree(synthetic_path)
+
+    if output_path is None:
+        output_path = join(RESULTS_PATH, "{}.json".format(results["commit"] or results["time"]))
+    if dirname(output_path):
+        create_folder_if_absent(dirname(output_path))
+    with open(output_path, "w") as outfile:
+        json.dump(results, outfile, indent=4)
+    print("Saved results to", output_path)
+    return results
+
+def compare(old_path, new_path):
+    """Print the wall time and peak memory ratios new / old of every stage measured in both files
+
+    Returns:
+        dict: (stage, frames) -> (wall time ratio, peak memory ratio)
+    """
+    with open(old_path) as f:
+        old = {(s["stage"], s["frames"]): s for s in json.load(f)["stages"]}
+    with open(new_path) as f:
+        new = {(s["stage"], s["frames"]): s for s in json.load(f)["stages"]}
+    ratios = {}
+    for key in new:
+        if key in old:
+            ratios[key] = (new[key]["wall_seconds"] / max(old[key]["wall_seconds"], 1e-9),
+                           new[key]["peak_memory_bytes"] / max(old[key]["peak_memory_bytes"], 1))
+            print("{:>20} {:>5} frames: time x{:.2f}, memory x{:.2f}".format(key[0], key[1], *ratios[key]))
+    return ratios
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == "compare":
+        compare(sys.argv[2], sys.argv[3])
+    else:
+        run_benchmark(sys.argv[1] if len(sys.argv) > 1 else None, output_path=sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,28 @@
+import json
+import os
+import shutil
+import tempfile
+
+from benchmark import compare, measure, run_benchmark
+
+
+def test_measure():
+    stats, result = measure(lambda n: [0] * n, (1000000,), repeat=2)
+    assert len(result) == 1000000
+    assert stats["peak_memory_bytes"] >= 8 * 1000000 and stats["wall_seconds"] > 0
+
+def test_run_benchmark(windows=(50, 120)):
+    output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(output_dir, "results.json")
+    results = run_benchmark(windows=windows, output_path=output_path)
+    with open(output_path) as f:
+        assert json.load(f) == results
+    stages = {s["stage"] for s in results["stages"]}
+    assert {"create_godec_input", "godec", "cleaned_godec_img", "postprocess_img", "centroid_history",
+            "kalman_filter", "naive_detection"} <= stages
+    assert sorted({s["frames"] for s in results["stages"]}) == list(windows)
+    assert all(ratio == (1, 1) for ratio in compare(output_path, output_path).values())
+    shutil.rmtree(output_dir)
+
+# test_measure()
+# test_run_benchmark()
@@ -0,0 +1,132 @@
+import time
+
+import numpy as np
+
+"""
+Capture loop of the MLX90640, shared by main.py and the rpi_to_mlx scripts.
+
+The sensor is read straight into preallocated float32 memory: a slot of a SharedFrameRing, or
+the buffer of the FrameCapture when frames are used one at a time. The frame is checked and its
+NaN pixels repaired in place, then it is published or handed out as a view, so capturing a frame
+allocates no frame sized array, whatever the refresh rate.
+
+A reader is a function filling a flat float32 buffer of 768 values in place, and raising
+ValueError when the read failed and should be retried, like adafruit_mlx90640.MLX90640.getFrame.
+
+Every frame is timed, from the start of the read to the end of the repair. The latency goes to
+the ring with the frame, or to `metrics` when frames are not published to a ring, and failed
+reads, empty frames and frames dropped because the ring was full are counted.
+"""
+
+ARRAY_SHAPE = (24, 32)
+
+
+def serial_reader(ser):
+    """Reader of the comma separated frames sent by the Arduino, one per line"""
+    def read(buffer):
+        values = ser.readline().split(b",")[:-1]
+        if len(values) != buffer.size:
+            raise ValueError("Expected {} values, got {}".format(buffer.size, len(values)))
+        buffer[:] = values  # numpy parses the bytes straight into the buffer
+    return read
+
+
+class FrameCapture:
+    def __init__(self, read_frame, shape=ARRAY_SHAPE, repair=None, metrics=None):
+        """
+        Args:
+            read_frame (function): reader filling a flat buffer, e.g. mlx.getFrame
+            shape (tuple, optional): Defaults to ARRAY_SHAPE.
+            repair (FrameRepair, optional): repairs the NaN pixels of every frame. Defaults to None.
+            metrics (Metrics, optional): records capture_latency and the counts of capture().
+                Defaults to None.
+        """
+        self.read_frame = read_frame
+        self.shape = tuple(shape)
+        self.repair = repair
+        self.metrics = metrics
+        self.buffer = np.zeros(self.shape, dtype=np.float32)
+        self._nan = np.zeros(self.buffer.size, dtype=bool)
+        self.captured = 0
+        self.retries = 0
+        self.invalid = 0
+        self.dropped = 0
+
+    def read_into(self, frame):
+        """Read a frame into frame, a (height, width) float32 array, and repair it in place.
+        ValueError of the reader is raised.
+
+        Returns:
+            float: capture latency in seconds, or None if the frame is empty
+        """
+        start = time.perf_counter()
+        flat = frame.reshape(-1)  # a view, slots and buffer are contiguous
+        self.read_frame(flat)
+        nan_count = np.count_nonzero(np.isnan(flat, out=self._nan))
+        if np.count_nonzero(flat) == nan_count:
+            # nothing was read, every pixel is 0 or NaN
+            self.invalid += 1
+            return None
+        # a frame without NaN only needs repair to reset the NaN streaks of its pixels
+        if self.repair is not None and (nan_count or self.repair.nan_streaks.any()):
+            self.repair.repair(frame)
+        self.captured += 1
+        return time.perf_counter() - start
+
+    def capture(self):
+        """Read the next frame into the buffer
+
+        Returns:
+            np.array: view of the buffer, overwritten by the next capture(), or None if there was no frame
+        """
+        try:
+            latency = self.read_into(self.buffer)
+        except ValueError:
+            # these happen, no biggie - retry
+            self.retries += 1
+            if self.metrics is not None:
+                self.metrics.count("collect_retries")
+            return None
+        if self.metrics is not None:
+            if latency is None:
+                self.metrics.count("frames_invalid")
+            else:
+                self.metrics.observe("capture_latency", latency)
+        return None if latency is None else self.buffer
+
+    def capture_into(self, ring):
+        """Read the next frame into the next slot of ring and publish it. When the ring is full,
+        the frame is read into the buffer anyway to keep up with the sensor, and dropped.
+
+        Returns:
+            bool: whether a frame was published
+        """
+        slot = ring.next_slot()
+        try:
+            latency = self.read_into(self.buffer if slot is None else slot)
+        except ValueError:
+            self.retries += 1
+            ring.count_retry()
+            return False
+        if latency is None:
+            ring.count_invalid()
+            return False
+        if slot is None:
+            self.dropped += 1
+            ring.count_drop()
+            return False
+        ring.publish(latency=latency)
+        return True
+
+    def run(self, ring):
+        """Capture frames into ring until the consumer requests a stop. The caller marks the ring
+        stopped once it is done with the sensor."""
+        while not ring.stop_requested():
+            try:
+                self.capture_into(ring)
+            except InterruptedError:
+                pass
+
+    def summary(self):
+        return "Frames captured: {}, dropped: {}, failed reads: {}, empty frames: {}".format(
+            self.captured, self.dropped, self.retries, self.invalid)
@@ -0,0 +1,94 @@
+import io
+import tracemalloc
+
+import numpy as np
+
+from capture import FrameCapture, serial_reader
+from frame_repair import FrameRepair
+from frame_ring import SharedFrameRing
+from synthetic_scene import SyntheticScene
+from timer import Metrics
+
+
+class FakeSensor:
+    """Reader playing frames of a SyntheticScene, with a failed read and an empty frame now and then"""
+    def __init__(self, num_frames=200, fail_every=50, empty_every=40, seed=0):
+        frames, _, _ = SyntheticScene(seed=seed, dropout=0.002, dead_pixels=3).generate(num_frames)
+        self.frames = frames.reshape(num_frames, -1)
+        self.fail_every = fail_every
+        self.empty_every = empty_every
+        self.reads = 0
+
+    def getFrame(self, framebuf):
+        self.reads += 1
+        if self.reads % self.fail_every == 0:
+            framebuf[:100] = 0  # partly written, like a failed I2C read
+            raise ValueError("Failed to read frame")
+        if self.reads % self.empty_every == 0:
+            framebuf[:] = 0
+            return
+        framebuf[:] = self.frames[self.reads % len(self.frames)]
+
+def test_capture_into_ring(num_reads=200):
+    """Frames are repaired in the slots and published with their latency, failures are counted"""
+    sensor = FakeSensor()
+    ring = SharedFrameRing(capacity=256)
+    capture = FrameCapture(sensor.getFrame, repair=FrameRepair())
+    for _ in range(num_reads):
+        capture.capture_into(ring)
+    assert ring.retries == capture.retries == num_reads // sensor.fail_every
+    both = np.lcm(sensor.fail_every, sensor.empty_every)  # failed reads are not checked for being empty
+    assert ring.invalid == capture.invalid == num_reads // sensor.empty_every - num_reads // both
+    assert ring.published == capture.captured == num_reads - ring.retries - ring.invalid
+    assert ring.dropped == 0
+    ring.mark_stopped()
+    for frame, timestamp in ring.consume():
+        assert not np.isnan(frame).any()
+        assert 0 < ring.capture_latency() < 0.1
+    ring.close()
+
+def test_ring_full(capacity=8, num_reads=20):
+    """When the ring is full the sensor is still read, and the frames are dropped"""
+    sensor = FakeSensor(fail_every=1000, empty_every=1000)
+    ring = SharedFrameRing(capacity=capacity)
+    capture = FrameCapture(sensor.getFrame)
+    published = [capture.capture_into(ring) for _ in range(num_reads)]
+    assert sum(published) == capacity
+    assert ring.dropped == capture.dropped == num_reads - capacity
+    assert sensor.reads == num_reads
+    ring.close()
+
+def test_no_allocation(num_reads=500):
+    """Capturing frames without NaN into the buffer allocates nothing frame sized"""
+    sensor = FakeSensor(num_frames=num_reads, fail_every=10 ** 6, empty_every=10 ** 6)
+    sensor.frames = np.nan_to_num(sensor.frames, nan=25.0)
+    metrics = Metrics()
+    capture = FrameCapture(sensor.getFrame, repair=FrameRepair(), metrics=metrics)
+    capture.capture()  # first histogram
+    tracemalloc.start()
+    for _ in range(num_reads):
+        frame = capture.capture()
+        assert frame is not None and frame.base is capture.buffer.base
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("Peak memory allocated over {} frames: {} bytes".format(num_reads, peak))
+    assert peak < capture.buffer.nbytes
+    latency = metrics.snapshot()["histograms"]["capture_latency"]
+    print("Capture latency: {:.1f} us mean, {:.1f} us max".format(latency["mean"] * 1e6, latency["max"] * 1e6))
+
+def test_serial_reader():
+    """Lines of the Arduino are parsed straight into the buffer, malformed lines are retried"""
+    frame = np.arange(768, dtype=np.float32).reshape(24, 32) / 10
+    lines = [",".join("{:.2f}".format(v) for v in frame.flat) + ",\r\n",
+             "1.0,2.0,\r\n",
+             ",".join(["nan"] + ["{:.2f}".format(v) for v in frame.flat[1:]]) + ",\r\n"]
+    capture = FrameCapture(serial_reader(io.BytesIO("".join(lines).encode())), repair=FrameRepair())
+    assert np.allclose(capture.capture(), frame)
+    assert capture.capture() is None and capture.retries == 1
+    repaired = capture.capture()
+    assert np.isclose(repaired[0, 0], (frame[0, 1] + frame[1, 0]) / 2)
+
+# test_capture_into_ring()
+# test_ring_full()
+# test_no_allocation()
+# test_serial_reader()
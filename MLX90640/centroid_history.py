@@ -1,6 +1,7 @@
 import copy
 import math
 import os
+import time
 from collections import Counter, defaultdict
 from datetime import datetime
 
@@ -11,7 +12,8 @@ from tqdm import tqdm
 
 from background_subtraction import bs_godec, cleaned_godec_img, postprocess_img
 from file_utils import (basename, create_folder_if_absent, get_all_files,
-                        get_frame, normalize_frame)
+                        get_frame, get_frame_GREY, normalize_frame)
+from godec import OnlineGoDec
 
 
 def input_target_centroid_area():
@@ -38,54 +40,60 @@ def get_centroid_history(files):
     return np.array(centroid_history)
 
 def append_centroid_history(centroids, i, centroid_history):
+    prev_centroid = centroid_history[i - 1] if i > 0 else None
+    centroid_history.append(select_centroid(centroids, prev_centroid))
+
+def select_centroid(centroids, prev_centroid):
+    """Pick the centroid of the target among the centroids found in a frame
+
+    Args:
+        centroids ([(int, int)]): centroids found by postprocess_img
+        prev_centroid ((int, int)): centroid picked for the previous frame, None if there was none
+
+    Returns:
+        (int, int): None if no centroid was found
+    """
     if len(centroids) == 1:
-        centroid_history.append(centroids[0])
-        return
-        
-    if i == 0:
-        if len(centroids) >= 1:
-            centroid_history.append(centroids[0])  # pick the first centroid of the first frame. Not the most accurate but yolo
-        else:
-            centroid_history.append(None)
-
-    else:
-        prev_centroid = centroid_history[i - 1]
-        if len(centroids) > 1:
-            if prev_centroid:  # if the subsequent frames have more than one centroid then we use the one closest to the previous centroid
-                prev_centroid = centroid_history[i-1]
-                distances = np.zeros(len(centroids))
-                for j in range(len(centroids)):
-                    x_disp = prev_centroid[0]-centroids[j][0]
-                    y_disp = prev_centroid[1]-centroids[j][1]
-                    distance = (x_disp**2 + y_disp**2)**(1/2)
-                    distances[j] = distance
-                desired_centroid_index = np.argmin(distances)
-                centroid_history.append(centroids[desired_centroid_index])
-
-            elif not prev_centroid:  # if your first few frames were None and your first frame with centroids has multiple, just pick the first one
-                centroid_history.append(centroids[0])
-        else:
-            centroid_history.append(None)
+        return centroids[0]
+    if len(centroids) == 0:
+        return None
+    if prev_centroid:  # if the subsequent frames have more than one centroid then we use the one closest to the previous centroid
+        distances = np.zeros(len(centroids))
+        for j in range(len(centroids)):
+            x_disp = prev_centroid[0]-centroids[j][0]
+            y_disp = prev_centroid[1]-centroids[j][1]
+            distance = (x_disp**2 + y_disp**2)**(1/2)
+            distances[j] = distance
+        desired_centroid_index = np.argmin(distances)
+        return centroids[desired_centroid_index]
+    # pick the first centroid of the first frame, or of the first frame with centroids after frames without. Not the most accurate but yolo
+    return centroids[0]
 
 class Interpolator:
-    def __init__(self, history):
+    def __init__(self, history, limit=5):
         self.none_counter = 0
         self.none_block = []  # stores start and end indices of blocks of none
         self.block_start = (0, 0)
         self.block_end = (0, 0)
         self.history = copy.copy(history)
-        self.limit = 5 # how many Nones until you are sure the elder has left the room?
+        self.limit = limit # how many Nones until you are sure the elder has left the room?
+
+    def interpolate(self):
+        """Fill every block of up to `limit` Nones between two centroids, returns the history"""
+        for i, centroid in enumerate(self.history):
+            self.none_checker(centroid, i)
+        return self.history
 
     def none_checker(self, arr_elem, index):
         if arr_elem is None:
             self.none_counter += 1
             if len(self.none_block) == 0:  # if this be the first None,
-                if index != 0:  # and if the first element isn't a None,
+                if index != 0 and self.history[index-1] is not None:  # and if there is a centroid before it,
                     self.none_block.append(index)
                     self.block_start = self.history[index-1]
         else:
             self.none_counter = 0
-            if self.history[index-1] is None: # if the previous element was the last None in a block,
+            if self.none_block: # if the previous element was the last None in a block,
                 self.none_block.append(index-1)
                 self.block_end = self.history[index]
                 length = self.none_block[1] - self.none_block[0] + 1
@@ -137,7 +145,8 @@ def get_centroid_area_history(files, debug=True, key_format="simple"):
         1: { ... }
     }
     Arguments:
-        files {[str]} -- up to 30 mins of files, since we decided that recalibration of godec should be done every 30 mins
+        files {[str]} -- up to 30 mins of files, since we decided that recalibration of godec should be done every 30 mins.
+            A slice of a FrameStore, e.g. from FrameStore.time_range, works as well.
     """
     annotated_images = []
     centroid_history = []
@@ -201,7 +210,7 @@ def displacement_history(files, start_time, end_time):
     calculate displacement directly.
     
     Args:
-        files ([np.array]): [description]
+        files ([np.array]): frames, or a slice of a FrameStore
         debug (bool, optional): [description]. Defaults to True.
 
     Returns:
@@ -221,16 +230,8 @@ def displacement_history(files, start_time, end_time):
         annotated_images.append(annotated_img)
         
         append_centroid_history(centroids, i, centroid_history)
-    interpolated_centroid_history = Interpolator(centroid_history).history
-    displacements = []
-    numFrames = len(interpolated_centroid_history)
-    for i in range(numFrames - 1):
-        prev_centroid = interpolated_centroid_history[i+1]
-        curr_centroid = interpolated_centroid_history[i]
-        if not (prev_centroid == None or curr_centroid == None): 
-            curr_displacement = np.sqrt((prev_centroid[0]-curr_centroid[0])**2 + (prev_centroid[1]-curr_centroid[1])**2)
-            displacements.append(curr_displacement)
-    
+    displacements = history_displacements(centroid_history)
+    numFrames = len(centroid_history)
 
 
     timeElapsed = datetime.strptime(end_time, "%Y.%m.%d_%H%M%S") - datetime.strptime(start_time, "%Y.%m.%d_%H%M%S")
@@ -241,3 +242,103 @@ def displacement_history(files, start_time, end_time):
             "numFrames": numFrames,
             "frames": displacements,
             }
+
+
+def history_displacements(centroid_history, limit=5):
+    """Displacements between consecutive centroids of a history, once blocks of up to `limit` Nones
+    are interpolated. DisplacementAnalyzer gives the same displacements as the centroids arrive."""
+    interpolated_centroid_history = Interpolator(centroid_history, limit).interpolate()
+    displacements = []
+    for i in range(len(interpolated_centroid_history) - 1):
+        prev_centroid = interpolated_centroid_history[i+1]
+        curr_centroid = interpolated_centroid_history[i]
+        if not (prev_centroid is None or curr_centroid is None):
+            curr_displacement = np.sqrt((prev_centroid[0]-curr_centroid[0])**2 + (prev_centroid[1]-curr_centroid[1])**2)
+            displacements.append(curr_displacement)
+    return displacements
+
+
+class DisplacementAnalyzer:
+    """
+    Streaming counterpart of displacement_history, fed one frame at a time while frames are captured.
+    It keeps the pipeline state between frames: the online GoDec background model, the centroid of
+    the previous frame, and the pending block of frames without a centroid waiting to be interpolated.
+    Blocks of up to `limit` frames without a centroid are interpolated like Interpolator does.
+    finish() then only has to wrap up the displacements computed so far, along with the capture
+    time of the frame each displacement ends at, so the NUC can place them on its time grid.
+    """
+    def __init__(self, start_time, rank=1, card=None, limit=5):
+        self.start_time = start_time
+        self.rank = rank
+        self.card = card
+        self.limit = limit  # how many Nones until you are sure the elder has left the room?
+
+        self.decomposer = None
+        self.num_frames = 0
+        self.prev_centroid = None  # centroid picked for the previous frame
+        self.block_start = None  # last centroid before the current block of Nones
+        self.none_counter = 0  # length of the current block of Nones
+        self.block_times = []  # capture times of the frames of the current block of Nones
+        self.displacements = []
+        self.timestamps = []  # seconds since start_time of the frame each displacement ends at
+        self.start_timestamp = time.mktime(time.strptime(start_time, "%Y.%m.%d_%H%M%S"))
+
+    def add_frame(self, frame, timestamp=None):
+        """Run the background subtraction pipeline on one raw 24x32 frame captured at `timestamp`, defaults to now"""
+        timestamp = time.time() if timestamp is None else timestamp
+        height, width = frame.shape
+        if self.decomposer is None:
+            self.decomposer = OnlineGoDec(width * height, rank=self.rank, card=self.card)
+        L, S = self.decomposer.partial_fit(frame.T.reshape(-1))
+        L_frame = normalize_frame(L.reshape(width, height).T)
+        S_frame = normalize_frame(S.reshape(width, height).T)
+        img = cleaned_godec_img(L_frame, S_frame, frame)
+        img, centroids = postprocess_img(img, all_images=False)
+
+        centroid = select_centroid(centroids, self.prev_centroid)
+        self.prev_centroid = centroid
+        self.num_frames += 1
+        self.add_centroid(centroid, timestamp)
+
+    def add_centroid(self, centroid, timestamp=None):
+        if centroid is None:
+            if self.block_start is not None:
+                self.none_counter += 1
+                self.block_times.append(timestamp)
+            return
+
+        if self.block_start is not None and self.none_counter <= self.limit:
+            # interpolate the block of Nones, if any, between block_start and this centroid
+            length = self.none_counter
+            start_x, start_y = self.block_start
+            x_interval = (centroid[0] - start_x) / (length+1)
+            y_interval = (centroid[1] - start_y) / (length+1)
+            path = [(np.round(start_x + (k+1)*x_interval), np.round(start_y + (k+1)*y_interval)) for k in range(length)]
+            path.append(centroid)
+            times = self.block_times + [timestamp]
+
+            prev = self.block_start
+            for curr, t in zip(path, times):
+                self.displacements.append(np.sqrt((curr[0]-prev[0])**2 + (curr[1]-prev[1])**2))
+                self.timestamps.append(None if t is None else round(t - self.start_timestamp, 3))
+                prev = curr
+
+        self.block_start = centroid
+        self.none_counter = 0
+        self.block_times = []
+
+    def finish(self, end_time):
+        """Result in the format of displacement_history for the frames added so far, plus "timestamps"
+        when the capture time of every frame is known. The displacements are those history_displacements
+        gives for the same centroids, but the centroids themselves come from the online GoDec model,
+        so they can differ from those of the batch GoDec of displacement_history."""
+        timeElapsed = datetime.strptime(end_time, "%Y.%m.%d_%H%M%S") - datetime.strptime(self.start_time, "%Y.%m.%d_%H%M%S")
+        result = {"start": self.start_time,
+                  "end": end_time,
+                  "timeElapsedInSeconds": timeElapsed.total_seconds(),
+                  "numFrames": self.num_frames,
+                  "frames": self.displacements,
+                  }
+        if None not in self.timestamps:
+            result["timestamps"] = self.timestamps
+        return result
@@ -2,16 +2,18 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from background_subtraction_test import test_postprocess_img
-from centroid_history import (Interpolator, get_centroid_area_history,
+from centroid_history import (DisplacementAnalyzer, Interpolator,
+                              get_centroid_area_history,
                               get_centroid_area_number,
-                              displacement_history,
+                              displacement_history, history_displacements,
                               get_centroid_history, input_target_centroid_area,
                               plot_centroid_history_hexbin)
-from file_utils import get_all_files
+from file_utils import get_all_files, get_frame
+from synthetic_scene import recording_or_synthetic
 from visualizer import init_heatmap, update_heatmap
 
 data = "data/teck_calib_2"
-files = get_all_files(data)
+files = recording_or_synthetic(data)
 
 def test_input_target_centroid_area():
     input_target_centroid_area()
@@ -68,7 +70,47 @@ def test_displacement_history(files):
     displacement = displacement_history(files)
     print(displacement)    
     
+def test_displacement_analyzer(files):
+    analyzer = DisplacementAnalyzer("2020.07.14_081300")
+    for f in files:
+        analyzer.add_frame(get_frame(f))
+    displacement = analyzer.finish("2020.07.14_084300")
+    assert displacement["numFrames"] == len(files)
+    assert len(displacement["frames"]) < len(files)
+    print(displacement)
+
+def test_displacement_analyzer_interpolation():
+    analyzer = DisplacementAnalyzer("2020.07.14_081300", limit=2)
+    history = [(0, 0), None, None, (3, 0), None, None, None, (3, 4), (3, 5)]
+    for i, centroid in enumerate(history):
+        analyzer.add_centroid(centroid, analyzer.start_timestamp + i * 0.5)
+    # the first block of Nones is interpolated, the second one is too long
+    assert analyzer.displacements == [1, 1, 1, 1]
+    # each displacement is timed at the frame it ends at
+    assert analyzer.timestamps == [0.5, 1.0, 1.5, 4.0]
+    assert analyzer.finish("2020.07.14_081305")["timestamps"] == [0.5, 1.0, 1.5, 4.0]
+
+def test_history_displacements_match_analyzer(num_frames=2000, seed=0):
+    """The batch and streaming paths interpolate the same gaps, with leading and trailing Nones"""
+    rng = np.random.default_rng(seed)
+    history = [tuple(rng.integers(0, 24, 2)) for i in range(num_frames)]
+    i = 0
+    while i < num_frames:
+        length = rng.integers(1, 9)  # gaps of up to 8 frames, interpolated up to limit
+        history[i:i + length] = [None] * len(history[i:i + length])
+        i += length + rng.integers(1, 20)
+    history[:3] = [None] * 3
+    history[-2:] = [None] * 2
+    for limit in (2, 5):
+        analyzer = DisplacementAnalyzer("2020.07.14_081300", limit=limit)
+        for centroid in history:
+            analyzer.add_centroid(centroid)
+        assert np.allclose(history_displacements(history, limit), analyzer.displacements)
+
 # test_input_target_centroid_area()
 # test_get_centroid_history(plot=True)
 # test_get_centroid_area_history(files)
-test_displacement_history(files)
+# test_displacement_analyzer(files)
+# test_displacement_analyzer_interpolation()
+# test_history_displacements_match_analyzer()
+# test_displacement_history(files)
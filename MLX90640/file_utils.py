@@ -1,6 +1,7 @@
 import csv
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from os import listdir, makedirs
 from os.path import dirname, exists, getsize, isfile, join, splitext
 from os.path import basename as base_folder
@@ -25,7 +26,7 @@ def save_npy(df, data_path, name=None, directory_sort=None):
   
 def npy_name_to_time(filename, directory_sort=None):
     filename, file_extension = splitext(filename)
-    timestring = basename(filename) 
+    timestring = base_folder(filename)
     if directory_sort == "day":
       time_tuple = time.strptime(timestring, "%Y.%m.%d")
     elif directory_sort == "hour":
@@ -52,8 +53,55 @@ def load_json(file):
     return json.load(json_file)
 
 def get_frame(file):
+    # frames that are already arrays, e.g. read from a FrameStore, are returned as is
+    if isinstance(file, np.ndarray):
+        return file
     return np.load(file)
 
+def build_frame_matrix(frames, loader=get_frame, dtype=np.float32, out_path=None, workers=None):
+    """Stack frames as the columns of one preallocated (height*width, n_frames) matrix.
+    Each frame is flattened as frame.T.reshape(-1), the layout used by godec.
+
+    Args:
+        frames ([str] or [np.array]): file paths and/or in-memory frames
+        loader (function, optional): turns an element of frames into a 2D frame. Defaults to get_frame.
+        dtype (optional): Defaults to np.float32.
+        out_path (str, optional): write the matrix into a memory-mapped .npy file at this path
+            instead of RAM. Defaults to None.
+        workers (int, optional): number of threads loading frames in parallel. Defaults to None (sequential).
+
+    Returns:
+        (np.array, np.array): the frame matrix and the last frame
+    """
+    if not hasattr(frames, "__len__"):
+        frames = list(frames)
+    num_frames = len(frames)
+    frame = loader(frames[0])
+    height, width = frame.shape
+    shape = (height * width, num_frames)
+    if out_path:
+        if folder_path(out_path) != "":
+            create_folder_if_absent(folder_path(out_path))
+        M = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=shape, fortran_order=True)
+    else:
+        M = np.empty(shape, dtype=dtype, order="F")  # columns are contiguous
+
+    if workers and num_frames > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = executor.map(loader, (frames[i] for i in range(1, num_frames)))
+            M[:, 0] = frame.T.reshape(-1)
+            for i, frame in enumerate(loaded, start=1):
+                M[:, i] = frame.T.reshape(-1)
+    else:
+        M[:, 0] = frame.T.reshape(-1)
+        for i in range(1, num_frames):
+            frame = loader(frames[i])
+            M[:, i] = frame.T.reshape(-1)
+
+    if out_path:
+        M.flush()
+    return M, frame
+
 def normalize_frame(df):
     return cv.normalize(df, None, alpha=0, beta=255, norm_type=cv.NORM_MINMAX, dtype=cv.CV_8U)
 
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+
+"""
+Repair of the NaN pixels of MLX90640 frames, shared by every capture path.
+
+A NaN pixel is replaced by the mean of its valid up, down, left and right neighbours, i.e. a
+normalized convolution with a cross shaped stencil: the neighbour values (NaN counted as 0) and
+the number of valid neighbours are both summed with four shifted slices of the whole frame, and
+divided. It works on one (24, 32) frame or a (N, 24, 32) stack at once, and a pixel whose
+neighbours are all NaN is filled in the next pass from the pixels repaired in this one.
+
+Some pixels of a sensor read NaN in every frame. FrameRepair finds them, as pixels that were NaN
+in dead_after frames in a row, and keeps them in a mask that can be saved between runs. They are
+then repaired with a precomputed index map of their neighbours and weights, a gather and a
+product, and the stencil only runs when some other pixel reads NaN, e.g. after a bad I2C read.
+"""
+
+MAX_PASSES = 4
+DEAD_AFTER = 8  # frames, 4 seconds at 2 fps
+
+
+def neighbour_means(frames):
+    """Mean of the valid 4-neighbours of every pixel, NaN where there is none
+
+    Args:
+        frames (np.array): (height, width) or (N, height, width)
+
+    Returns:
+        np.array: same shape as frames
+    """
+    valid = ~np.isnan(frames)
+    values = np.where(valid, frames, 0)
+    sums = np.zeros(frames.shape, dtype=values.dtype)
+    counts = np.zeros(frames.shape, dtype=np.uint8)
+    for target, source in (((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+                           ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+                           ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+                           ((slice(None), slice(None, -1)), (slice(None), slice(1, None)))):
+        sums[(Ellipsis,) + target] += values[(Ellipsis,) + source]
+        counts[(Ellipsis,) + target] += valid[(Ellipsis,) + source]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+def repair_nans(frames, max_passes=MAX_PASSES):
+    """Replace, in place, every NaN pixel by the mean of its valid 4-neighbours.
+
+    Args:
+        frames (np.array): float (height, width) frame or (N, height, width) frames
+        max_passes (int, optional): passes for NaN pixels surrounded by NaN pixels. What is left
+            after them is filled with the mean of its frame. Defaults to MAX_PASSES.
+
+    Returns:
+        np.array: frames
+    """
+    for _ in range(max_passes):
+        nan = np.isnan(frames)
+        if not nan.any():
+            return frames
+        frames[nan] = neighbour_means(frames)[nan]
+    nan = np.isnan(frames)
+    if nan.any():
+        frames[nan] = np.broadcast_to(frame_means(frames), frames.shape)[nan]  # frames all NaN stay NaN
+    return frames
+
+def frame_means(frames):
+    """Mean of the valid pixels of every frame, shaped to broadcast against frames"""
+    valid = ~np.isnan(frames)
+    sums = np.where(valid, frames, 0).sum(axis=(-2, -1), keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / valid.sum(axis=(-2, -1), keepdims=True)
+
+
+class FrameRepair:
+    def __init__(self, shape=(24, 32), dead_after=DEAD_AFTER, dead_pixels=()):
+        """
+        Args:
+            shape (tuple, optional): Defaults to (24, 32).
+            dead_after (int, optional): frames in a row a pixel must be NaN in to be marked dead.
+                Defaults to DEAD_AFTER.
+            dead_pixels (list, optional): flat indices of pixels known to be dead, e.g. loaded
+                from a previous run. Defaults to ().
+        """
+        self.shape = tuple(shape)
+        self.dead_after = dead_after
+        num_pixels = self.shape[0] * self.shape[1]
+        self.dead = np.zeros(num_pixels, dtype=bool)
+        self.dead[np.asarray(dead_pixels, dtype=np.int64)] = True
+        self.nan_streaks = np.where(self.dead, dead_after, 0)  # frames in a row each pixel was NaN in
+        self._build_map()
+
+    @classmethod
+    def load(cls, path, shape=(24, 32), dead_after=DEAD_AFTER):
+        """FrameRepair with the dead pixels saved in path, if it exists"""
+        dead_pixels = np.load(path) if os.path.exists(path) else ()
+        return cls(shape, dead_after, dead_pixels)
+
+    def save(self, path):
+        np.save(path, self.dead_pixels)
+
+    @property
+    def dead_pixels(self):
+        """Flat indices of the dead pixels"""
+        return np.flatnonzero(self.dead)
+
+    def _build_map(self):
+        """Index map of the valid neighbours of every dead pixel, and their weights.
+        Dead pixels with only dead neighbours are left to repair_nans."""
+        height, width = self.shape
+        rows, cols = np.divmod(self.dead_pixels, width)
+        rows = rows[:, None] + np.array([-1, 1, 0, 0])
+        cols = cols[:, None] + np.array([0, 0, -1, 1])
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        indices = np.where(inside, rows * width + cols, 0)
+        usable = inside & ~self.dead[indices]
+        mapped = usable.any(axis=1)
+        weights = usable / np.maximum(usable.sum(axis=1, keepdims=True), 1)
+        # dead pixel values are the values of map_sources times map_weights
+        self.map_pixels = self.dead_pixels[mapped]
+        self.map_sources, positions = np.unique(indices[mapped][usable[mapped]], return_inverse=True)
+        self.map_weights = np.zeros((len(self.map_sources), len(self.map_pixels)))
+        self.map_weights[positions, np.nonzero(usable[mapped])[0]] = weights[mapped][usable[mapped]]
+
+    def update(self, nan):
+        """Update the NaN streaks and the dead pixels from the NaN pixels of (N, pixels) frames"""
+        if len(nan) == 1:
+            self.nan_streaks += 1
+            self.nan_streaks *= nan[0]
+        else:
+            trailing = np.argmax(~nan[::-1], axis=0)  # NaN frames after the last valid one
+            self.nan_streaks = np.where(nan.all(axis=0), self.nan_streaks + len(nan), trailing)
+        dead = self.nan_streaks >= self.dead_after
+        if (dead != self.dead).any():
+            print("Dead pixels: {}".format(np.flatnonzero(dead).tolist()))
+            self.dead = dead
+            self._build_map()
+
+    def repair(self, frames):
+        """Replace, in place, the NaN pixels of a frame or (N, height, width) frames, dead pixels
+        with the index map and the others with repair_nans.
+
+        Returns:
+            np.array: frames
+        """
+        flat = frames.reshape(-1, self.dead.size)  # a view of contiguous frames, a copy of sliced ones
+        nan = np.isnan(flat)
+        self.update(nan)
+        if self.map_pixels.size:
+            values = flat[:, self.map_pixels]
+            means = flat[:, self.map_sources] @ self.map_weights
+            flat[:, self.map_pixels] = np.where(np.isnan(values), means, values)  # dead pixels may have come back
+            if not frames.flags.c_contiguous:
+                frames[...] = flat.reshape(frames.shape)
+        if np.count_nonzero(nan) > np.count_nonzero(nan[:, self.map_pixels]):
+            repair_nans(frames)  # NaN pixels that are not mapped dead pixels
+        return frames
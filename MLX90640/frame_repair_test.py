@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from frame_repair import FrameRepair, neighbour_means, repair_nans
+from synthetic_scene import SyntheticScene
+
+
+def interpolate_values(df):
+    """The per pixel repair that main.py, rpi_to_mlx_i2c.py and rpi_to_mlx_serial.py used to copy"""
+    nan_value_indices = np.argwhere(np.isnan(df))
+    x_max = df.shape[0] - 1
+    y_max = df.shape[1] - 1
+    for x, y in nan_value_indices:
+        neighbours = [(x + dx, y + dy) for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                      if 0 <= x + dx <= x_max and 0 <= y + dy <= y_max]
+        df[x][y] = sum(df[i][j] for i, j in neighbours) / len(neighbours)
+    return df
+
+def has_nan_neighbour(nan):
+    padded = np.pad(nan, 1)
+    return padded[:-2, 1:-1] | padded[2:, 1:-1] | padded[1:-1, :-2] | padded[1:-1, 2:]
+
+def test_matches_interpolate_values(num_frames=200):
+    """Isolated NaN pixels, including corners and edges, get the mean of their neighbours like before"""
+    frames, _, _ = SyntheticScene(seed=1, dropout=0.01).generate(num_frames)
+    frames = frames.astype(float)
+    corners = frames.copy()
+    corners[:, [0, 0, -1, -1, 0, 5], [0, -1, 0, -1, 7, 0]] = np.nan
+    for stack in (frames, corners):
+        for frame in stack:
+            nan = np.isnan(frame)
+            if (nan & has_nan_neighbour(nan)).any():
+                continue  # adjacent NaN pixels were averaged with NaN before
+            expected = interpolate_values(frame.copy())
+            assert np.allclose(repair_nans(frame.copy()), expected)
+            assert np.allclose(FrameRepair().repair(frame.copy()), expected)
+        repaired = repair_nans(stack.copy())
+        assert not np.isnan(repaired).any()
+
+def test_nan_clusters():
+    """Blocks of NaN pixels and frames of a single valid pixel are filled, frames all NaN stay NaN"""
+    frames = np.full((3, 24, 32), 25.0)
+    frames[0, 5:12, 5:12] = np.nan
+    frames[1] = np.nan
+    frames[1, 3, 3] = 30.0
+    frames[2] = np.nan
+    repaired = repair_nans(frames)
+    assert np.allclose(repaired[0], 25.0)
+    assert np.allclose(repaired[1], 30.0)
+    assert np.isnan(repaired[2]).all()
+
+def test_dead_pixels(num_frames=100, dead_pixels=10):
+    """Pixels NaN in every frame are marked dead, repaired from the index map, and saved"""
+    scene = SyntheticScene(seed=2, dropout=0.002, dead_pixels=dead_pixels)
+    frames, _, _ = scene.generate(num_frames)
+    repair = FrameRepair(dead_after=8)
+    for frame in frames:
+        nan = np.isnan(frame)
+        means = neighbour_means(frame)
+        isolated = nan & ~has_nan_neighbour(nan)
+        repair.repair(frame)
+        assert not np.isnan(frame).any()
+        assert np.allclose(frame[isolated], means[isolated])
+    assert set(repair.dead_pixels) == set(scene.dead)
+
+    path = os.path.join(tempfile.mkdtemp(), "dead_pixels.npy")
+    repair.save(path)
+    assert set(FrameRepair.load(path).dead_pixels) == set(scene.dead)
+
+    # a batch, and a dead pixel coming back
+    frames, _, _ = scene.generate(num_frames)
+    frames[-1].flat[scene.dead[0]] = 26.0
+    repair.repair(frames)
+    assert not np.isnan(frames).any()
+    assert frames[-1].flat[scene.dead[0]] == 26.0
+    assert scene.dead[0] not in repair.dead_pixels
+
+def test_not_contiguous(num_frames=40):
+    """Dead pixels of a sliced stack or of a Fortran ordered frame are repaired in the frames themselves"""
+    scene = SyntheticScene(seed=4, dropout=0, dead_pixels=4)  # no other NaN, repair_nans does not run
+    frames, _, _ = scene.generate(num_frames)
+    expected = FrameRepair(dead_pixels=scene.dead).repair(frames[::2].copy())
+    sliced = frames[::2]
+    FrameRepair(dead_pixels=scene.dead).repair(sliced)
+    assert not np.isnan(sliced).any()
+    assert np.allclose(sliced, expected)
+    frame = np.asfortranarray(frames[1])
+    FrameRepair(dead_pixels=scene.dead).repair(frame)
+    assert np.allclose(frame, FrameRepair(dead_pixels=scene.dead).repair(frames[1].copy()))
+
+def test_repair_speed(num_frames=2000):
+    """Per frame cost with a few dead pixels, with and without a bad read, against interpolate_values"""
+    scene = SyntheticScene(seed=3, dropout=0, dead_pixels=5)
+    frames, _, _ = scene.generate(num_frames)
+    frames = frames.astype(float)
+    bad_reads = frames.copy()
+    bad_reads[::2, ::2, ::3] = np.nan  # every other frame, so these pixels are not marked dead
+    repair = FrameRepair(dead_pixels=scene.dead)
+    for name, stack in (("dead pixels", frames), ("bad read", bad_reads)):
+        copies = stack.copy()
+        start = time.perf_counter()
+        for frame in copies:
+            interpolate_values(frame)
+        before = (time.perf_counter() - start) / num_frames
+        copies = stack.copy()
+        start = time.perf_counter()
+        for frame in copies:
+            repair.repair(frame)
+        after = (time.perf_counter() - start) / num_frames
+        print("{}: {:.1f} us per frame, {:.1f} us with interpolate_values".format(name, after * 1e6, before * 1e6))
+        assert not np.isnan(copies).any()
+
+# test_matches_interpolate_values()
+# test_nan_clusters()
+# test_dead_pixels()
+# test_not_contiguous()
+# test_repair_speed()
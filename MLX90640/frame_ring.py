@@ -0,0 +1,188 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+"""
+Single-producer / single-consumer ring buffer of frames in shared memory.
+
+The data collection process writes frames and their capture times straight into slots of a
+SharedMemory block, and the analysis process reads them in place, so moving a frame between
+processes involves no pickling and no copying. No lock is needed: the head index is only ever
+written by the producer and the tail index only by the consumer, and a slot is published by
+advancing the head after the frame has been written.
+
+Layout of the block: header (int64 fields below), then timestamps (float64), capture latencies
+(float64), then frames.
+"""
+
+HEAD = 0  # number of frames written by the producer
+TAIL = 1  # number of frames released by the consumer
+STOP_REQUESTED = 2  # set by the consumer, the producer should return
+STOPPED = 3  # set by the producer once it will not write anymore
+DROPPED = 4  # frames the producer could not write because the ring was full
+RETRIES = 5  # failed reads of the sensor, retried by the producer
+INVALID = 6  # frames read without error but empty, e.g. all zeros, not published
+HEADER_FIELDS = 8
+
+
+class SharedFrameRing:
+    def __init__(self, capacity=256, shape=(24, 32), dtype=np.float32, name=None):
+        """
+        Args:
+            capacity (int, optional): number of frame slots. Defaults to 256, about 2 minutes at 2 Hz.
+            shape (tuple, optional): Defaults to (24, 32).
+            dtype (optional): Defaults to np.float32.
+            name (str, optional): attach to an existing ring instead of creating one. Defaults to None.
+        """
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._owner = name is None
+
+        header_size = HEADER_FIELDS * 8
+        times_size = capacity * 8
+        latencies_size = capacity * 8
+        frames_size = capacity * self.dtype.itemsize * int(np.prod(self.shape))
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_size + times_size + latencies_size + frames_size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        self._times = np.ndarray((capacity,), dtype=np.float64, buffer=self.shm.buf, offset=header_size)
+        self._latencies = np.ndarray((capacity,), dtype=np.float64, buffer=self.shm.buf, offset=header_size + times_size)
+        self._frames = np.ndarray((capacity,) + self.shape, dtype=self.dtype, buffer=self.shm.buf,
+                                  offset=header_size + times_size + latencies_size)
+        if self._owner:
+            self._header[:] = 0
+
+    def __getstate__(self):
+        # with the spawn start method, the child process attaches to the same block by name
+        return {"capacity": self.capacity, "shape": self.shape, "dtype": self.dtype.name, "name": self.name}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        """Number of frames waiting to be read"""
+        return int(self._header[HEAD] - self._header[TAIL])
+
+    @property
+    def dropped(self):
+        return int(self._header[DROPPED])
+
+    @property
+    def published(self):
+        """Number of frames written by the producer since reset()"""
+        return int(self._header[HEAD])
+
+    @property
+    def retries(self):
+        return int(self._header[RETRIES])
+
+    @property
+    def invalid(self):
+        return int(self._header[INVALID])
+
+    def reset(self):
+        """Empty the ring and clear the stop handshake, only when no producer is running"""
+        self._header[:] = 0
+
+    # Producer side
+
+    def next_slot(self):
+        """View of the slot the next frame should be written into, or None if the ring is full.
+        The frame is only visible to the consumer after publish()."""
+        head = self._header[HEAD]
+        if head - self._header[TAIL] >= self.capacity:
+            return None
+        return self._frames[head % self.capacity]
+
+    def publish(self, timestamp=None, latency=0.0):
+        """Publish the frame written into next_slot()
+
+        Args:
+            timestamp (float, optional): capture time. Defaults to None, now.
+            latency (float, optional): seconds it took to capture the frame. Defaults to 0.0.
+        """
+        head = self._header[HEAD]
+        self._times[head % self.capacity] = time.time() if timestamp is None else timestamp
+        self._latencies[head % self.capacity] = latency
+        self._header[HEAD] = head + 1
+
+    def put(self, frame, timestamp=None):
+        """Copy frame into the ring, returns False and counts a dropped frame if the ring is full"""
+        slot = self.next_slot()
+        if slot is None:
+            self.count_drop()
+            return False
+        slot[...] = frame
+        self.publish(timestamp)
+        return True
+
+    def count_drop(self):
+        self._header[DROPPED] += 1
+
+    def count_retry(self):
+        self._header[RETRIES] += 1
+
+    def count_invalid(self):
+        self._header[INVALID] += 1
+
+    def stop_requested(self):
+        return bool(self._header[STOP_REQUESTED])
+
+    def mark_stopped(self):
+        self._header[STOPPED] = 1
+
+    # Consumer side
+
+    def peek(self):
+        """(frame, timestamp) of the oldest unread frame, or None if the ring is empty.
+        The frame is a view into shared memory, valid until release()."""
+        tail = self._header[TAIL]
+        if self._header[HEAD] == tail:
+            return None
+        return self._frames[tail % self.capacity], self._times[tail % self.capacity]
+
+    def capture_latency(self):
+        """Capture latency published with the frame returned by peek(), valid until release()"""
+        return float(self._latencies[self._header[TAIL] % self.capacity])
+
+    def release(self):
+        """Give the slot returned by peek() back to the producer"""
+        self._header[TAIL] += 1
+
+    def consume(self, poll_interval=0.05):
+        """Yield (frame, timestamp) views until the producer has stopped and every frame has been read.
+        Each slot is released when the next frame is requested."""
+        while True:
+            item = self.peek()
+            if item is None:
+                # frames published before the producer stopped are visible once STOPPED is
+                if self._header[STOPPED] and self.peek() is None:
+                    return
+                time.sleep(poll_interval)
+                continue
+            yield item
+            self.release()
+
+    def request_stop(self):
+        self._header[STOP_REQUESTED] = 1
+
+    def wait_stopped(self, timeout=None, poll_interval=0.01):
+        """Wait for the producer to acknowledge request_stop(), returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._header[STOPPED]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def close(self):
+        del self._header, self._times, self._latencies, self._frames
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
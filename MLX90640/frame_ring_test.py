@@ -0,0 +1,35 @@
+import time
+from multiprocessing import Process
+
+import numpy as np
+
+from frame_ring import SharedFrameRing
+
+
+def produce_frames(ring, interval=0.001):
+    counter = 0
+    while not ring.stop_requested():
+        if ring.put(np.full((24, 32), counter), timestamp=counter):
+            counter += 1
+        time.sleep(interval)
+    ring.mark_stopped()
+
+def test_stop_handshake(seconds=0.5):
+    """Every frame published before the producer acknowledges the stop is read, in order"""
+    ring = SharedFrameRing(capacity=16)
+    producer = Process(target=produce_frames, args=(ring, ))
+    producer.start()
+    time.sleep(seconds)
+    ring.request_stop()
+    assert ring.wait_stopped(timeout=5)
+    producer.join()
+
+    received = [(frame[0][0], timestamp) for frame, timestamp in ring.consume()]
+    assert len(received) == 16  # nothing was read while collecting, so the ring is full
+    for i in range(1, len(received)):
+        assert received[i][0] == received[i - 1][0] + 1
+        assert received[i][0] == received[i][1]
+    print("Frames dropped while the ring was full: ", ring.dropped)
+    ring.close()
+
+# test_stop_handshake()
@@ -0,0 +1,212 @@
+import json
+import time
+from os import listdir, truncate
+from os.path import basename, exists, getmtime, getsize, isdir, join, splitext
+
+import numpy as np
+
+from file_utils import create_folder_if_absent, get_frame, npy_name_to_time
+
+"""
+Append-only frame store, replacing one .npy file per frame.
+
+A store is a folder containing
+- frames.bin: every frame back to back, as one contiguous (n_frames, height, width) array
+- times.bin: the capture time of every frame in seconds since the epoch, as one contiguous float64 array
+- meta.json: frame shape and dtype
+
+Frames are buffered in memory and appended to disk one chunk at a time, so the SD card sees
+one write per chunk instead of one file per frame. Reads go through np.memmap, and since times
+are only ever appended in order, times.bin is the time index: a time range is found with a
+binary search and returned as a slice of the memmap, without copying.
+"""
+
+FRAMES_FILE = "frames.bin"
+TIMES_FILE = "times.bin"
+META_FILE = "meta.json"
+TIME_FORMAT = "%Y.%m.%d_%H%M%S"
+
+
+class FrameStore:
+    def __init__(self, path, shape=(24, 32), dtype=np.float32, chunk_size=120):
+        """
+        Args:
+            path (str): folder of the store, created if absent. An existing store is opened for appending.
+            shape (tuple, optional): shape of a frame, ignored for an existing store. Defaults to (24, 32).
+            dtype (optional): ignored for an existing store. Defaults to np.float32.
+            chunk_size (int, optional): number of frames buffered before they are written. Defaults to 120,
+                one minute at 2 Hz.
+        """
+        self.path = path
+        create_folder_if_absent(path)
+        meta_path = join(path, META_FILE)
+        if exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            shape = tuple(meta["shape"])
+            dtype = meta["dtype"]
+        else:
+            with open(meta_path, "w") as meta_file:
+                json.dump({"shape": list(shape), "dtype": np.dtype(dtype).name}, meta_file)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_size = self.dtype.itemsize * int(np.prod(self.shape))
+
+        self._chunk = np.empty((chunk_size,) + self.shape, dtype=self.dtype)
+        self._chunk_times = np.empty(chunk_size)
+        self._pending = 0
+        self._frames = None
+        self._times = None
+        self._truncate()
+        self.last_time = self.times[-1] if len(self.times) else -np.inf
+
+    def append(self, frame, timestamp=None):
+        """Append one frame, timestamp defaults to now. Timestamps must not go back in time."""
+        timestamp = time.time() if timestamp is None else timestamp
+        if timestamp < self.last_time:
+            raise ValueError("Frames must be appended in time order, got {} after {}".format(timestamp, self.last_time))
+        self._chunk[self._pending] = frame
+        self._chunk_times[self._pending] = timestamp
+        self._pending += 1
+        self.last_time = timestamp
+        if self._pending == len(self._chunk):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered chunk to disk"""
+        if self._pending == 0:
+            return
+        with open(join(self.path, FRAMES_FILE), "ab") as frames_file:
+            frames_file.write(self._chunk[:self._pending].tobytes())
+        with open(join(self.path, TIMES_FILE), "ab") as times_file:
+            times_file.write(self._chunk_times[:self._pending].tobytes())
+        self._pending = 0
+        self._frames = None
+        self._times = None
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _num_stored(self):
+        frames_path = join(self.path, FRAMES_FILE)
+        times_path = join(self.path, TIMES_FILE)
+        if not (exists(frames_path) and exists(times_path)):
+            return 0
+        # a chunk cut short by a power loss is ignored
+        return min(getsize(frames_path) // self.frame_size, getsize(times_path) // 8)
+
+    def _truncate(self):
+        """Cut both files back to their complete records, so that frames appended after a chunk
+        cut short by a power loss still line up with their timestamps"""
+        n = self._num_stored()
+        for name, record_size in ((FRAMES_FILE, self.frame_size), (TIMES_FILE, 8)):
+            file_path = join(self.path, name)
+            if exists(file_path) and getsize(file_path) > n * record_size:
+                truncate(file_path, n * record_size)
+
+    @property
+    def frames(self):
+        """Read-only memmap of shape (n_frames, height, width) of all frames written to disk"""
+        if self._frames is None:
+            n = self._num_stored()
+            if n == 0:
+                return np.empty((0,) + self.shape, dtype=self.dtype)
+            self._frames = np.memmap(join(self.path, FRAMES_FILE), dtype=self.dtype, mode="r", shape=(n,) + self.shape)
+        return self._frames
+
+    @property
+    def times(self):
+        """Read-only memmap of the capture time of all frames written to disk"""
+        if self._times is None:
+            n = self._num_stored()
+            if n == 0:
+                return np.empty(0)
+            self._times = np.memmap(join(self.path, TIMES_FILE), dtype=np.float64, mode="r", shape=(n,))
+        return self._times
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def time_range(self, start_time=None, end_time=None):
+        """Frames captured within [start_time, end_time), without copying.
+
+        Args:
+            start_time (float or str, optional): seconds since the epoch or "%Y.%m.%d_%H%M%S". Defaults to the first frame.
+            end_time (float or str, optional): same format. Defaults to after the last frame.
+
+        Returns:
+            (np.memmap, np.memmap): frames and their timestamps
+        """
+        times = self.times
+        start = 0 if start_time is None else np.searchsorted(times, to_timestamp(start_time), side="left")
+        end = len(times) if end_time is None else np.searchsorted(times, to_timestamp(end_time), side="left")
+        return self.frames[start:end], times[start:end]
+
+def to_timestamp(t):
+    if type(t) == str:
+        return time.mktime(time.strptime(t, TIME_FORMAT))
+    return t
+
+def get_all_npy_files(data_path):
+    """All .npy files in data_path and its subfolders (e.g. from directory_sort="day"), in time order"""
+    files = []
+    for f in sorted(listdir(data_path)):
+        if isdir(join(data_path, f)):
+            files.extend(get_all_npy_files(join(data_path, f)))
+        elif f.endswith(".npy"):
+            files.append(join(data_path, f))
+    return files
+
+def npy_file_times(files):
+    """Capture times of .npy files named by save_npy. Frames of the same second, named with a
+    _1, _2... suffix by save_npy_folder, are spread evenly over that second. Files with other
+    names get their modification time.
+
+    Returns:
+        [float]: seconds since the epoch
+    """
+    seconds, repeats = [], []
+    for f in files:
+        name = splitext(basename(f))[0]
+        stem, _, repeat = name.rpartition("_")
+        if "_" in stem and repeat.isdigit():
+            name, repeat = stem, int(repeat)
+        else:
+            repeat = 0
+        try:
+            seconds.append(time.mktime(npy_name_to_time(name + ".npy")))
+            repeats.append(repeat)
+        except ValueError:
+            seconds.append(getmtime(f))
+            repeats.append(0)
+    frames_per_second = {}
+    for t, repeat in zip(seconds, repeats):
+        frames_per_second[t] = max(frames_per_second.get(t, 0), repeat + 1)
+    return [t + repeat / frames_per_second[t] for t, repeat in zip(seconds, repeats)]
+
+def convert_npy_folder(data_path, store_path, chunk_size=1024):
+    """Convert a folder of per-frame .npy files, as written by save_npy, to a FrameStore.
+    Capture times are read from the file names, see npy_file_times.
+
+    Returns:
+        FrameStore: the converted store
+    """
+    files = get_all_npy_files(data_path)
+    timestamps = npy_file_times(files)
+    order = np.argsort(timestamps, kind="stable")
+
+    first_frame = get_frame(files[order[0]])
+    store = FrameStore(store_path, shape=first_frame.shape, chunk_size=chunk_size)
+    for i in order:
+        store.append(get_frame(files[i]), timestamps[i])
+    store.close()
+    return store
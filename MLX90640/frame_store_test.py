@@ -0,0 +1,68 @@
+import tempfile
+import time
+from os.path import join
+
+import numpy as np
+
+from file_utils import get_all_files, get_frame
+from frame_store import FrameStore, convert_npy_folder
+from timer import Timer
+
+data_path = "data/teck_calib_2"
+
+def test_append_and_time_range(num_frames=500, chunk_size=120):
+    store_path = join(tempfile.mkdtemp(), "store")
+    frames = np.random.rand(num_frames, 24, 32).astype(np.float32)
+    start_time = time.time()
+    with FrameStore(store_path, chunk_size=chunk_size) as store:
+        for i in range(num_frames):
+            store.append(frames[i], start_time + i / 2)
+
+    store = FrameStore(store_path)
+    assert len(store) == num_frames
+    assert np.array_equal(store[10], frames[10])
+
+    # 2 Hz, so 10 seconds is 20 frames
+    range_frames, range_times = store.time_range(start_time + 10, start_time + 20)
+    assert isinstance(range_frames, np.memmap)
+    assert np.array_equal(range_frames, frames[20:40])
+
+def test_torn_write(num_frames=6, chunk_size=2):
+    """A chunk cut short by a power loss is dropped on reopening, and frames appended after it
+    line up with their timestamps"""
+    store_path = join(tempfile.mkdtemp(), "store")
+    frames = np.arange(num_frames * 24 * 32, dtype=np.float32).reshape(num_frames, 24, 32)
+    with FrameStore(store_path, chunk_size=chunk_size) as store:
+        for i in range(4):
+            store.append(frames[i], float(i))
+    # half of frame 4 and all of its timestamp made it to disk
+    with open(join(store_path, "frames.bin"), "ab") as frames_file:
+        frames_file.write(frames[4].tobytes()[:1000])
+    with open(join(store_path, "times.bin"), "ab") as times_file:
+        times_file.write(np.float64(4.0).tobytes())
+
+    with FrameStore(store_path, chunk_size=chunk_size) as store:
+        assert len(store) == 4
+        for i in range(4, num_frames):
+            store.append(frames[i], float(i))
+    store = FrameStore(store_path)
+    assert np.array_equal(store.frames, frames)
+    assert np.array_equal(store.times, np.arange(num_frames))
+
+def test_convert_npy_folder(data_path):
+    t = Timer()
+    t.start()
+    store = convert_npy_folder(data_path, join(tempfile.mkdtemp(), "store"))
+    t.stop("Time taken to convert {} frames: ".format(len(store)))
+
+    files = get_all_files(data_path)
+    t.start()
+    frames = [get_frame(f) for f in files]
+    t.stop("Time taken to read every .npy file: ")
+    t.start()
+    frames = np.array(store.frames)
+    t.stop("Time taken to read the store: ")
+
+# test_append_and_time_range()
+# test_torn_write()
+# test_convert_npy_folder(data_path)
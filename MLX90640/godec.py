@@ -1,5 +1,6 @@
 import imageio
 import matplotlib.pyplot as plt
+import numpy as np
 from numpy import amax, amin, prod, sqrt, zeros
 from numpy.random import randn
 from pygifsicle import optimize
@@ -8,6 +9,7 @@ from sklearn.metrics import mean_squared_error
 from tqdm import tqdm
 
 from file_utils import create_folder_if_absent, folder_path, get_all_files
+from timer import metrics
 from visualizer import write_gif_from_pics
 
 
@@ -85,10 +87,204 @@ def godec(M, rank=1, card=None, iterated_power=1, max_iter=100, tol=0.001):
         else:
             iter = iter + 1
 
+    metrics.observe("godec_iterations", iter)
     return L, S, LS, RMSE
 
 
 
+class WarmStartGoDec:
+    """
+    GoDec engine for decomposing consecutive windows of frames, e.g. every 30 minutes.
+    Gives the same decomposition as godec(), but
+    - picks the `card` largest entries of T with an O(n) partial selection instead of a full argsort,
+    - reuses preallocated L/S/LS buffers as long as the window shape does not change,
+    - warm-starts the power iteration from the background subspace of the previous window
+      (and of the previous iteration) instead of drawing a new random Y2 every time,
+    - stops when the relative change of L falls below tol, instead of on absolute RMSE.
+
+    Parameters are the same as godec(), tol being the relative change of the low-rank part
+    between two iterations.
+    """
+    def __init__(self, rank=1, card=None, iterated_power=1, max_iter=100, tol=0.001):
+        self.rank = rank
+        self.card = card
+        self.iterated_power = iterated_power
+        self.max_iter = max_iter
+        self.tol = tol
+
+        self.U = None  # background subspace of the previous window, shape (n_features, rank)
+        self._buffers = None
+
+    def __call__(self, M):
+        return self.decompose(M)
+
+    def _get_buffers(self, shape, dtype):
+        if self._buffers is None or self._buffers[0].shape != shape or self._buffers[0].dtype != dtype:
+            self._buffers = [np.empty(shape, dtype=dtype) for i in range(5)]
+        return self._buffers
+
+    def decompose(self, M):
+        """
+        Returns
+        -------
+        L : array-like, low-rank matrix.
+        S : array-like, sparse matrix.
+        LS : array-like, reconstruction matrix.
+        changes : relative change of L at every iteration.
+        -------
+        Returned matrices are buffers owned by this object, they are overwritten by the next call.
+        """
+        dtype = M.dtype if np.issubdtype(M.dtype, np.floating) else np.float64
+        L, L_new, S, LS, T = self._get_buffers(M.shape, dtype)
+        m, n = M.shape
+        card = m * n if self.card is None else self.card
+        L[:] = M
+        S.fill(0)
+        changes = []
+
+        if self.U is not None and self.U.shape[0] == m:
+            Q = L.T.dot(self.U.astype(dtype, copy=False))
+        else:
+            Q = randn(n, self.rank).astype(dtype)
+
+        for iter in range(1, self.max_iter + 1):
+            # Update of L, the power iteration starts from the previous subspace
+            # re-orthonormalized at every step so float32 windows do not overflow
+            for i in range(self.iterated_power):
+                Y1 = L.dot(Q)
+                Q, R = qr(L.T.dot(Y1), mode='economic')
+                Q = Q.astype(dtype, copy=False)
+            LQ = L.dot(Q)
+            np.dot(LQ, Q.T, out=L_new)
+
+            # Update of S
+            np.subtract(L, L_new, out=T)
+            change = np.linalg.norm(T) / max(np.linalg.norm(L), np.finfo(dtype).tiny)
+            T += S
+            L, L_new = L_new, L
+            if card >= T.size:
+                S[:] = T
+            else:
+                T_vec = T.reshape(-1)
+                idx = np.argpartition(abs(T_vec), -card)[-card:]
+                S.reshape(-1)[idx] = T_vec[idx]
+
+            # Stopping criteria
+            changes.append(change)
+            if change <= self.tol:
+                break
+
+        self._buffers[0], self._buffers[1] = L, L_new
+        self.U, R = qr(LQ, mode='economic')
+        np.add(L, S, out=LS)
+        metrics.observe("godec_iterations", len(changes))
+        return L, S, LS, changes
+
+
+class OnlineGoDec:
+    """
+    Streaming counterpart of godec() that decomposes one frame (or a small mini-batch of frames) at a time.
+    The background subspace is tracked with an incremental SVD with a forgetting factor, so memory stays
+    at O(n_features * rank) however long the session runs.
+
+    Parameters
+    ----------
+    n_features : int, number of pixels in a frame (rows of M in godec()).
+
+    rank : int >= 1, optional
+        The rank of the background subspace. The default is 1.
+
+    card : int >= 0, optional
+        The cardinality of the sparse part of each frame. The default is None (all pixels of the frame),
+        in which case S is the residual of the low-rank fit, as in godec().
+
+    forgetting_factor : float in (0, 1], optional
+        Weight applied to the previous subspace on every update, smaller values adapt faster to
+        changes in the background. The default is 0.98.
+
+    inner_iter : int >= 1, optional
+        Number of alternating L/S updates per frame. The default is 2.
+    ----------
+    """
+    def __init__(self, n_features, rank=1, card=None, forgetting_factor=0.98, inner_iter=2):
+        self.n_features = n_features
+        self.rank = rank
+        self.card = n_features if card is None else card
+        self.forgetting_factor = forgetting_factor
+        self.inner_iter = inner_iter
+
+        self.U = np.zeros((n_features, 0))  # orthonormal basis of the background
+        self.sigma = np.zeros(0)  # singular values of the background
+        self.n_samples_seen = 0
+
+    def partial_fit(self, X):
+        """
+        Decompose the next frame(s) and update the background subspace.
+
+        X : array-like, shape (n_features,) for one frame or (n_features, n_batch) for a mini-batch,
+            with frames stacked as column vectors like the input of godec().
+
+        Returns
+        -------
+        L : array-like, low-rank part, same shape as X.
+        S : array-like, sparse part, same shape as X.
+        -------
+        """
+        X = np.asarray(X, dtype=float)
+        columns = X.reshape(self.n_features, -1)
+        L = np.empty(columns.shape)
+        S = np.empty(columns.shape)
+        for j in range(columns.shape[1]):
+            L[:, j], S[:, j] = self._decompose(columns[:, j])
+        return L.reshape(X.shape), S.reshape(X.shape)
+
+    def _decompose(self, x):
+        if self.n_samples_seen == 0:
+            self._update_subspace(x)
+
+        s = zeros(self.n_features)
+        for i in range(self.inner_iter):
+            l = self.U.dot(self.U.T.dot(x - s))
+            t = x - l
+            if self.card >= self.n_features:
+                s = t
+            else:
+                s = zeros(self.n_features)
+                idx = np.argpartition(abs(t), -self.card)[-self.card:]
+                s[idx] = t[idx]
+
+        # Pixels picked as foreground are kept out of the background update, unless every pixel is
+        # in the sparse part, in which case the whole frame is used like godec() does
+        if self.n_samples_seen > 0:
+            self._update_subspace(x if self.card >= self.n_features else x - s)
+        self.n_samples_seen += 1
+        return l, s
+
+    def _update_subspace(self, x):
+        k = self.U.shape[1]
+        projection = self.U.T.dot(x)
+        residual = x - self.U.dot(projection)
+        residual_norm = np.linalg.norm(residual)
+
+        # Incremental SVD of [forgetting_factor * U diag(sigma), x]
+        K = zeros((k + 1, k + 1))
+        K[:k, :k] = np.diag(self.forgetting_factor * self.sigma)
+        K[:k, k] = projection
+        K[k, k] = residual_norm
+        if residual_norm > 1e-10:
+            basis = np.column_stack((self.U, residual / residual_norm))
+        elif k > 0:
+            basis = self.U
+            K = K[:k]
+        else:
+            return  # an empty frame carries no information about the background
+
+        U_K, sigma_K, _ = np.linalg.svd(K)
+        rank = min(self.rank, basis.shape[1])
+        self.U = basis.dot(U_K[:, :rank])
+        self.sigma = sigma_K[:rank]
+
+
 """
 Godec Plots
 """
@@ -0,0 +1,51 @@
+import numpy as np
+
+from godec import OnlineGoDec, WarmStartGoDec, godec
+from timer import Timer
+
+
+def get_test_window(num_frames, seed=0, width=32, height=24):
+    """Rank-1 drifting background with a warm block moving through part of the window,
+    stacked as column vectors like create_godec_input"""
+    rng = np.random.RandomState(seed)
+    background = np.linspace(20, 25, width * height)
+    drift = 1 + 0.01 * np.sin(np.arange(num_frames) / 50 + seed)
+    M = np.outer(background, drift) + rng.normal(0, 0.1, (width * height, num_frames))
+    M[100:110, num_frames // 3:num_frames // 2] += 10
+    return M.astype(np.float32)
+
+def test_warm_start_godec_against_godec(num_windows=3, num_frames=1800, card=None):
+    """Benchmark WarmStartGoDec against godec over consecutive windows
+    ---
+    Both should give the same low-rank part, the warm-started engine converging in a handful of iterations.
+    """
+    t_godec = Timer("godec")
+    t_warm = Timer("warm_start_godec")
+    decomposer = WarmStartGoDec(iterated_power=5, card=card)
+    for i in range(num_windows):
+        M = get_test_window(num_frames, seed=i)
+
+        t_godec.start()
+        L, S, LS, RMSE = godec(M, iterated_power=5, card=card)
+        t_godec.stop("godec, window {}, {} iterations: ".format(i, len(RMSE)))
+
+        t_warm.start()
+        L_warm, S_warm, LS_warm, changes = decomposer(M)
+        t_warm.stop("WarmStartGoDec, window {}, {} iterations: ".format(i, len(changes)))
+
+        assert np.allclose(L, L_warm, atol=1e-2)
+
+    print("godec: ", Timer.timers["godec"], " seconds")
+    print("WarmStartGoDec: ", Timer.timers["warm_start_godec"], " seconds")
+
+def test_online_godec(num_frames=300):
+    M = get_test_window(num_frames)
+    decomposer = OnlineGoDec(M.shape[0], card=50)
+    L, S = decomposer.partial_fit(M)
+    assert L.shape == M.shape and S.shape == M.shape
+    # the warm block is foreground as soon as it appears
+    assert S[100:110, num_frames // 3].mean() > 5
+
+# test_warm_start_godec_against_godec()
+# test_warm_start_godec_against_godec(card=768*50)
+# test_online_godec()
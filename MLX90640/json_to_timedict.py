@@ -1,8 +1,10 @@
 import json
 import time
-import scipy
+
 import numpy as np
 
+from resample import fft_resample
+
 
 def name_to_time(filename, directory_sort=None):
     if directory_sort == "day":
@@ -35,9 +37,9 @@ def json_to_timedict(json_path, interpolate=False, shift_30min=False):
         data = dict(sorted(data.items()))   # sorts the timestamp dicts by timestamp
         newdict = {}
         for i in data:
-            if len(data[i]) < 1800:
+            if 0 < len(data[i]) < 1800:
                 if interpolate:  # if you wanna use this to interpolate values:
-                    data[i] = scipy.signal.resample(data[i], 1800)
+                    data[i] = fft_resample(data[i], 1800)
             split = i.split('_')
             split_time = split[1]
             split_time = split_time[:-2]
@@ -43,17 +43,51 @@ class PixelKalmanFilter:
         return self._x[0][0]        
 
 class FrameKalmanFilter:
-    def __init__(self):
-        self.filters = [[PixelKalmanFilter() for i in range(32)] for j in range(24)]
+    """Bank of per-pixel Kalman filters stored as stacked arrays.
+
+    Equivalent to running one PixelKalmanFilter per pixel, but the state (H x W x 2)
+    and estimation covariance (H x W x 2 x 2) of every pixel are updated together
+    with a handful of broadcast operations per frame.
+    """
+    def __init__(self, shape=(24, 32)):
+        self.shape = tuple(shape)
+
+        # State matrices, same model as PixelKalmanFilter
+        self.F = np.array([[1., 1.], [0., 1.]])
+        self.Q = np.array([[0.1, 0.], [0., 0.1]])  # process noise covariance
+        self.R = 1.5  # measurement noise covariance
+
+        # System state and estimation covariance of every pixel
+        self.x = np.zeros(self.shape + (2,))
+        self.P = np.tile(np.eye(2), self.shape + (1, 1))
+        self.K = np.zeros(self.shape + (2,))  # Kalman gain
+
+    def filter(self, frame_in):
+        """Run one predict/update step for all pixels and return the filtered frame."""
+        # estimate: x_est = F x, P_est = F P F^T + Q
+        x_est = np.einsum('ij,...j->...i', self.F, self.x)
+        P_est = np.einsum('ij,...jk,lk->...il', self.F, self.P, self.F) + self.Q
+
+        # compute kalman gain, H = [1, 0] so H P_est H^T is P_est[0, 0]
+        self.K = P_est[..., :, 0] / (P_est[..., 0, 0] + self.R)[..., np.newaxis]
+
+        # update
+        residual = np.asarray(frame_in) - x_est[..., 0]
+        self.x = x_est + self.K * residual[..., np.newaxis]
+        self.P = P_est - self.K[..., :, np.newaxis] * P_est[..., np.newaxis, 0, :]
+
+        return self.x[..., 0].copy()
 
-    def process_frame(self, frame_in):  # improve with multithreading
-        frame_out = np.zeros((24, 32))  # temp state after filter
-        for col in range(32):
-            for row in range(24):
-                pixel_filter = self.filters[row][col]
-                frame_out[row][col] = pixel_filter.filter(frame_in[row][col])
+    def process_frame(self, frame_in):
+        return self.filter(frame_in)
 
-        return frame_out
+    def process_frames(self, frames_in):
+        """Filter a batch of N frames of shape (N, H, W) in order, returns (N, H, W)."""
+        frames_in = np.asarray(frames_in)
+        frames_out = np.empty(frames_in.shape)
+        for i in range(frames_in.shape[0]):
+            frames_out[i] = self.filter(frames_in[i])
+        return frames_out
     
 def init_noise_reduction_plot(frame, subplt_titles):
     num_rows = 1
@@ -11,12 +11,13 @@ from file_utils import (basename, create_folder_if_absent, get_all_files,
 from kalman_filter import (FrameKalmanFilter, PixelKalmanFilter,
                            init_noise_reduction_plot,
                            update_noise_reduction_plot)
+from synthetic_scene import recording_or_synthetic
 from visualizer import init_comparison_plot, update_comparison_plot, write_gif
 
 kalman_pics_path = "kalman_filter_pics/"
 kalman_gifs_path = "kalman_filter_gifs/"
 data_path = "data/teck_calib_2"
-data = get_all_files(data_path)
+data = recording_or_synthetic(data_path)
 
 def test_pixel_filter():
     noise_remover = PixelKalmanFilter()
@@ -100,5 +101,18 @@ def test_frame_filter_by_specific_pixel():
     plt.plot(np.arange(0,255,1), pixel_over_time,  "r--", np.arange(0,255,1), filtered_over_time, "bs")
     plt.show()
 
+def test_frame_filter_matches_pixel_filter(num_frames=20):
+    frames = [get_frame(data[i]) for i in range(min(num_frames, len(data)))]
+    pixel_filters = [[PixelKalmanFilter() for i in range(32)] for j in range(24)]
+    noise_remover = FrameKalmanFilter()
+    processed = noise_remover.process_frames(frames)
+    for i in range(len(frames)):
+        expected = np.zeros((24, 32))
+        for row in range(24):
+            for col in range(32):
+                expected[row][col] = np.asarray(pixel_filters[row][col].filter(frames[i][row][col])).item()  # a 1x1 np.matrix
+        assert np.allclose(expected, processed[i])
+
 # test_frame_filter(savegif=True)
 # test_frame_filter_for_movement_detection(with_godec=True, savegif=True)
+# test_frame_filter_matches_pixel_filter()
@@ -3,6 +3,7 @@ import math
 import sys
 import time
 import pdb
+import threading
 from multiprocessing import Process, Queue
 
 import numpy as np
@@ -12,11 +13,15 @@ import adafruit_mlx90640
 import board
 import busio
 import main
+from capture import FrameCapture
 from file_utils import create_folder_if_absent, save_npy
+from frame_repair import FrameRepair
+from frame_ring import SharedFrameRing
 from visualizer import init_heatmap, update_heatmap
-from centroid_history import displacement_history
-from socket import *
-from struct import pack
+from centroid_history import DisplacementAnalyzer
+from payload_codec import encode_payload
+from timer import metrics
+from uplink import UplinkClient
 import json
 
 
@@ -28,6 +33,10 @@ config_dir = os.path.join(curr_dir, "config.json")
 with open(config_dir, "r") as readfile:
     global config
     config = json.loads(readfile.read())
+# the broker and the NUC can be overridden, e.g. to run against NUC/mqtt_broker.py and a local server
+config["mqtt_broker_ip"] = os.environ.get("MQTT_BROKER", config["mqtt_broker_ip"])
+config["mqtt_broker_port"] = int(os.environ.get("MQTT_PORT", config["mqtt_broker_port"]))
+config["mlx_nuc_ip_to_send_json"] = os.environ.get("NUC_ADDR", config["mlx_nuc_ip_to_send_json"])
 
 BAUD_RATE = 115200
 ARRAY_SHAPE = (24, 32)
@@ -35,104 +44,65 @@ TCP_addr = config["mlx_nuc_ip_to_send_json"]
 broker = config["mqtt_broker_ip"]
 port = config["mqtt_broker_port"]
 RPI_ROOM_TYPE = config["room_type"]
+# metrics snapshots for the NUC, on health/<house id>/<room>
+HEALTH_TOPIC = "/".join(["health"] + config["mlx_topic_to_publish"].split("/")[1:])
+HEALTH_INTERVAL_SECONDS = 60
 
 data_collection_process = None  # placeholder to contain process that colelcts data
+frame_consumer_thread = None  # reads frames out of the ring while they are collected
+STOP_TIMEOUT_SECONDS = 5
+DEAD_PIXELS_PATH = os.path.join(curr_dir, "dead_pixels.npy")  # kept between room visits and restarts
 
 i2c = busio.I2C(board.SCL, board.SDA, frequency=400000) # setup I2C
 mlx = adafruit_mlx90640.MLX90640(i2c) # begin MLX90640 with I2C comm
 mlx.refresh_rate = adafruit_mlx90640.RefreshRate.REFRESH_2_HZ # set refresh 
-data = Queue()
+ring = SharedFrameRing(capacity=256, shape=ARRAY_SHAPE)  # frames from the data collection process
+analyzer = None  # displacement analysis of the current room visit, updated as frames arrive
 data_times = Queue()
-
-
-class ClientProtocol:
-
-    def __init__(self):
-        self.socket = None
-
-    def connect(self, server_ip, server_port):
-        self.socket = socket(AF_INET, SOCK_STREAM)
-        self.socket.connect((server_ip, server_port))
-        print("Connected to TCP Server")
-
-    def close(self):
-        self.socket.shutdown(SHUT_WR)
-        self.socket.close()
-        self.socket = None
-
-    def send_data(self, data):
-        # use struct to make sure we have a consistent endianness on the length
-        length = pack('>Q', len(data))
-
-        # sendall to make sure it blocks if there's back-pressure on the socket
-        self.socket.sendall(length)
-        self.socket.sendall(data)
-        ack = self.socket.recv(1)
-
-cp = ClientProtocol()
-
-def interpolate_values(df):
-    """
-    :param: 24x32 data frame obtained from get_nan_value_indices(df)
-    :return: 24x32 array
-    """
-    nan_value_indices = np.argwhere(np.isnan(df))
-    x_max = df.shape[0] - 1
-    y_max = df.shape[1] - 1
-    for indx in nan_value_indices:
-        x = indx[0]
-        y = indx[1]
-        if x == 0 and y == 0:
-            df[x][y] = (df[x + 1][y] + df[x][y + 1]) / 2
-
-        elif (x == x_max and y == y_max):
-            df[x][y] = (df[x - 1][y] + df[x][y - 1]) / 2
-
-        elif (x == 0 and y == y_max):
-            df[x][y] = (df[x + 1][y] + df[x][y - 1]) / 2
-
-        elif (x == x_max and y == 0):
-            df[x][y] = (df[x - 1][y] + df[x][y + 1]) / 2
-
-        elif (x == 0):
-            df[x][y] = (df[x + 1][y] + df[x][y - 1] + df[x][y + 1]) / 3
-
-        elif (x == x_max):
-            df[x][y] = (df[x - 1][y] + df[x][y - 1] + df[x][y + 1]) / 3
-
-        elif (y == 0):
-            df[x][y] = (df[x + 1][y] + df[x - 1][y] + df[x][y + 1]) / 3
-
-        elif (y == y_max):
-            df[x][y] = (df[x - 1][y] + df[x + 1][y] + df[x][y - 1]) / 3
-        else:
-            df[x][y] = (df[x][y + 1] + df[x + 1][y] + df[x - 1][y] + df[x][y - 1]) / 4
-    return df
-
-def collect_data(data):
-    frame = [0] * 768
-    counter = 0
-    while True:
-        try:
-            mlx.getFrame(frame)  #  get the mlx values and put them into the array we just created
-            array = np.array(frame) 
-            if np.sum(array) > 0:
-                df = np.reshape(array.astype(float), ARRAY_SHAPE)
-                df = interpolate_values(df)
-                data.put(df)
-                print("Frame collected [{}]".format(counter))
-                counter += 1
-        except ValueError:
-            # these happen, no biggie - retry
-            print("ValueError during data collection")
-            pass
-        except InterruptedError:
-            pass
-            # print("Stopping data collection..., num frames collected: {}".format(len(data)))
+uplink = UplinkClient(TCP_addr, config["mlx_nuc_port_to_send_json"], spool_dir=os.path.join(curr_dir, "uplink_spool"))
+uplink.start()  # payloads spooled while the NUC was unreachable are sent first
+
+
+def collect_data(ring):
+    # the sensor is read straight into the slots of the ring
+    repair = FrameRepair.load(DEAD_PIXELS_PATH, ARRAY_SHAPE)
+    capture = FrameCapture(mlx.getFrame, ARRAY_SHAPE, repair)
+    capture.run(ring)
+    print(capture.summary())
+    repair.save(DEAD_PIXELS_PATH)
+    ring.mark_stopped()
+
+def consume_frames(ring, analyzer):
+    for frame, timestamp in ring.consume():
+        metrics.gauge("ring_depth", len(ring))
+        metrics.observe("capture_latency", ring.capture_latency())
+        with metrics.timer("add_frame"):
+            analyzer.add_frame(frame, timestamp)
+        metrics.observe("frame_latency", time.time() - timestamp)  # from capture to analyzed
+
+def stop_data_collection():
+    """Ask the data collection process to stop after its current frame, then wait for every
+    frame it has published to be read"""
+    global data_collection_process, frame_consumer_thread
+    ring.request_stop()
+    if not ring.wait_stopped(timeout=STOP_TIMEOUT_SECONDS):
+        print("Data collection did not stop in time, terminating it")
+        data_collection_process.terminate()
+        ring.mark_stopped()
+    data_collection_process.join()
+    frame_consumer_thread.join()
+    data_collection_process = None
+    frame_consumer_thread = None
+    metrics.count("frames_captured", ring.published)
+    metrics.count("frames_dropped", ring.dropped)
+    metrics.count("collect_retries", ring.retries)
+    metrics.count("frames_invalid", ring.invalid)
+    if ring.dropped:
+        print("{} frames were dropped".format(ring.dropped))
     
 def on_message(client,userdata, msg):
     try:
-        global data_collection_process
+        global data_collection_process, frame_consumer_thread, analyzer
         m_decode=str(msg.payload.decode("utf-8","ignore"))
        
         """ 
@@ -152,47 +122,42 @@ def on_message(client,userdata, msg):
         # check decoded message content and change current MLX shown
         if m_decode == RPI_ROOM_TYPE and not data_collection_process:
             print("start mlx collection")
-            # spawns parallel process to write sensor data to .npy files
+            # spawns parallel process that writes sensor data into the shared ring buffer
             start_time = time.strftime("%Y.%m.%d_%H%M%S",time.localtime(time.time()))
             data_times.put(start_time)
-            data_collection_process = Process(target=main.collect_data, args=(data, ))
+            ring.reset()
+            analyzer = DisplacementAnalyzer(start_time)
+            data_collection_process = Process(target=main.collect_data, args=(ring, ))
             data_collection_process.start()
+            frame_consumer_thread = threading.Thread(target=consume_frames, args=(ring, analyzer))
+            frame_consumer_thread.start()
         elif data_collection_process:
             print("end mlx collection")
-            data_collection_process.terminate()
-            data_collection_process = None
+            stop_data_collection()
             end_time = time.strftime("%Y.%m.%d_%H%M%S",time.localtime(time.time()))
-            collected_data = []
-            while not data.empty():
-                try:
-                    collected_data.append(data.get())
-                except Exception as e:
-                    print(e)
-                    break
             # print("Sending data array of length: {}".format(len(data)))
             start_time = data_times.get()
             print("Data collection started at {}, and ended at {}".format(start_time,end_time))
             # pdb.set_trace()
-            print("len(collected_data): {0}".format(len(collected_data)))
-            if len(collected_data) != 0:
-                analysis_result = displacement_history(collected_data, start_time, end_time)
+            print("Number of frames analyzed: {0}".format(analyzer.num_frames))
+            if analyzer.num_frames != 0:
+                analysis_result = analyzer.finish(end_time)
                 analysis_result["room_type"] = RPI_ROOM_TYPE
                 print("analysis_result: {0}".format(analysis_result))
-                to_send = json.dumps(analysis_result)
-                byte_data = to_send.encode("utf-8")
-                cp.connect(TCP_addr, config["mlx_nuc_port_to_send_json"])
+                with metrics.timer("encode_payload"):
+                    byte_data = encode_payload(analysis_result)
                 print("len(byte_data): {0}".format(len(byte_data)))
-                cp.send_data(byte_data)
-                cp.close()
+                metrics.observe("payload_bytes", len(byte_data))
+                uplink.send(byte_data)
+                metrics.count("payloads_sent")
+                metrics.gauge("uplink_pending", uplink.pending())
                 
                 start_time = None
                 end_time = None
-       
-                collected_data.clear() 
-                print("Resetted data array, now length: {}".format(len(collected_data)))
+            analyzer = None
     except InterruptedError:
         if data_collection_process:
-            data_collection_process.terminate()
+            stop_data_collection()
             exit(0)
     except Exception as e:
         print(e)
@@ -219,6 +184,7 @@ client.on_connect = on_connect
 client.on_disconnect = on_disconnect
 client.on_message = on_message  # makes it so that the callback on receiving a message calls on_message() above
 client.publish(config["mlx_topic_to_publish"], "Rpi operational!")
+metrics.publish_every(client, HEALTH_TOPIC, HEALTH_INTERVAL_SECONDS)
 
 try:
     client.loop_forever()
@@ -9,6 +9,7 @@ import numpy as np
 
 from file_utils import (get_all_files, get_frame, get_frame_GREY,
                         get_frame_RGB, normalize_frame)
+from frame_store import TIME_FORMAT, FrameStore
 from visualizer import init_heatmap, update_heatmap
 
 
@@ -32,53 +33,94 @@ Naive Algorithm or determining which area the person is at inside a single room
   including device tolerance of +- 1.5 degree celsius, then we consider that a human is there
 """
 
+AREA_ROWS, AREA_COLUMNS = 2, 4  # the room is divided into 2x4 areas of 12x8 pixels
+NUM_AREAS = AREA_ROWS * AREA_COLUMNS
+IN_AREA_THRESHOLD = 0.6  # fraction of hot pixels of an area for the person to be in it
+HOT_RANGE = 2  # pixels within HOT_RANGE degrees of the hottest pixel (capped to MAX_TEMP) are hot
+MAX_TEMP = 40
+BATCH_SIZE = 2048  # frames processed at once, bounds the memory of the temporary arrays
+
+def area_view(frames):
+    """
+    Areas of a (N, 24, 32) stack of frames as a (N, 2, 12, 4, 8) view, without copying:
+    area (i, j) of frame n is view[n, i, :, j, :]
+    """
+    n, height, width = frames.shape
+    return frames.reshape(n, AREA_ROWS, height // AREA_ROWS, AREA_COLUMNS, width // AREA_COLUMNS)
+
 def divide_grid_into_areas(array):
     """
     Divides a 24x32 array into 8x12x8 array
     :return: 8x12x8 array
     """
-    result = np.zeros((8, 12, 8))
-    block_number = 0
-    for i in range(2):
-        for j in range(4):
-            result[block_number] = array[i * 12:(i + 1) * 12, j * 8:(j + 1) * 8]
-            block_number += 1
-    return result
+    return area_view(np.asarray(array, dtype=float)[np.newaxis])[0].transpose(0, 2, 1, 3).reshape(NUM_AREAS, 12, 8)
+
+def area_matrix(shape=(24, 32)):
+    """(height * width, 8) float32 matrix, 1 where the pixel belongs to the area"""
+    areas = area_view(np.arange(shape[0] * shape[1]).reshape((1,) + shape))[0]
+    matrix = np.zeros((shape[0] * shape[1], NUM_AREAS), dtype=np.float32)
+    for area, (i, j) in enumerate(np.ndindex(AREA_ROWS, AREA_COLUMNS)):
+        matrix[areas[i, :, j, :].ravel(), area] = 1
+    return matrix
+
+AREA_MATRIX = area_matrix()
+
+def hot_pixel_fractions(frames, batch_size=BATCH_SIZE):
+    """
+    Fraction of hot pixels of every area of every frame.
+    The hot pixels of a batch are written as 0/1 into a reused float32 buffer, and counted per area
+    with one matrix product with AREA_MATRIX, which is several times faster than summing the
+    (N, 2, 12, 4, 8) area view of a boolean array.
+    :param: (N, 24, 32) frames, e.g. a FrameStore's frames memmap
+    :return: (N, 8) array, areas numbered row by row
+    """
+    frames = np.asarray(frames)
+    n = len(frames)
+    pixels = frames.reshape(n, -1)
+    area_size = pixels.shape[1] / NUM_AREAS
+    fractions = np.empty((n, NUM_AREAS), dtype=np.float32)
+    hot = np.empty((min(batch_size, n), pixels.shape[1]), dtype=np.float32)
+    for start in range(0, n, batch_size):
+        batch = pixels[start:start + batch_size]
+        batch_hot = hot[:len(batch)]
+        frame_max = batch.max(axis=1)
+        max_temp = np.minimum(frame_max, MAX_TEMP)[:, np.newaxis]
+        np.greater_equal(batch, max_temp - HOT_RANGE, out=batch_hot, casting="unsafe")
+        too_hot = np.flatnonzero(frame_max > MAX_TEMP)  # only then can a pixel be above max_temp
+        batch_hot[too_hot] *= batch[too_hot] <= MAX_TEMP
+        np.matmul(batch_hot, AREA_MATRIX, out=fractions[start:start + len(batch)])
+    return fractions / area_size
+
+def naive_likelihoods(frames):
+    """
+    Batch version of naive_detection_by_frame
+    :param: (N, 24, 32) frames
+    :return: (likelihood, in_area) - (N, 8) likelihood of the person being in each area, normalized
+        to sum to 1 (0 when no pixel is hot), and (N, 8) bool, more than 60% of the area is hot
+    """
+    fractions = hot_pixel_fractions(frames)
+    total = fractions.sum(axis=1, keepdims=True)
+    likelihood = np.divide(fractions, total, out=np.zeros_like(fractions), where=total > 0)
+    return likelihood, fractions > IN_AREA_THRESHOLD
+
+def naive_binary_likelihoods(frames):
+    """
+    Batch version of naive_binary_likelihood_by_frame
+    :param: (N, 24, 32) frames
+    :return: (N, 8) uint8, 1 for the areas with the highest likelihood, all 0 when no pixel is hot
+    """
+    fractions = hot_pixel_fractions(frames)
+    # normalizing by the total does not change which areas have the highest likelihood
+    highest = fractions.max(axis=1, keepdims=True)
+    return ((fractions == highest) & (highest > 0)).astype(np.uint8)
 
 def naive_binary_likelihood_by_frame(frame):
     """
     :param: 24x32 frame
     :return: { int: bool, ... int: bool }
     """
-    divided_grid = divide_grid_into_areas(frame)
-    areas_person_is_in = {}
-    max_temp = 40
-    if np.amax(frame) < max_temp:
-        max_temp = np.amax(frame)
-    for i in range(8):
-        area = divided_grid[i]
-        filtered_area = area[np.logical_and(area >= (max_temp - 2), (area <= max_temp))]
-        num_hot_pixels = filtered_area.size
-        areas_person_is_in[i] =  num_hot_pixels/area.size
-
-    total_percentage_hot_pixels = sum(areas_person_is_in.values())
-    max_likelihood = 0
-
-    if total_percentage_hot_pixels == 0:
-        for x in areas_person_is_in:
-            areas_person_is_in[x] = 0
-            
-        return {i : 0 for i in range(8)}
-
-    else:
-        for x in areas_person_is_in:
-            likelihood = areas_person_is_in[x]/total_percentage_hot_pixels
-            areas_person_is_in[x] = likelihood
-            if likelihood > max_likelihood: 
-                max_likelihood = likelihood
-
-        return {i : (1 if areas_person_is_in[i] == max_likelihood else 0) for i in range(8) }
-    
+    binary = naive_binary_likelihoods(np.asarray(frame)[np.newaxis])[0]
+    return {i: int(binary[i]) for i in range(NUM_AREAS)}
 
 def naive_detection_by_frame(frame):
     """
@@ -93,28 +135,8 @@ def naive_detection_by_frame(frame):
             8: {...}
         }  
     """
-    divided_grid = divide_grid_into_areas(frame)
-    areas_person_is_in = {}
-    max_temp = 40
-    if np.amax(frame) < max_temp:
-        max_temp = np.amax(frame)
-    for i in range(8):
-        area = divided_grid[i]
-        filtered_area = area[np.logical_and(area >= (max_temp - 2), (area <= max_temp))]
-        num_hot_pixels = filtered_area.size
-        person_is_in_area = num_hot_pixels > 0.6*(area.size)
-        areas_person_is_in[i] = {"in_area": person_is_in_area, "likelihood": num_hot_pixels/area.size}
-    total_percentage_hot_pixels = sum([areas_person_is_in[x]["likelihood"] for x in areas_person_is_in])
-    
-    if total_percentage_hot_pixels == 0:
-        for x in areas_person_is_in:
-            areas_person_is_in[x]["likelihood"] = 0
-
-    else:
-        for x in areas_person_is_in:
-            areas_person_is_in[x]["likelihood"] = areas_person_is_in[x]["likelihood"]/total_percentage_hot_pixels
-
-    return areas_person_is_in
+    likelihood, in_area = naive_likelihoods(np.asarray(frame)[np.newaxis])
+    return {i: {"in_area": bool(in_area[0, i]), "likelihood": float(likelihood[0, i])} for i in range(NUM_AREAS)}
 
 def naive_detection_from_files(data_path, startIndex=None, endIndex=None):
     heatmap_plot = get_init_heatmap_plot()
@@ -155,33 +177,46 @@ def visualize_likelihood_plot(areas_person_is_in):
 Time Series Analysis Functions
 """
 
+def load_frames(files):
+    """(N, 24, 32) frames of a list of .npy files, or files itself if it already is a stack of frames,
+    e.g. a slice of a FrameStore"""
+    if isinstance(files, np.ndarray):
+        return files
+    return np.array([get_frame(f) for f in files])
+
+def time_spent_in_areas(binary):
+    """Fraction of the frames of binary, from naive_binary_likelihoods, spent in each area"""
+    time_person_spent_in_areas = binary.sum(axis=0)
+    total_time_spent_in_room = time_person_spent_in_areas.sum()
+    if total_time_spent_in_room == 0:
+        return {i: 0 for i in range(NUM_AREAS)}  # nobody was seen during the period
+    return {i: time_person_spent_in_areas[i] / total_time_spent_in_room for i in range(NUM_AREAS)}
+
 def analyze_by_period(files, num_frames=60*30):
-    time_person_spent_in_areas = defaultdict(int)
-    counter = 0
-    while counter < num_frames:
-        frame = get_frame(files[counter])
-        areas_person_is_in = naive_binary_likelihood_by_frame(frame)
-        for area in areas_person_is_in:
-            if areas_person_is_in[area]:
-                time_person_spent_in_areas[area] += 1
-        counter += 1
-    total_time_spent_in_room = sum(time_person_spent_in_areas.values())
-    time_person_spent_in_areas = {i:  time_person_spent_in_areas[i]/total_time_spent_in_room for i in range(8)}    
-    return time_person_spent_in_areas
-
-def analyze(files):
-    total_frames = len(files)
-    counter = 0
+    """
+    :param: files - .npy files, or a (N, 24, 32) stack of frames, of which the first num_frames are analyzed
+    :return: { area: fraction of the time spent in it }
+    """
+    return time_spent_in_areas(naive_binary_likelihoods(load_frames(files[:num_frames])))
+
+def analyze(files, period=60*30):
+    """
+    Time spent in each area for every period of `period` frames, each period analyzed in one batch,
+    so only one period of frames is ever in memory
+    :param: files - .npy files, keyed by the start of their period, a FrameStore, keyed by the
+        capture time of the first frame of the period, or a (N, 24, 32) stack of frames, keyed
+        by the index of the first frame of the period
+    :return: { start of the period: { area: fraction of the time spent in it } }
+    """
     analysis_results = {}
-    while counter < total_frames:
-        num_frames = 60*30
-        if num_frames + counter >= total_frames:
-            num_frames = total_frames - counter
-        
-        start_time = files[counter].split("_grideye")[0]
+    for counter in range(0, len(files), period):
+        if isinstance(files, FrameStore):
+            start_time = time.strftime(TIME_FORMAT, time.localtime(files.times[counter]))
+        elif isinstance(files, np.ndarray):
+            start_time = str(counter)
+        else:
+            start_time = files[counter].split("_grideye")[0]
         print("Analyzing 30min interval from", start_time,)
-        one_span_frames = files[counter: counter+num_frames]
-        one_span_analysis = analyze_by_period(one_span_frames, num_frames)
-        analysis_results[start_time] = one_span_analysis
-        counter += num_frames
+        binary = naive_binary_likelihoods(load_frames(files[counter:counter + period]))
+        analysis_results[start_time] = time_spent_in_areas(binary)
     return analysis_results
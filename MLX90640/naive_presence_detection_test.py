@@ -1,23 +1,81 @@
-from presence_detection import get_centroid_area_number, get_centroid_area_history
-from background_subtraction_test import test_postprocess_img
-from centroid_history import plot_centroid_history
-from file_utils import get_all_files
-from naive_presence_detection import (get_frame,
+import tempfile
+import time
+from collections import defaultdict
+from os.path import join
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from file_utils import get_all_files, write_to_json
+from naive_presence_detection import (analyze, analyze_by_period,
+                                      divide_grid_into_areas, get_frame,
                                       naive_binary_likelihood_by_frame,
+                                      naive_binary_likelihoods,
                                       naive_detection_by_frame,
                                       naive_detection_from_files,
-                                      optical_flow_dense, optical_flow_lk,
+                                      naive_likelihoods,
                                       visualize_likelihood_plot)
+from synthetic_scene import (SyntheticScene, recording_or_synthetic,
+                             save_frame_store)
 
 data_path = "./data/teck_walk_out_and_in" # dirty data with movement
 # data_path = "./data/sw_second_trial" # very dirty data with no movement
-files = get_all_files(data_path)
+files = recording_or_synthetic(data_path, num_frames=1800)
 print("Number of frames found in ", data_path, ": ", len(files))
 
 """
 Naive Presence Detection Tests
 """
 
+def loop_divide_grid_into_areas(array):
+    """The per frame code naive_presence_detection used before it worked on batches of frames"""
+    result = np.zeros((8, 12, 8))
+    block_number = 0
+    for i in range(2):
+        for j in range(4):
+            result[block_number] = array[i * 12:(i + 1) * 12, j * 8:(j + 1) * 8]
+            block_number += 1
+    return result
+
+def loop_hot_pixel_fractions(frame):
+    divided_grid = loop_divide_grid_into_areas(frame)
+    max_temp = 40
+    if np.amax(frame) < max_temp:
+        max_temp = np.amax(frame)
+    fractions = []
+    for i in range(8):
+        area = divided_grid[i]
+        filtered_area = area[np.logical_and(area >= (max_temp - 2), (area <= max_temp))]
+        fractions.append(filtered_area.size / area.size)
+    return fractions
+
+def loop_detection_by_frame(frame):
+    fractions = loop_hot_pixel_fractions(frame)
+    total_percentage_hot_pixels = sum(fractions)
+    areas_person_is_in = {}
+    for i in range(8):
+        likelihood = fractions[i] / total_percentage_hot_pixels if total_percentage_hot_pixels else 0
+        areas_person_is_in[i] = {"in_area": fractions[i] > 0.6, "likelihood": likelihood}
+    return areas_person_is_in
+
+def loop_binary_likelihood_by_frame(frame):
+    fractions = loop_hot_pixel_fractions(frame)
+    total_percentage_hot_pixels = sum(fractions)
+    if total_percentage_hot_pixels == 0:
+        return {i: 0 for i in range(8)}
+    likelihoods = [fraction / total_percentage_hot_pixels for fraction in fractions]
+    return {i: (1 if likelihoods[i] == max(likelihoods) else 0) for i in range(8)}
+
+def loop_analyze_by_period(frames):
+    time_person_spent_in_areas = defaultdict(int)
+    for frame in frames:
+        areas_person_is_in = loop_binary_likelihood_by_frame(frame)
+        for area in areas_person_is_in:
+            if areas_person_is_in[area]:
+                time_person_spent_in_areas[area] += 1
+    total_time_spent_in_room = sum(time_person_spent_in_areas.values())
+    return {i: time_person_spent_in_areas[i] / total_time_spent_in_room for i in range(8)}
+
 def test_naive_one_frame():
     # view normal heatmap next to percentage plot
     test_frame = get_frame(files[60*20])
@@ -42,8 +100,46 @@ def test_naive_presence_detection_pipeline():
     data_path = "./data/" + folder_name
     files = get_all_files(data_path)
     print("Number of frames: ", len(files))
-    result = analyze()
+    result = analyze(files)
     end = time.time()
 
     print("Analysis completed in ", end-start, "seconds")
     write_to_json(result, "./sample_time_series_results/{}.json".format(folder_name))
+
+def test_batch_matches_per_frame(num_frames=500):
+    """The batch code gives the same areas as the per frame loops it replaced"""
+    frames, _, _ = SyntheticScene(num_people=2, dropout=0).generate(num_frames)
+    likelihood, in_area = naive_likelihoods(frames)
+    binary = naive_binary_likelihoods(frames)
+    assert likelihood.shape == in_area.shape == binary.shape == (num_frames, 8)
+    for i, frame in enumerate(frames):
+        expected = loop_detection_by_frame(frame)
+        assert np.allclose([expected[a]["likelihood"] for a in range(8)], likelihood[i])
+        assert [expected[a]["in_area"] for a in range(8)] == in_area[i].tolist()
+        assert list(loop_binary_likelihood_by_frame(frame).values()) == binary[i].tolist()
+        assert naive_binary_likelihood_by_frame(frame) == loop_binary_likelihood_by_frame(frame)
+        assert np.allclose(divide_grid_into_areas(frame), loop_divide_grid_into_areas(frame))
+    assert analyze_by_period(frames, num_frames) == loop_analyze_by_period(frames)
+    # a frame without hot pixels in the human range
+    assert naive_binary_likelihoods(np.full((1, 24, 32), np.nan)).tolist() == [[0] * 8]
+
+def test_analyze_day(num_frames=2 * 60 * 60 * 24):
+    frames, _, _ = SyntheticScene(num_people=2, dropout=0).generate(1800)
+    day = np.tile(frames, (num_frames // 1800, 1, 1))
+    start = time.perf_counter()
+    result = analyze(day)
+    print("{} frames analyzed in {:.3f}s".format(len(day), time.perf_counter() - start))
+    assert len(result) == num_frames // 1800
+    assert result["0"] == analyze_by_period(frames) == result[str(1800 * 5)]
+
+def test_analyze_frame_store(num_frames=3600):
+    """A FrameStore is analyzed one period at a time, keyed by the capture time of each period"""
+    frames, _, _ = SyntheticScene(num_people=2, dropout=0).generate(num_frames)
+    store = save_frame_store(SyntheticScene(num_people=2, dropout=0), join(tempfile.mkdtemp(), "store"), num_frames)
+    result = analyze(store)
+    assert list(result) == ["2020.07.14_081300", "2020.07.14_082800"]  # 1800 frames at 2 fps
+    assert list(result.values()) == list(analyze(frames).values())
+
+# test_batch_matches_per_frame()
+# test_analyze_day()
+# test_analyze_frame_store()
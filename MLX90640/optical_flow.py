@@ -62,9 +62,9 @@ def optical_flow_lk(files, track_length=10, detect_interval=5):
         counter +=1
     
 
-def optical_flow_dense(files):
+def optical_flow_dense(files, workers=None):
     # Perform Godec first on all frames
-    M, LS, L, S, width, height = bs_godec(files)
+    M, LS, L, S, width, height = bs_godec(files, workers=workers)
     first_frame = get_frame(files[0])
     
     # frames to be compared is after godec and postprocessing
@@ -1,5 +1,6 @@
 from file_utils import get_all_files
 from optical_flow import optical_flow_dense, optical_flow_lk
+from synthetic_scene import recording_or_synthetic
 from visualizer import write_gif_from_pics
 
 
@@ -12,7 +13,7 @@ def test_opticalflow_dense():
     optical_flow_dense(files)
 
 data_path = "data/teck_walk_out_and_in"
-files = get_all_files(data_path)
+files = recording_or_synthetic(data_path)
 test_opticalflow_dense()
 
 pics = get_all_files("optical_flow_pics/")
@@ -0,0 +1,117 @@
+import json
+import struct
+import zlib
+
+import numpy as np
+
+"""
+Binary encoding of the displacement payloads sent by the RPi to the NUC.
+
+Displacements between consecutive centroids are almost all 0, 1 or sqrt(2), so instead of a
+json list of full precision floats they are quantized to multiples of 1/QUANTIZATION and run
+length encoded. Frame timestamps (ms since "start") are delta encoded, and since frames come
+at a steady rate the deltas are run length encoded too.
+
+Layout, little endian:
+    MAGIC, VERSION (uint8), flags (uint8), then the body, zlib compressed if flags & COMPRESSED:
+    metadata length (uint32), metadata json (every key except "frames" and "timestamps")
+    number of displacement runs (uint32), run values (uint16), run lengths (uint32)
+    has timestamps (uint8), then if it is 1: first timestamp (int64), number of delta runs (uint32),
+        delta run values (int32), delta run lengths (uint32)
+
+This file is the same in MLX90640/ and NUC/, keep them in sync.
+"""
+
+MAGIC = b"BPD"
+VERSION = 1
+COMPRESSED = 1
+QUANTIZATION = 1024  # displacements up to 64 pixels with a resolution of 1/1024 pixel
+
+
+def run_length_encode(a):
+    """(values, lengths) of the runs of equal consecutive values of a 1D array"""
+    if len(a) == 0:
+        return a[:0], np.zeros(0, dtype=np.uint32)
+    starts = np.flatnonzero(np.concatenate(([True], a[1:] != a[:-1])))
+    lengths = np.diff(np.append(starts, len(a)))
+    return a[starts], lengths.astype(np.uint32)
+
+def run_length_decode(values, lengths):
+    return np.repeat(values, lengths)
+
+def pack_runs(values, lengths):
+    return struct.pack("<I", len(values)) + values.tobytes() + lengths.astype("<u4").tobytes()
+
+def unpack_runs(body, offset, dtype):
+    (n,) = struct.unpack_from("<I", body, offset)
+    offset += 4
+    values = np.frombuffer(body, dtype=dtype, count=n, offset=offset)
+    offset += values.nbytes
+    lengths = np.frombuffer(body, dtype="<u4", count=n, offset=offset)
+    return values, lengths, offset + lengths.nbytes
+
+def encode_payload(result, compress=True):
+    """Encode a displacement_history / DisplacementAnalyzer.finish result
+
+    Args:
+        result (dict): metadata plus "frames", the displacements, and optionally "timestamps"
+        compress (bool, optional): zlib compress the body. Defaults to True.
+
+    Returns:
+        bytes
+    """
+    metadata = {k: v for k, v in result.items() if k not in ("frames", "timestamps")}
+    meta_bytes = json.dumps(metadata).encode("utf-8")
+    body = [struct.pack("<I", len(meta_bytes)), meta_bytes]
+
+    frames = np.asarray(result["frames"], dtype=np.float64)
+    quantized = np.clip(np.round(frames * QUANTIZATION), 0, np.iinfo(np.uint16).max).astype("<u2")
+    body.append(pack_runs(*run_length_encode(quantized)))
+
+    timestamps = result.get("timestamps")
+    if timestamps is None or len(timestamps) == 0:
+        body.append(struct.pack("<B", 0))
+    else:
+        ms = np.round(np.asarray(timestamps, dtype=np.float64) * 1000).astype(np.int64)
+        body.append(struct.pack("<Bq", 1, ms[0]))
+        body.append(pack_runs(*run_length_encode(np.diff(ms).astype("<i4"))))
+
+    body = b"".join(body)
+    flags = 0
+    if compress:
+        body = zlib.compress(body)
+        flags |= COMPRESSED
+    return MAGIC + struct.pack("<BB", VERSION, flags) + body
+
+def is_binary_payload(data):
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+def decode_payload(data):
+    """Decode a payload from encode_payload, or an utf-8 json payload from older RPis
+
+    Returns:
+        dict: the result given to encode_payload, with displacements rounded to 1/QUANTIZATION
+    """
+    if not is_binary_payload(data):
+        return json.loads(bytes(data).decode("utf-8"))
+    version, flags = struct.unpack_from("<BB", data, len(MAGIC))
+    if version != VERSION:
+        raise ValueError("Unsupported payload version {}".format(version))
+    body = bytes(data[len(MAGIC) + 2:])
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+
+    (meta_length,) = struct.unpack_from("<I", body, 0)
+    result = json.loads(body[4:4 + meta_length].decode("utf-8"))
+    offset = 4 + meta_length
+
+    values, lengths, offset = unpack_runs(body, offset, "<u2")
+    result["frames"] = (run_length_decode(values, lengths) / QUANTIZATION).tolist()
+
+    (has_timestamps,) = struct.unpack_from("<B", body, offset)
+    if has_timestamps:
+        (first,) = struct.unpack_from("<q", body, offset + 1)
+        values, lengths, offset = unpack_runs(body, offset + 9, "<i4")
+        ms = np.concatenate(([first], first + np.cumsum(run_length_decode(values, lengths), dtype=np.int64)))
+        result["timestamps"] = (ms / 1000).tolist()
+    return result
@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+
+from payload_codec import decode_payload, encode_payload
+
+
+def make_result(num_frames=7200, timestamps=True):
+    """An hour at 2 Hz with displacements of 0, 1 or sqrt(2) like displacement_history"""
+    frames = np.random.choice([0.0, 0.0, 0.0, 1.0, 1.0, np.sqrt(2)], num_frames)
+    result = {"start": "2020.07.14_081300", "end": "2020.07.14_091300", "timeElapsedInSeconds": 3600.0,
+              "numFrames": num_frames, "frames": frames.tolist(), "room_type": "bedroom"}
+    if timestamps:
+        result["timestamps"] = (np.arange(num_frames) * 0.5).tolist()
+    return result
+
+def test_round_trip():
+    for timestamps in (True, False):
+        for compress in (True, False):
+            result = make_result(timestamps=timestamps)
+            decoded = decode_payload(encode_payload(result, compress=compress))
+            assert np.allclose(decoded["frames"], result["frames"], atol=1e-3)
+            assert decoded["start"] == result["start"] and decoded["room_type"] == "bedroom"
+            assert ("timestamps" in decoded) == timestamps
+            if timestamps:
+                assert np.allclose(decoded["timestamps"], result["timestamps"])
+
+def test_payload_size():
+    result = make_result()
+    json_size = len(json.dumps(result).encode("utf-8"))
+    binary_size = len(encode_payload(result))
+    print("json: {} bytes, binary: {} bytes".format(json_size, binary_size))
+    assert binary_size * 10 < json_size
+
+def test_decode_json():
+    """Payloads from RPis that still send json"""
+    result = make_result(num_frames=10)
+    assert decode_payload(json.dumps(result).encode("utf-8")) == result
+
+# test_round_trip()
+# test_payload_size()
+# test_decode_json()
@@ -1,11 +1,20 @@
 import math
 import os
+import time
 from collections import Counter, defaultdict
 from json_to_timedict import json_to_timedict
 import numpy as np
 
 from centroid_history import get_centroid_area_history, displacement_history
 from file_utils import basename
+from frame_store import TIME_FORMAT, FrameStore
+
+
+def period_key(files, index):
+    """Name of the period starting at frame index: the file name, or the capture time of the frame for a FrameStore"""
+    if isinstance(files, FrameStore):
+        return time.strftime(TIME_FORMAT, time.localtime(files.times[index]))
+    return basename(files[index])
 
 
 def analyze_centroid_area_history(files, num_frames_per_iteration=1800, key_format="from_to"):
@@ -14,7 +23,7 @@ def analyze_centroid_area_history(files, num_frames_per_iteration=1800, key_form
     get centroid area history iteratively over 30 mins of frames.
 
     Args:
-        files ([type]): [description]
+        files ([str] or FrameStore): [description]
         num_frames (int, optional): [description]. Defaults to 1800 (30 mins).
     """
     total_frames = len(files) # each frame is 1 second
@@ -29,7 +38,7 @@ def analyze_centroid_area_history(files, num_frames_per_iteration=1800, key_form
             end_index = counter + num_frames_per_iteration
             
         area_movement_counter = get_centroid_area_history(files[start_index:end_index], debug=False, key_format="from_to")
-        dictkey = basename(files[start_index])
+        dictkey = period_key(files, start_index)
         analysis_results[dictkey] = {
             "keyformat": "from_to",
             "duration": end_index - start_index,
@@ -46,7 +55,7 @@ def analyze_centroid_displacement_history(files, num_frames_per_iteration=1800):
     get centroid displacement history iteratively over 30 mins of frames.
 
     Args:
-        files ([type]): [description]
+        files ([str] or FrameStore): [description]
         num_frames (int, optional): [description]. Defaults to 1800 (30 mins).
     """
     total_frames = len(files)
@@ -61,8 +70,8 @@ def analyze_centroid_displacement_history(files, num_frames_per_iteration=1800):
         else:
             end_index = counter + num_frames_per_iteration
             print("running analysis for {} - {}".format(start_index, end_index))   
-        startTime = basename(files[start_index])
-        endTime = basename(files[end_index])
+        startTime = period_key(files, start_index)
+        endTime = period_key(files, min(end_index, total_frames - 1))
         displacement_dict = {num_interval: displacement_history(files[start_index:end_index], startTime, endTime)}
         analysis_results = {**analysis_results, **displacement_dict}
         counter += num_frames_per_iteration
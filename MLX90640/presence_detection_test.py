@@ -1,7 +1,10 @@
 from file_utils import get_all_files, write_to_json, basename
 from presence_detection import analyze_centroid_displacement_history, analyze_centroid_area_history
 from json_to_timedict import json_to_timedict
+from synthetic_scene import SyntheticScene, save_frame_store
+import tempfile
 import time
+from os.path import join
 
 
 def test_analyze_centroid_area_history_short_time():
@@ -38,6 +41,20 @@ def test_analyze_centroid_displacement_history():
     end = time.time()
     print("Time taken to collect displacement dictionary for {} files : {}".format(len(files), end - start))
 
+def test_analyze_frame_store(num_frames=240, num_frames_per_iteration=120):
+    scene = SyntheticScene(dropout=0)
+    store = save_frame_store(scene, join(tempfile.mkdtemp(), "store"), num_frames)
+    keys = [time.strftime("%Y.%m.%d_%H%M%S", time.localtime(scene.start_time + i / scene.fps))
+            for i in range(0, num_frames, num_frames_per_iteration)]
+
+    area_results = analyze_centroid_area_history(store, num_frames_per_iteration)
+    assert list(area_results) == keys
+    assert all(result["duration"] == num_frames_per_iteration for result in area_results.values())
+
+    displacement_results = analyze_centroid_displacement_history(store, num_frames_per_iteration)
+    assert [result["start"] for result in displacement_results.values()] == keys
+    assert all(result["numFrames"] == num_frames_per_iteration for result in displacement_results.values())
+
 def test_json_to_timedict():
     filepath = 'sample_activity_levels/displacement_history/2020.07.14.json'
     filepath1 = 'sample_activity_levels/displacement_history/2020.07.15.json'
@@ -62,4 +79,5 @@ def test_json_to_timedict():
 # test_analyze_centroid_area_history_short_time()
 # test_analyze_centroid_area_history_long_time()
 # test_analyze_centroid_displacement_history()
+# test_analyze_frame_store()
 # test_json_to_timedict()
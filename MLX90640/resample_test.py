@@ -0,0 +1,23 @@
+import numpy as np
+
+from resample import fft_resample
+
+
+def test_short_series():
+    """Series too short to pad are interpolated, without overshooting their values"""
+    for values in ([1.0], [1.0, 2.0], [1.0, 2.0, 3.0]):
+        out = fft_resample(values, 8)
+        assert len(out) == 8 and out[0] == values[0]
+        assert min(values) <= out.min() and out.max() <= max(values)
+    assert np.allclose(fft_resample([1.0, 2.0], 4), [1.0, 1.5, 2.0, 2.0])
+
+def test_lengths():
+    """Any number of values gives exactly length samples following the series"""
+    for n, length in ((60, 100), (1799, 1800), (2400, 1800), (1000, 1801)):
+        values = np.sin(np.linspace(0, 3, n))
+        out = fft_resample(values, length)
+        assert len(out) == length
+        assert np.allclose(out, np.interp(np.arange(length) * n / length, np.arange(n), values), atol=0.05)
+
+# test_short_series()
+# test_lengths()
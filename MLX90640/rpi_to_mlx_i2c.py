@@ -1,11 +1,16 @@
 import time
+from os.path import join
 
 import numpy as np
 
 import adafruit_mlx90640
 import board
 import busio
-from file_utils import create_folder_if_absent, save_npy
+from capture import FrameCapture
+from file_utils import create_folder_if_absent
+from frame_repair import FrameRepair
+from frame_store import FrameStore
+from timer import metrics
 from visualizer import init_heatmap, update_heatmap
 
 """
@@ -23,45 +28,6 @@ DEBUG_MODE = 1
 WRITE_MODE = 0
 PUBLISH_MODE = 2
 DATA_PATH = "data/test" # change as it fits 
-DATA_DIR_SORT = "day"
-
-def interpolate_values(df):
-    """
-    :param: 24x32 data frame obtained from get_nan_value_indices(df)
-    :return: 24x32 array
-    """
-    nan_value_indices = np.argwhere(np.isnan(df))
-    x_max = df.shape[0] - 1
-    y_max = df.shape[1] - 1
-    for indx in nan_value_indices:
-        x = indx[0]
-        y = indx[1]
-        if x==0  and y==0 :
-            df[x][y] = (df[x+1][y]+df[x][y+1])/2 
-
-        elif (x==x_max and y==y_max):
-            df[x][y] = (df[x-1][y]+df[x][y-1])/2
-
-        elif (x==0 and y==y_max):
-            df[x][y] = (df[x+1][y]+df[x][y-1])/2
-
-        elif (x==x_max and y==0):
-            df[x][y] = (df[x-1][y]+df[x][y+1])/2
-
-        elif (x==0):
-            df[x][y] = (df[x+1][y]+df[x][y-1]+df[x][y+1])/3
-
-        elif (x==x_max):
-            df[x][y] = (df[x-1][y]+df[x][y-1]+df[x][y+1])/3
-
-        elif (y==0):
-            df[x][y] = (df[x+1][y]+df[x-1][y]+df[x][y+1])/3
-
-        elif (y==y_max):
-            df[x][y] = (df[x-1][y]+df[x+1][y]+df[x][y-1])/3
-        else :
-            df[x][y] = (df[x][y+1] + df[x+1][y] + df[x-1][y] + df[x][y-1]) / 4
-    return df
 
 def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
     """
@@ -72,22 +38,19 @@ def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
 
     to_read = forever or counter < num_samples
     plot = None
+    capture = FrameCapture(mlx.getFrame, ARRAY_SHAPE, FrameRepair(ARRAY_SHAPE), metrics)
     if mode == DEBUG_MODE:
         min_temp = 28
         max_temp = 40
         plot = init_heatmap("MLX90640 Heatmap", ARRAY_SHAPE, min_temp, max_temp)
     elif mode == WRITE_MODE:
         create_folder_if_absent(DATA_PATH)
+        store = FrameStore(join(DATA_PATH, time.strftime("%Y.%m.%d_%H%M%S", time.localtime(time.time()))), ARRAY_SHAPE)
         
     while to_read:
         try:
-            frame = np.zeros((24*32))  #  initialise array for storing temp values
-            mlx.getFrame(frame)  #  get the mlx values and put them into the array we just created
-            array = np.array(frame)  
-            print(array)  
-            if array.shape[0] == ARRAY_SHAPE[0] * ARRAY_SHAPE[1]:
-                df = np.reshape(array.astype(float), ARRAY_SHAPE)
-                df = interpolate_values(df)
+            df = capture.capture()  # a view of the capture buffer, overwritten by the next frame
+            if df is not None:
                 max_temp = np.amax(df)
                 min_temp = np.amin(df)
 
@@ -96,8 +59,8 @@ def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
                     update_heatmap(df, plot)
 
                 elif mode == WRITE_MODE:
-                    print("Saving npy object...", "[{}]".format(counter))
-                    save_npy(df, DATA_PATH, directory_sort=DATA_DIR_SORT)
+                    print("Saving frame...", "[{}]".format(counter))
+                    store.append(df)
 
                 elif mode == PUBLISH_MODE:
                     pass
@@ -105,10 +68,16 @@ def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
             counter += 1
 
         except KeyboardInterrupt:
+            if mode == WRITE_MODE:
+                store.close()
             raise
         except Exception as e:
             print(e)
             break
 
+    if mode == WRITE_MODE:
+        store.close()
+    print(capture.summary())
+
 if __name__ == "__main__":
     save_serial_output(forever=True, mode=DEBUG_MODE) 
@@ -1,9 +1,14 @@
 import time
+from os.path import join
 
 import numpy as np
 import serial
 
-from file_utils import create_folder_if_absent, save_npy
+from capture import FrameCapture, serial_reader
+from file_utils import create_folder_if_absent
+from frame_repair import FrameRepair
+from frame_store import FrameStore
+from timer import metrics
 from visualizer import init_heatmap, update_heatmap
 
 """
@@ -21,45 +26,6 @@ DEBUG_MODE = 0
 WRITE_MODE = 1
 PUBLISH_MODE = 2
 DATA_PATH = "data/dataset_for_xavier_day1" # change as it fits 
-DATA_DIR_SORT = "day"
-
-def interpolate_values(df):
-    """
-    :param: 24x32 data frame obtained from get_nan_value_indices(df)
-    :return: 24x32 array
-    """
-    nan_value_indices = np.argwhere(np.isnan(df))
-    x_max = df.shape[0] - 1
-    y_max = df.shape[1] - 1
-    for indx in nan_value_indices:
-        x = indx[0]
-        y = indx[1]
-        if x==0  and y==0 :
-            df[x][y] = (df[x+1][y]+df[x][y+1])/2 
-
-        elif (x==x_max and y==y_max):
-            df[x][y] = (df[x-1][y]+df[x][y-1])/2
-
-        elif (x==0 and y==y_max):
-            df[x][y] = (df[x+1][y]+df[x][y-1])/2
-
-        elif (x==x_max and y==0):
-            df[x][y] = (df[x-1][y]+df[x][y+1])/2
-
-        elif (x==0):
-            df[x][y] = (df[x+1][y]+df[x][y-1]+df[x][y+1])/3
-
-        elif (x==x_max):
-            df[x][y] = (df[x-1][y]+df[x][y-1]+df[x][y+1])/3
-
-        elif (y==0):
-            df[x][y] = (df[x+1][y]+df[x-1][y]+df[x][y+1])/3
-
-        elif (y==y_max):
-            df[x][y] = (df[x-1][y]+df[x+1][y]+df[x][y-1])/3
-        else :
-            df[x][y] = (df[x][y+1] + df[x+1][y] + df[x-1][y] + df[x][y-1]) / 4
-    return df
 
 def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
     """
@@ -71,22 +37,19 @@ def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
 
     to_read = forever or counter < num_samples
     plot = None
+    capture = FrameCapture(serial_reader(ser), ARRAY_SHAPE, FrameRepair(ARRAY_SHAPE), metrics)
     if mode == DEBUG_MODE:
         min_temp = 28
         max_temp = 40
         plot = init_heatmap("MLX90640 Heatmap", ARRAY_SHAPE, min_temp, max_temp)
     elif mode == WRITE_MODE:
         create_folder_if_absent(DATA_PATH)
+        store = FrameStore(join(DATA_PATH, time.strftime("%Y.%m.%d_%H%M%S", time.localtime(time.time()))), ARRAY_SHAPE)
         
     while to_read:
         try:
-            ser_bytes = ser.readline()
-            decoded_string = ser_bytes.decode("utf-8", errors='ignore').strip("\r\n")
-            values = decoded_string.split(",")[:-1]
-            array = np.array(values)    
-            if array.shape[0] == ARRAY_SHAPE[0] * ARRAY_SHAPE[1]:
-                df = np.reshape(array.astype(float), ARRAY_SHAPE)
-                df = interpolate_values(df)
+            df = capture.capture()  # a view of the capture buffer, overwritten by the next frame
+            if df is not None:
                 max_temp = np.amax(df)
                 min_temp = np.amin(df)
 
@@ -95,8 +58,8 @@ def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
                     update_heatmap(df, plot)
 
                 elif mode == WRITE_MODE:
-                    print("Saving npy object...", "[{}]".format(counter))
-                    save_npy(df, DATA_PATH, directory_sort=DATA_DIR_SORT)
+                    print("Saving frame...", "[{}]".format(counter))
+                    store.append(df)
 
                 elif mode == PUBLISH_MODE:
                     pass
@@ -104,10 +67,16 @@ def save_serial_output(forever, num_samples=3000, mode=DEBUG_MODE):
             counter += 1
 
         except KeyboardInterrupt:
+            if mode == WRITE_MODE:
+                store.close()
             raise
         except Exception as e:
             print(e)
             break
 
+    if mode == WRITE_MODE:
+        store.close()
+    print(capture.summary())
+
 if __name__ == "__main__":
     save_serial_output(forever=True, mode=WRITE_MODE) 
@@ -1,6 +1,6 @@
 from file_utils import get_all_files
 from file_utils import get_frame, get_frame_GREY
-from background_subtraction import bs_godec
+from background_subtraction import bs_godec, create_godec_input
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -16,11 +16,16 @@ def generate_background_est(m, b_n_minus_2, prev_output, alpha, MODE="DEFAULT"):
     return output
 
 
-def static_clutter_algo(data):
+def static_clutter_algo(data, workers=None):
     # data: numpy array file. Outputs the uncluttered data and backgrounds in the form of an array of numpy arrays
     # each representing one frame
 
-    M, LS, L, S, width, height = bs_godec(data[0:2])
+    # load every greyscale frame once, as the columns of one preallocated matrix
+    frames, frame = create_godec_input(data, workers=workers)
+    height, width = frame.shape
+    grey_frames = [frames[:, i].reshape(width, height).T for i in range(frames.shape[1])]
+
+    M, LS, L, S, width, height = bs_godec(grey_frames[0:2])
     first_background = S[:, 0].reshape(width, height).T
     first_uncluttered = L[:, 1].reshape(width, height).T
     background = first_background
@@ -38,7 +43,7 @@ def static_clutter_algo(data):
             background = generate_background_est(m, backgrounds[i - 2], result[i - 1], 0.2)
 
         backgrounds.append(background)
-        r = get_frame_GREY(data[i]) - background
+        r = grey_frames[i] - background
         result.append(r)
 
     return result, backgrounds
@@ -0,0 +1,231 @@
+import json
+import tempfile
+import time
+from os import listdir
+from os.path import exists, join
+
+import numpy as np
+
+from file_utils import create_folder_if_absent, get_all_files
+from frame_store import TIME_FORMAT, FrameStore
+
+"""
+Synthetic MLX90640 recordings, for tests and benchmarks that cannot rely on the recordings in data/.
+
+A SyntheticScene is a room seen from the ceiling:
+- a background of a few warm and cold patches plus a gradient, whose temperature drifts slowly
+  around the ambient temperature,
+- per pixel sensor noise, a fixed offset per pixel, random NaN dropouts and optionally dead pixels,
+- people, warm gaussian blobs walking between random waypoints, pausing at them, and optionally
+  leaving the room for a while.
+
+Everything is drawn from one seeded generator, so a scene of a given seed is always the same.
+Frames are generated chunk by chunk, so scenes of any length can be streamed without holding
+them in memory. The ground truth is the (x, y) = (column, row) centroid of every person in the
+room in each frame, like the centroids of postprocess_img.
+
+Frames can be saved as one .npy per frame named like save_npy does, or as a FrameStore, with the
+ground truth next to them in ground_truth.json.
+"""
+
+ARRAY_SHAPE = (24, 32)
+GROUND_TRUTH_FILE = "ground_truth.json"
+SYNTHETIC_DATA_PATH = join(tempfile.gettempdir(), "mlx90640_synthetic")  # outside the repository
+
+
+class SyntheticScene:
+    def __init__(self, shape=ARRAY_SHAPE, num_people=1, fps=2, start_time=None, seed=0, ambient=26.0,
+                 drift=1.0, drift_period=3600, noise=0.2, dropout=0.001, dead_pixels=0, body_temperature=6.0,
+                 body_size=(1.5, 2.0), speed=0.3, pause_frames=20, visit_frames=None, absent_frames=0):
+        """
+        Args:
+            shape (tuple, optional): Defaults to ARRAY_SHAPE.
+            num_people (int, optional): Defaults to 1.
+            fps (int, optional): frames per second, for the timestamps. Defaults to 2.
+            start_time (float, optional): timestamp of the first frame. Defaults to None, 2020.07.14 08:13:00.
+            seed (int, optional): Defaults to 0.
+            ambient (float, optional): mean background temperature in degrees. Defaults to 26.0.
+            drift (float, optional): amplitude of the background drift in degrees. Defaults to 1.0.
+            drift_period (int, optional): period of the drift in seconds. Defaults to 3600.
+            noise (float, optional): standard deviation of the sensor noise in degrees. Defaults to 0.2.
+            dropout (float, optional): probability of a pixel reading NaN in a frame. Defaults to 0.001.
+            dead_pixels (int, optional): number of pixels always reading NaN. Defaults to 0.
+            body_temperature (float, optional): peak temperature of a person above the background. Defaults to 6.0.
+            body_size (tuple, optional): standard deviation of a person blob along x and y, in pixels. Defaults to (1.5, 2.0).
+            speed (float, optional): walking speed in pixels per frame. Defaults to 0.3.
+            pause_frames (int, optional): mean number of frames spent at a waypoint. Defaults to 20.
+            visit_frames (int, optional): mean number of frames a person stays in the room before
+                leaving. Defaults to None, people never leave.
+            absent_frames (int, optional): mean number of frames a person is away. Defaults to 0.
+        """
+        self.shape = shape
+        self.fps = fps
+        self.start_time = time.mktime(time.strptime("2020.07.14_081300", TIME_FORMAT)) if start_time is None else start_time
+        # one stream per kind of randomness, so that the frames do not depend on the chunk size
+        self.rng, self.walk_rng, self.noise_rng, self.dropout_rng = [
+            np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(4)]
+        self.ambient = ambient
+        self.drift = drift
+        self.drift_period = drift_period
+        self.noise = noise
+        self.dropout = dropout
+        self.body_temperature = body_temperature
+        self.body_size = body_size
+        self.speed = speed
+        self.pause_frames = pause_frames
+        self.visit_frames = visit_frames
+        self.absent_frames = absent_frames
+
+        height, width = shape
+        rows, cols = np.mgrid[0:height, 0:width]
+        background = self.rng.normal(0, 0.5) * (cols / width - 0.5) + self.rng.normal(0, 0.5) * (rows / height - 0.5)
+        for _ in range(4):
+            # warm or cold patches, e.g. a window or an appliance
+            cx, cy = self.rng.uniform(0, width), self.rng.uniform(0, height)
+            size = self.rng.uniform(2, 6)
+            background += self.rng.normal(0, 1.5) * np.exp(-((cols - cx) ** 2 + (rows - cy) ** 2) / (2 * size ** 2))
+        background += self.rng.normal(0, noise / 2, shape)  # fixed pattern noise of the sensor
+        self.background = background.astype(np.float32)
+        self.drift_phase = self.rng.uniform(0, 2 * np.pi)
+        self.dead = self.rng.choice(height * width, size=dead_pixels, replace=False)
+
+        # walking state of each person
+        self.positions = self.rng.uniform((1, 1), (width - 1, height - 1), size=(num_people, 2))
+        self.targets = self.positions.copy()
+        self.waits = self.walk_rng.integers(0, pause_frames + 1, size=num_people)
+        self.present = np.ones(num_people, dtype=bool)
+        self.frame_index = 0
+
+    def _walk(self):
+        """Move every person by one frame"""
+        width, height = self.shape[1], self.shape[0]
+        for p in range(len(self.positions)):
+            if self.visit_frames is not None:
+                mean_frames = self.visit_frames if self.present[p] else max(self.absent_frames, 1)
+                if self.walk_rng.random() < 1 / mean_frames:
+                    self.present[p] = not self.present[p]
+            if self.waits[p] > 0:
+                self.waits[p] -= 1
+                continue
+            step = self.targets[p] - self.positions[p]
+            distance = np.hypot(*step)
+            if distance <= self.speed:
+                self.positions[p] = self.targets[p]
+                self.targets[p] = self.walk_rng.uniform((1, 1), (width - 1, height - 1))
+                self.waits[p] = self.walk_rng.geometric(1 / (self.pause_frames + 1)) - 1
+            else:
+                self.positions[p] += step / distance * self.speed
+
+    def chunks(self, num_frames, chunk_size=1024):
+        """Generate the next num_frames frames, chunk_size at a time.
+
+        Yields:
+            (np.array, np.array, list): (n, height, width) float32 frames, their timestamps, and for
+                every frame the list of (x, y) centroids of the people in the room
+        """
+        height, width = self.shape
+        cols = np.arange(width, dtype=np.float32)
+        rows = np.arange(height, dtype=np.float32)
+        sigma_x, sigma_y = self.body_size
+        while num_frames > 0:
+            n = min(chunk_size, num_frames)
+            indices = self.frame_index + np.arange(n)
+            times = self.start_time + indices / self.fps
+            drift = self.drift * np.sin(2 * np.pi * indices / self.fps / self.drift_period + self.drift_phase)
+            frames = self.background + (self.ambient + drift.astype(np.float32))[:, None, None]
+            frames += self.noise_rng.normal(0, self.noise, (n, height, width)).astype(np.float32)
+
+            positions = np.empty((n,) + self.positions.shape)
+            present = np.empty((n, len(self.positions)), dtype=bool)
+            for i in range(n):
+                self._walk()
+                positions[i] = self.positions
+                present[i] = self.present
+            # separable gaussian blobs, one outer product per person and frame
+            gx = np.exp(-(cols - positions[:, :, 0, None]) ** 2 / (2 * sigma_x ** 2))
+            gy = np.exp(-(rows - positions[:, :, 1, None]) ** 2 / (2 * sigma_y ** 2))
+            gx *= present[:, :, None]
+            frames += self.body_temperature * np.einsum("npy,npx->nyx", gy, gx).astype(np.float32)
+
+            frames[self.dropout_rng.random((n, height, width)) < self.dropout] = np.nan
+            frames.reshape(n, -1)[:, self.dead] = np.nan
+            centroids = [[(round(float(x), 2), round(float(y), 2)) for (x, y), here in zip(positions[i], present[i]) if here]
+                         for i in range(n)]
+            self.frame_index += n
+            num_frames -= n
+            yield frames, times, centroids
+
+    def generate(self, num_frames):
+        """The next num_frames frames at once, see chunks()"""
+        frames, times, centroids = [], [], []
+        for chunk in self.chunks(num_frames):
+            frames.append(chunk[0])
+            times.append(chunk[1])
+            centroids.extend(chunk[2])
+        return np.concatenate(frames), np.concatenate(times), centroids
+
+
+def save_ground_truth(path, times, centroids):
+    with open(join(path, GROUND_TRUTH_FILE), "w") as f:
+        json.dump({"times": [float(t) for t in times], "centroids": centroids}, f)
+
+def load_ground_truth(path):
+    """(times, centroids) saved with a synthetic recording, centroids as lists of (x, y) tuples"""
+    with open(join(path, GROUND_TRUTH_FILE)) as f:
+        ground_truth = json.load(f)
+    return np.array(ground_truth["times"]), [[tuple(c) for c in frame] for frame in ground_truth["centroids"]]
+
+def save_npy_folder(scene, data_path, num_frames, chunk_size=1024):
+    """Save num_frames frames of scene as one .npy per frame, named after their capture time like save_npy.
+    Frames of the same second get a _1, _2... suffix, so get_all_files still lists them in order.
+
+    Returns:
+        [str]: the saved files
+    """
+    create_folder_if_absent(data_path)
+    files, all_times, all_centroids = [], [], []
+    previous, repeat = None, 0
+    for frames, times, centroids in scene.chunks(num_frames, chunk_size):
+        for frame, t in zip(frames, times):
+            name = time.strftime(TIME_FORMAT, time.localtime(t))
+            repeat = repeat + 1 if name == previous else 0
+            previous = name
+            files.append(join(data_path, name + ("_{}".format(repeat) if repeat else "") + ".npy"))
+            np.save(files[-1], frame)
+        all_times.append(times)
+        all_centroids.extend(centroids)
+    save_ground_truth(data_path, np.concatenate(all_times), all_centroids)
+    return files
+
+def save_frame_store(scene, store_path, num_frames, chunk_size=1024):
+    """Save num_frames frames of scene to a FrameStore
+
+    Returns:
+        FrameStore
+    """
+    store = FrameStore(store_path, shape=scene.shape, chunk_size=chunk_size)
+    all_times, all_centroids = [], []
+    for frames, times, centroids in scene.chunks(num_frames, chunk_size):
+        for frame, t in zip(frames, times):
+            store.append(frame, t)
+        all_times.append(times)
+        all_centroids.extend(centroids)
+    store.close()
+    save_ground_truth(store_path, np.concatenate(all_times), all_centroids)
+    return store
+
+def recording_or_synthetic(data_path, num_frames=600, seed=0):
+    """Files of the recording in data_path if it exists, otherwise of a synthetic recording of
+    num_frames frames saved to SYNTHETIC_DATA_PATH, so tests run without the recordings in data/.
+
+    Returns:
+        [str]: .npy files in time order
+    """
+    if exists(data_path):
+        return get_all_files(data_path)
+    synthetic_path = join(SYNTHETIC_DATA_PATH, "seed{}_{}".format(seed, num_frames))
+    if not exists(synthetic_path) or not any(f.endswith(".npy") for f in listdir(synthetic_path)):
+        print("{} not found, using a synthetic recording in {}".format(data_path, synthetic_path))
+        # recordings are saved after frame_repair, so without NaN
+        save_npy_folder(SyntheticScene(seed=seed, dropout=0), synthetic_path, num_frames)
+    return [f for f in get_all_files(synthetic_path) if f.endswith(".npy")]
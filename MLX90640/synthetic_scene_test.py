@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from file_utils import get_all_files, get_frame
+from frame_store import FrameStore, convert_npy_folder
+from synthetic_scene import (SyntheticScene, load_ground_truth, save_frame_store,
+                             save_npy_folder)
+
+
+def test_reproducible():
+    frames_a, times_a, centroids_a = SyntheticScene(seed=3, num_people=2).generate(300)
+    # the same scene generated in other chunk sizes
+    scene = SyntheticScene(seed=3, num_people=2)
+    chunks = list(scene.chunks(300, chunk_size=70))
+    assert np.array_equal(np.concatenate([c[0] for c in chunks]), frames_a, equal_nan=True)
+    assert centroids_a == [c for chunk in chunks for c in chunk[2]]
+    assert np.allclose(np.diff(times_a), 0.5)
+    assert frames_a.shape == (300, 24, 32) and frames_a.dtype == np.float32
+    assert not np.array_equal(SyntheticScene(seed=4).generate(300)[0], frames_a, equal_nan=True)
+
+def test_ground_truth():
+    frames, times, centroids = SyntheticScene(seed=0, noise=0.1, dropout=0, dead_pixels=3).generate(200)
+    assert np.isnan(frames).sum() == 3 * 200
+    for frame, frame_centroids in zip(frames, centroids):
+        (x, y), = frame_centroids
+        row, col = np.unravel_index(np.nanargmax(frame), frame.shape)
+        assert abs(col - x) <= 2 and abs(row - y) <= 2
+
+def test_people_leave():
+    _, _, centroids = SyntheticScene(seed=1, visit_frames=50, absent_frames=50).generate(2000)
+    empty = sum(len(c) == 0 for c in centroids)
+    assert 0 < empty < 2000
+
+def test_save():
+    data_path = tempfile.mkdtemp()
+    files = save_npy_folder(SyntheticScene(seed=5), data_path + "/npy", 20)
+    assert get_all_files(data_path + "/npy")[:-1] == files  # plus ground_truth.json
+    times, centroids = load_ground_truth(data_path + "/npy")
+    store = save_frame_store(SyntheticScene(seed=5), data_path + "/store", 20, chunk_size=8)
+    store = FrameStore(data_path + "/store")
+    assert np.array_equal(store.frames, np.array([get_frame(f) for f in files]), equal_nan=True)
+    assert np.array_equal(store.times, times) and len(centroids) == 20
+    shutil.rmtree(data_path)
+
+def test_npy_folder_to_store(num_frames=50):
+    """Frames of the same second keep their order and times through convert_npy_folder"""
+    data_path = tempfile.mkdtemp()
+    files = save_npy_folder(SyntheticScene(seed=6, fps=4), data_path + "/npy", num_frames)
+    times, _ = load_ground_truth(data_path + "/npy")
+    store = convert_npy_folder(data_path + "/npy", data_path + "/store")
+    assert np.allclose(store.times, times)
+    assert np.array_equal(store.frames, np.array([get_frame(f) for f in files]), equal_nan=True)
+    shutil.rmtree(data_path)
+
+def test_throughput(num_frames=100000):
+    scene = SyntheticScene(num_people=2)
+    start = time.perf_counter()
+    for frames, times, centroids in scene.chunks(num_frames):
+        pass
+    print("{:.0f} frames per second".format(num_frames / (time.perf_counter() - start)))
+
+# test_reproducible()
+# test_ground_truth()
+# test_people_leave()
+# test_save()
+# test_npy_folder_to_store()
+# test_throughput()
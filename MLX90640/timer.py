@@ -1,4 +1,23 @@
+import json
+import threading
 import time
+from bisect import bisect_left
+from functools import wraps
+
+"""
+Timers, and a registry of the metrics of the long running processes.
+
+Timer measures one block of code and prints its duration. Metrics keeps, for the lifetime of
+the process, latency histograms of the stages, counters (frames captured, retries...) and
+gauges (queue depth...), and publish_every() sends a json snapshot of them to an MQTT topic
+periodically, e.g. the health topic read by the NUC.
+
+Recording is cheap: a histogram is an array of counts over fixed power of two buckets, so
+observing a value is a binary search over BUCKETS and a few additions, a couple of microseconds
+with the lock, against hundreds of milliseconds per frame.
+"""
+
+BUCKETS = [2.0 ** e for e in range(-20, 31)]  # upper bounds, about 1 us to 1e9 (seconds or bytes)
 
 
 class TimerError(Exception):
@@ -11,10 +30,12 @@ class Timer:
         self,
         name=None,
         text="Elapsed time: {:0.4f} seconds",
+        metrics=None,
     ):
         self._start_time = None
         self.name = name
         self.text = text
+        self.metrics = metrics  # the latency histogram of `name` in this Metrics is updated on stop()
 
         # Add new named timers to dictionary of timers
         if name:
@@ -26,7 +47,7 @@ class Timer:
 
         self._start_time = time.perf_counter()
 
-    def stop(self, message):
+    def stop(self, message=None):
         """Stop the timer, and report the elapsed time"""
         if self._start_time is None:
             raise TimerError(f"Timer is not running. Use .start() to start it")
@@ -36,5 +57,179 @@ class Timer:
 
         if self.name:
             self.timers[self.name] += elapsed_time
+            if self.metrics is not None:
+                self.metrics.observe(self.name, elapsed_time)
+
+        if message is not None:
+            print(message, elapsed_time)
+        elif self.metrics is None:
+            print(self.text.format(elapsed_time))
+        return elapsed_time
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one counts values above BUCKETS[-1]
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Upper bound of the bucket of the q-th percentile (0-100), so within a factor of 2"""
+        if self.count == 0:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        if self.count == 0:
+            return {"count": 0}
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count, "min": self.min,
+                "max": self.max, "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99)}
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+NO_TIMER = _NoTimer()
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    def __init__(self, enabled=True):
+        """
+        Args:
+            enabled (bool, optional): when False, recording does nothing. Defaults to True.
+        """
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+        self._lock = threading.Lock()  # frames are analyzed in another thread than the MQTT callbacks
+        self._publisher = None
+
+    def observe(self, name, value):
+        """Add value, e.g. a latency in seconds or a size in bytes, to the histogram of name"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def timer(self, name):
+        """Context manager adding the duration of its block to the histogram of name:
+
+            with metrics.timer("add_frame"):
+                analyzer.add_frame(frame)
+        """
+        return _StageTimer(self, name) if self.enabled else NO_TIMER
+
+    def timed(self, name=None):
+        """Decorator adding the duration of every call to the histogram of name, defaults to the function name"""
+        def decorator(function):
+            histogram_name = name or function.__name__
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(histogram_name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self, reset=False):
+        """Every metric as a json serializable dict. With reset, histograms and counters start over."""
+        with self._lock:
+            snapshot = {
+                "time": time.time(),
+                "uptime": time.time() - self.started,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+            if reset:
+                self.histograms = {}
+                self.counters = {}
+        return snapshot
+
+    def publish_every(self, client, topic, interval=60):
+        """Publish a snapshot as json to topic every interval seconds from a background thread.
+        client is a paho MQTT client, or anything with publish(topic, payload)."""
+        self.stop_publishing()
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    client.publish(topic, json.dumps(self.snapshot()))
+                except Exception as e:
+                    print("Could not publish metrics: {}".format(e))
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._publisher = (stop, thread)
+
+    def stop_publishing(self):
+        if self._publisher is not None:
+            stop, thread = self._publisher
+            stop.set()
+            thread.join()
+            self._publisher = None
 
-        print(message, elapsed_time)
+metrics = Metrics()  # registry of the process, shared by the modules it runs
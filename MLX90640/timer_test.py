@@ -0,0 +1,92 @@
+import json
+import time
+
+import numpy as np
+
+from centroid_history import DisplacementAnalyzer
+from synthetic_scene import SyntheticScene
+from timer import Histogram, Metrics, Timer
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+
+def test_histogram():
+    histogram = Histogram()
+    for value in np.linspace(0.001, 0.1, 1000):
+        histogram.observe(value)
+    assert histogram.count == 1000 and np.isclose(histogram.sum, 50.5)
+    # within a factor of 2 of the exact percentiles
+    for q in (50, 95, 99):
+        exact = np.percentile(np.linspace(0.001, 0.1, 1000), q)
+        assert exact <= histogram.percentile(q) <= 2 * exact
+
+def test_metrics():
+    metrics = Metrics()
+    with metrics.timer("stage"):
+        time.sleep(0.01)
+
+    @metrics.timed()
+    def encode(n):
+        return b"0" * n
+    encode(10)
+    metrics.count("frames_captured", 3)
+    metrics.count("frames_captured")
+    metrics.gauge("ring_depth", 7)
+    t = Timer("godec", metrics=metrics)
+    t.start()
+    t.stop()
+
+    snapshot = json.loads(json.dumps(metrics.snapshot(reset=True)))
+    assert snapshot["counters"] == {"frames_captured": 4} and snapshot["gauges"] == {"ring_depth": 7}
+    assert snapshot["histograms"]["stage"]["min"] >= 0.01
+    assert snapshot["histograms"]["encode"]["count"] == 1 and snapshot["histograms"]["godec"]["count"] == 1
+    assert metrics.snapshot()["counters"] == {}
+
+    disabled = Metrics(enabled=False)
+    with disabled.timer("stage"):
+        disabled.count("frames_captured")
+    assert disabled.snapshot()["histograms"] == {} and disabled.snapshot()["counters"] == {}
+
+def test_publish_every():
+    metrics = Metrics()
+    client = FakeClient()
+    metrics.count("frames_captured")
+    metrics.publish_every(client, "health/kjhouse/bedroom", interval=0.05)
+    time.sleep(0.3)
+    metrics.stop_publishing()
+    assert len(client.published) >= 2
+    topic, payload = client.published[-1]
+    assert topic == "health/kjhouse/bedroom" and json.loads(payload)["counters"] == {"frames_captured": 1}
+
+def test_overhead(num_frames=100, fps=2):
+    """Recording the metrics of a frame should cost under 1% of the time between two frames,
+    it is also printed relative to the time spent analyzing a frame"""
+    frames, times, _ = SyntheticScene(dropout=0).generate(num_frames)
+    analyzer = DisplacementAnalyzer("2020.07.14_081300")
+    start = time.perf_counter()
+    for frame, timestamp in zip(frames, times):
+        analyzer.add_frame(frame, timestamp)
+    frame_time = (time.perf_counter() - start) / num_frames
+
+    metrics = Metrics()
+    start = time.perf_counter()
+    for i in range(10000):
+        # what main.consume_frames records for every frame
+        metrics.gauge("ring_depth", i)
+        with metrics.timer("add_frame"):
+            pass
+        metrics.observe("frame_latency", 0.01)
+    overhead = (time.perf_counter() - start) / 10000
+    print("{:.1f} us of metrics per frame, {:.3%} of the {:.2f} ms analysis of a frame".format(
+        overhead * 1e6, overhead / frame_time, frame_time * 1e3))
+    assert overhead < 0.01 / fps
+
+# test_histogram()
+# test_metrics()
+# test_publish_every()
+# test_overhead()
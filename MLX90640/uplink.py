@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from os.path import exists, join
+from socket import *
+from struct import pack
+
+from file_utils import create_folder_if_absent
+
+"""
+Uplink from the RPi to the NUC tcp_server.
+
+Payloads use the same framing as ClientProtocol: an 8 byte '>Q' length, the payload, and a 1 byte
+ack from the server. The differences are that
+- one connection is kept open and reused for every payload,
+- once the server has acked a first payload on the connection, up to `window` payloads are sent
+  before waiting for their acks. Every payload gets a sequence
+  number, and since the server acks the payloads of a connection in order, the n-th ack received
+  acknowledges the n-th payload sent on that connection,
+- every payload is first written to a bounded on-disk spool and only deleted once acked, so
+  payloads survive the NUC being down, the connection dropping, or the RPi rebooting. They are
+  replayed in order once the NUC is reachable again, reconnecting with exponential backoff.
+send() only writes to the spool, so it never blocks the MQTT loop.
+"""
+
+SPOOL_EXTENSION = ".msg"
+
+
+class UplinkClient:
+    def __init__(self, server_ip, server_port, spool_dir="uplink_spool", max_spooled=1000, window=8,
+                 min_backoff=1, max_backoff=60, timeout=30):
+        """
+        Args:
+            server_ip (str)
+            server_port (int)
+            spool_dir (str, optional): folder of payloads waiting for an ack. Defaults to "uplink_spool".
+            max_spooled (int, optional): the oldest payloads are dropped past this many. Defaults to 1000.
+            window (int, optional): maximum number of payloads sent and not acked yet. Defaults to 8.
+            min_backoff (float, optional): seconds before the first reconnection attempt. Defaults to 1.
+            max_backoff (float, optional): upper bound of the wait between reconnection attempts. Defaults to 60.
+            timeout (float, optional): seconds to wait for an ack before reconnecting. Defaults to 30.
+        """
+        self.server_address = (server_ip, server_port)
+        self.spool_dir = spool_dir
+        self.max_spooled = max_spooled
+        self.window = window
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        create_folder_if_absent(spool_dir)
+        # payloads left from a previous run are replayed first
+        self.spooled = deque(sorted(int(f[:-len(SPOOL_EXTENSION)]) for f in os.listdir(spool_dir) if f.endswith(SPOOL_EXTENSION)))
+        self.next_seq = self.spooled[-1] + 1 if self.spooled else 0
+        self.dropped = 0
+
+        self.socket = None
+        self.in_flight = deque()  # sequence numbers sent on the current connection, oldest first
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def spool_path(self, seq):
+        return join(self.spool_dir, "{:012d}{}".format(seq, SPOOL_EXTENSION))
+
+    def send(self, data):
+        """Queue a payload for the NUC, returns its sequence number"""
+        with self._condition:
+            seq = self.next_seq
+            self.next_seq += 1
+            tmp_path = self.spool_path(seq) + ".tmp"
+            with open(tmp_path, "wb") as spool_file:
+                spool_file.write(data)
+            os.replace(tmp_path, self.spool_path(seq))
+            self.spooled.append(seq)
+
+            # drop the oldest payloads that are not on the wire already
+            while len(self.spooled) > max(self.max_spooled, len(self.in_flight)):
+                oldest = self.spooled[len(self.in_flight)]
+                del self.spooled[len(self.in_flight)]
+                os.remove(self.spool_path(oldest))
+                self.dropped += 1
+                print("Uplink spool is full, dropped payload {}".format(oldest))
+            self._condition.notify()
+        return seq
+
+    def pending(self):
+        """Number of payloads not acked yet"""
+        with self._condition:
+            return len(self.spooled)
+
+    def flush(self, timeout=None):
+        """Wait until every payload has been acked, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.spooled:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self.socket is not None:
+            try:
+                self.socket.shutdown(SHUT_RDWR)  # wakes the thread up if it is waiting for an ack
+            except OSError:
+                pass
+        self._thread.join()
+        self._disconnect()
+
+    def _connect(self):
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.settimeout(self.timeout)
+        self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        self.socket.connect(self.server_address)
+        print("Connected to TCP Server")
+
+    def _disconnect(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+        with self._condition:
+            self.in_flight.clear()  # payloads not acked are still spooled, they are sent again
+
+    def _send_window(self, window):
+        """Send spooled payloads until `window` of them are waiting for an ack"""
+        while True:
+            with self._condition:
+                if len(self.in_flight) >= window or len(self.in_flight) >= len(self.spooled):
+                    return
+                seq = self.spooled[len(self.in_flight)]
+                self.in_flight.append(seq)
+            with open(self.spool_path(seq), "rb") as spool_file:
+                data = spool_file.read()
+            # use struct to make sure we have a consistent endianness on the length
+            self.socket.sendall(pack('>Q', len(data)) + data)
+
+    def _receive_acks(self):
+        """Wait for at least one ack, returns the number of payloads acked"""
+        acks = self.socket.recv(len(self.in_flight))
+        if not acks:
+            raise ConnectionError("Connection closed by the server")
+        with self._condition:
+            for i in range(len(acks)):
+                seq = self.in_flight.popleft()
+                if self.spooled and self.spooled[0] == seq:
+                    self.spooled.popleft()
+                if exists(self.spool_path(seq)):
+                    os.remove(self.spool_path(seq))
+            self._condition.notify_all()
+        return len(acks)
+
+    def _run(self):
+        backoff = self.min_backoff
+        acked = 0  # payloads acked on the current connection
+        while True:
+            with self._condition:
+                while self._running and not self.spooled:
+                    self._condition.wait()
+                if not self._running:
+                    return
+            try:
+                if self.socket is None:
+                    acked = 0
+                    self._connect()
+                # a single payload until the server has acked one, the old server closes the connection after each
+                self._send_window(self.window if acked else 1)
+                acked += self._receive_acks()
+                backoff = self.min_backoff
+            except OSError as e:
+                # refused connections, resets, ack timeouts and servers closing the connection
+                self._disconnect()
+                if acked:
+                    continue  # e.g. a server that closes after every payload, reconnect right away
+                with self._condition:
+                    if not self._running:
+                        return
+                    print("Uplink to {}:{} failed ({}), retrying in {:.1f}s".format(*self.server_address, e, backoff))
+                    self._condition.wait(backoff * random.uniform(0.5, 1))
+                backoff = min(backoff * 2, self.max_backoff)
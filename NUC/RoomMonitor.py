@@ -2,7 +2,7 @@ from statemachine import StateMachine, State
 
 BED_ROOM = "bedroom"
 LIVING_ROOM = "livingroom"
-KITCHEN = "Kitchen"
+KITCHEN = "kitchen"
 OUTSIDE = "exit"
 TOILET = "toilet"
 
@@ -1,22 +1,16 @@
+import json
+import os
 import time
 from datetime import datetime
 
 import numpy as np
 import paho.mqtt.client as mqtt
 
-from RoomMonitor import (BED_ROOM, KITCHEN, LIVING_ROOM, OUTSIDE, TOILET,
-                         RoomMonitor)
+from RoomMonitor import (BED_ROOM, KITCHEN, LIVING_ROOM, OUTSIDE, ROOM_TYPES,
+                         TOILET)
+from room_engine import NO_CHANGE, RoomEngine
 
 
-def bitfield(n):
-    return [1 if digit=='1' else 0 for digit in bin(n)[2:]]
-
-def Log2(x): 
-    return (math.log10(x) / math.log10(2))
-    
-def isPowerOfTwo(n): 
-    return (math.ceil(Log2(n)) == math.floor(Log2(n)))
-
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print ("Connection OK!")
@@ -26,76 +20,12 @@ def on_connect(client, userdata, flags, rc):
 def on_disconnect(client, userdata, flags, rc=0):
     print("Disconnected result code " + str(rc))
 
-def send_msg_if_room_changed(state_value: int, last: str, topic: str, state_machine):
-    # TODO: I believe this can be refactored better if we have extra time.
-    if state_value == 1:
-        new = 'bedroom'
-    elif state_value == 2:
-        new = 'livingroom'
-    elif state_value == 4:
-        new = 'Kitchen'
-    elif state_value == 8:
-        new = 'Toilet'
-    elif state_value == 16:
-        new = 'exit'
-    else:
-        return last, False
-
-    if last == 'bedroom' and new == 'Toilet':
-        state_machine.bed2toilet()
-        last = new
-    elif last =='Toilet' and new == 'bedroom':
-        state_machine.toilet2bed()
-        last = new
-    elif last == 'bedroom' and new == 'livingroom':
-        state_machine.bed2liv()
-        last = new
-    elif last == 'livingroom' and new == 'bedroom':
-        statemachine.liv2bed()
-        last = new
-    elif last == 'livingroom' and new == 'toilet':
-        statemachine.liv2toilet()
-        last = new
-    elif last == 'toilet' and new == 'livingroom':
-        statemachine.toilet2liv()
-        last = new
-    elif last == 'livingroom' and new == 'exit':
-        statemachine.liv2out()
-        last = new
-    elif last == 'exit' and new == 'livingroom':
-        statemachine.out2liv()
-        last = new
-    else:
-        return last, False
-
-    print(state_machine.current_state.name)
-    client.publish(topic, state_machine.current_state.name)
-    last = new
-    return last, True
-
 def bps_callback(msg):
-    if msg == "0" or msg == "1":
-        binary_dict[room_type] = int(msg)
-        state_value = 0
-    for x in weight_dict:
-        state_value += weight_dict[x] * binary_dict[x]
-    if isPowerOfTwo(state_value):
-        for x in binary_dict:
-            if x == room_type:
-                binary_dict[x] = 1
-            else:
-                binary_dict[x] = 0
-    print(binary_dict)
-    print("=============================")
-    val = 0
-    for room in weight_arr:
-        val = val + int(binary_dict[room])*int(weight_dict[room])
-    
-    try:
-        last_visited, room_changed = send_msg_if_room_changed(val, last_visited, topic, state_machine)
-        print(state_machine.current_state.name)
-    except ValueError:
-        print("Invalid string")
+    """Update the room the person is in from a BPS reading, and publish it if it changed"""
+    new_room = room_engine.handle_message(msg.topic, msg.payload)
+    if new_room != NO_CHANGE:
+        print(ROOM_TYPES[new_room])
+        client.publish(STATE_TOPIC, ROOM_TYPES[new_room])
 
 def rpi_callback(msg):
     """Save the received 
@@ -105,18 +35,40 @@ def rpi_callback(msg):
     """
 
 def inform_health_callback(msg):
-    """TODO: To inform that devices pinged are still alive.
-    Should assume all devices are down until devices pinged that they are alive.
-    This health status should be transmitted to somewhere that can be accessded remotely
+    """Record the metrics snapshot an RPi publishes every minute on health/<house id>/<room>,
+    see Metrics.publish_every in MLX90640/timer.py. A device is assumed down until it sent one,
+    see down_devices().
+    TODO: This health status should be transmitted to somewhere that can be accessded remotely
     so that the hardware technicians can go down to check.
 
     Args:
-        msg ([type]): [description]
+        msg (MQTTMessage): json snapshot with "counters", "gauges" and "histograms"
     """
-    pass
+    device_type, house_id, room_type = msg.topic.split("/")
+    try:
+        snapshot = json.loads(msg.payload.decode("utf-8", "ignore"))
+        counters = snapshot["counters"]
+    except (ValueError, KeyError, TypeError):
+        print("Malformed health snapshot from {}".format(room_type))
+        return
+    device_health[room_type] = (time.time(), snapshot)
+    add_frame = snapshot.get("histograms", {}).get("add_frame", {})
+    print("Health of {}: {} frames captured, {} dropped, {} retries, add_frame p95 {}".format(
+        room_type, counters.get("frames_captured", 0), counters.get("frames_dropped", 0),
+        counters.get("collect_retries", 0), add_frame.get("p95")))
+
+def down_devices(now=None):
+    """Rooms whose device has not sent a health snapshot for HEALTH_TIMEOUT_SECONDS, or never did"""
+    now = time.time() if now is None else now
+    return [room for room in topics
+            if room not in device_health or now - device_health[room][0] > HEALTH_TIMEOUT_SECONDS]
 
 def on_message(client,userdata, msg):
     topic=msg.topic
+    if topic in room_engine.topic_bits:
+        # BPS readings are the bulk of the messages, they are handled without parsing the topic
+        bps_callback(msg)
+        return
     m_decode=str(msg.payload.decode("utf-8","ignore"))
     try:
         device_type, house_id, room_type = topic.split("/")
@@ -132,13 +84,23 @@ def on_message(client,userdata, msg):
     except Exception:
         print("Topic of message is malformed.")
 
+HOUSE_ID = "kjhouse"
+DEVICE_TYPE = "NUC"
+STATE_TOPIC = "nuc/" + HOUSE_ID  # room changes, same topic as main_new
+HEALTH_TIMEOUT_SECONDS = 180  # RPis publish a health snapshot every minute
+device_health = {}  # room -> (time received, last health snapshot of its RPi)
+
+# State machine of the room the person is in, from the transitions of RoomMonitor
+room_engine = RoomEngine(HOUSE_ID)
+print("original state :", room_engine.current_room)
+
 # MQTT Setup
 client_name = "swcannotconnecthalp" 
 client = mqtt.Client(client_name)
 
-# Connect to broker
-BROKER = "13.229.212.221"
-PORT   = 1883
+# Connect to broker, MQTT_BROKER / MQTT_PORT point the NUC at another one, e.g. mqtt_broker.py for tests
+BROKER = os.environ.get("MQTT_BROKER", "13.229.212.221")
+PORT   = int(os.environ.get("MQTT_PORT", 1883))
 
 # Attach MQTT Client callback functions 
 client.on_connect    = on_connect
@@ -150,9 +112,7 @@ client.connect(BROKER, PORT)
 client.loop_start()
 
 # Subscribe to topics
-HOUSE_ID = "kjhouse"
-DEVICE_TYPE = "NUC"
-sensors = ["bps", "mlx"]
+sensors = ["bps", "mlx", "health"]
 topics = [LIVING_ROOM, BED_ROOM, OUTSIDE, TOILET, KITCHEN]
 
 for sensor in sensors:
@@ -163,16 +123,9 @@ for sensor in sensors:
 
 client.publish("/".join([DEVICE_TYPE, HOUSE_ID, topic]), "Started NUC!")
 
-# State Machine and monitoring setup
-state_machine  = RoomMonitor()
-print("original state :", state_machine.current_state)
-initial_room = state_machine.current_state.name
-last_visited = initial_room
-
 print("Monitoring Presence...")
-weight_arr = [BED_ROOM, LIVING_ROOM, KITCHEN, OUTSIDE, TOILET]
-weight_dict = {weight_arr[i] : 2**i for i in range(5)} 
-binary_dict = {weight_arr[i] : 0 for i in range(5)}
-
 while True:
-    print(binary_dict)
+    time.sleep(HEALTH_TIMEOUT_SECONDS)
+    down = down_devices()
+    if down:
+        print("No health snapshot from the RPis of: {}".format(", ".join(down)))
@@ -5,7 +5,8 @@ from datetime import datetime
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy.interpolate
-import scipy.signal
+
+from resample import fft_resample
 
 
 """
@@ -34,49 +35,124 @@ def join_dictionaries(dictionaries):
 
     return biggus_dictus
 
-def get_activity_levels(data, debug=False, name=""):
-    """Produce activity levels plot based on one time interval
-    # Iterate through keys to perform resampling, then stitch together based on timestamps
+TIME_FORMAT = "%Y.%m.%d_%H%M%S"
+DAY_SECONDS = 86400
+LEVELS_SECONDS = DAY_SECONDS - 1  # the levels were always computed over 86399 seconds, e.g. 82800 values of "out"
+HOURLY_WINDOW = 3600  # width of the rect function of "out"
+ACTIVITY_WINDOWS = (300, 1800)  # 5 min and 30 min, on top of the hourly "out"
+
+MAX_GAP_SECONDS = 2  # empty seconds between two frames are interpolated up to this gap
+
+def bin_to_seconds(offsets, values, seconds):
+    """Displacement of one room visit on a 1 second grid from the capture time of every frame, in O(n).
+    Each second is the mean of the frames captured during it. Seconds without a frame are
+    interpolated between their neighbours when the gap is at most MAX_GAP_SECONDS, 0 otherwise.
+
     Args:
-        data (dict): compiled displacement dictionary for one time interval
-        debug (bool): whether the plot is shown for that time interval
+        offsets (np.ndarray): capture time of every frame, in seconds since the start of the visit
+        values (np.ndarray): displacement of every frame
+        seconds (int): length of the grid
+
+    Returns:
+        np.ndarray: `seconds` values
+    """
+    index = np.floor(offsets).astype(np.int64)
+    inside = (index >= 0) & (index < seconds)
+    index, values = index[inside], values[inside]
+    counts = np.bincount(index, minlength=seconds)
+    sums = np.bincount(index, weights=values, minlength=seconds)
+    occupied = np.flatnonzero(counts)
+    out = np.zeros(seconds)
+    out[occupied] = sums[occupied] / counts[occupied]
+
+    if 0 < len(occupied) < seconds:
+        empty = np.flatnonzero(counts == 0)
+        after = np.searchsorted(occupied, empty)
+        # empty seconds before the first frame or after the last one stay 0
+        inner = (after > 0) & (after < len(occupied))
+        empty, after = empty[inner], after[inner]
+        gap = occupied[after] - occupied[after - 1] - 1
+        fill = gap <= MAX_GAP_SECONDS
+        out[empty[fill]] = np.interp(empty[fill], occupied, out[occupied])
+    return out
+
+def resample_segment(segment):
+    """Displacement of one room visit resampled to one value per second.
+    Payloads with "timestamps" (seconds since "start" of every value of "frames") are binned,
+    older payloads fall back to FFT resampling."""
+    seconds = int(segment['timeElapsedInSeconds'])
+    frames = np.asarray(segment['frames'], dtype=np.float64)
+    if seconds <= 0 or len(frames) == 0:
+        return np.zeros(max(seconds, 0))
+    timestamps = segment.get('timestamps')
+    if timestamps is not None and len(timestamps) == len(frames):
+        return bin_to_seconds(np.asarray(timestamps, dtype=np.float64), frames, seconds)
+    return fft_resample(frames, seconds)
+
+def build_day_timeline(data, length=DAY_SECONDS):
+    """Displacement of every second of the day, zero where nothing was recorded.
+    Each room visit is resampled to one value per second and written at its offset from midnight.
+
+    Args:
+        data (dict): compiled displacement dictionary for one day
+        length (int, optional): number of seconds in the timeline. Defaults to DAY_SECONDS.
+
+    Returns:
+        (np.ndarray, int): the timeline and the total number of frames
     """
-    activity = []
-    end_time = 0
+    activity = np.zeros(length)
     total_frames = 0
-    
+    first = data[list(data.keys())[0]]['start']
+    midnight = datetime.strptime(first[:-6] + '000000', TIME_FORMAT)
+
     for i in data.keys():
-        data[i]['frames'] = scipy.signal.resample(np.array(data[i]['frames']), int(data[i]['timeElapsedInSeconds']))
-        if int(i) != 1:
-            zeropad  =  datetime.strptime(data[i]['start'], "%Y.%m.%d_%H%M%S") - datetime.strptime(data[str(int(i)-1)]['end'], "%Y.%m.%d_%H%M%S")
-            zeropad  =  zeropad.total_seconds() #add zeros for missing frames from previous data
-            # print(zeropad)
-            zeropad  = list(np.zeros(int(zeropad)))
-            activity = activity + zeropad
-
-        elif int(i) == 1:
-            start    = data[i]['start'][:-6] + '000000'
-            zeropad  = datetime.strptime(data[i]['start'], "%Y.%m.%d_%H%M%S") - datetime.strptime(start, "%Y.%m.%d_%H%M%S")
-            zeropad  = zeropad.total_seconds()
-            # print(zeropad)
-            zeropad  = list(np.zeros(int(zeropad)))
-            activity = activity + zeropad #add zeros for missing frames from start of the day
-            
-        activity = activity + list(data[i]['frames'])
+        frames = resample_segment(data[i])
+        offset = int((datetime.strptime(data[i]['start'], TIME_FORMAT) - midnight).total_seconds())
+        # visits running past the end of the day are cut
+        end = min(offset + len(frames), length)
+        if end > offset:
+            activity[offset:end] = frames[:end - offset]
         total_frames += data[i]['numFrames']
-    if len(activity) < 86399:
-        activity = activity + list(np.zeros(86399-len(activity)))
-    activity = np.array(activity) # Convert list to nparray
+    return activity, total_frames
+
+def moving_window_sums(activity, widths=ACTIVITY_WINDOWS):
+    """Sum of activity over every window of each width, like np.correlate(activity, np.ones(width), 'valid').
+    One cumulative sum is shared by all widths, so each window costs O(N) instead of O(N * width).
+
+    Args:
+        activity (np.ndarray): timeline from build_day_timeline
+        widths (iterable of int, optional): window widths in seconds. Defaults to ACTIVITY_WINDOWS.
+
+    Returns:
+        dict: width -> array of len(activity) - width + 1 sums
+    """
+    cumsum = np.concatenate(([0.0], np.cumsum(activity)))
+    return {width: cumsum[width:] - cumsum[:-width] for width in widths}
+
+def get_activity_levels(data, debug=False, name="", windows=()):
+    """Produce activity levels plot based on one time interval
+    # Resample every room visit and write it into the timeline of the day by its start time
+    Args:
+        data (dict): compiled displacement dictionary for one time interval
+        debug (bool): whether the plot is shown for that time interval
+        windows (iterable of int, optional): widths in seconds of moving windows saved under "windows"
+            besides the hourly "out", e.g. ACTIVITY_WINDOWS. Defaults to (), only "out" is saved, as
+            every window can be recomputed from it with moving_window_sums of the day timeline.
+    """
+    activity, total_frames = build_day_timeline(data)
+    windows = sorted(set(windows) - {HOURLY_WINDOW})
+    # activity per window, scaled like "out"
+    levels = {width: sums / (width / 10)
+              for width, sums in moving_window_sums(activity[:LEVELS_SECONDS], windows + [HOURLY_WINDOW]).items()}
 
-    width = 3600 # Rect function width
-    rect  = np.ones(width)
+    width = HOURLY_WINDOW # Rect function width
     # Generate activity data
     xnew = np.linspace(0,len(activity),len(activity))
 
     offset = (width/2)-1
     xaxis = np.linspace(offset, np.size(activity)-offset, np.size(activity)-width+1)
 
-    out = np.dot(np.correlate(activity, rect, 'valid'), 1/(width/10))
+    out = levels[width]
     start_time = data[list(data.keys())[0]]['start']
     end_time = data[list(data.keys())[-1]]['end']
     date, room = name.split(" ")
@@ -101,6 +177,8 @@ def get_activity_levels(data, debug=False, name=""):
             "start": start_time,
             "end": end_time,
             "numFrames": total_frames,
-            "out": list(out)
+            "out": out.tolist(),
         }
+        if windows:
+            dictionary["windows"] = {str(w): levels[w].tolist() for w in windows}
         json.dump(dictionary, outfile)
@@ -1,13 +1,54 @@
-from activity_levels import get_activity_levels, stitch_data
+import json
 
-def test_stitch_data():
+import numpy as np
+
+from activity_levels import (bin_to_seconds, build_day_timeline,
+                             get_activity_levels, join_dictionaries,
+                             moving_window_sums, resample_segment)
+
+def test_join_dictionaries():
     test_list = [{'0907': ['a', 'b', 'c'], '0906': ['d', 'e', 'f'], '0910': ['g', 'h', 'i']}, {'0901': ['j', 'k', 'l'], '0902': ['m', 'n', 'o']}, {'0904': ['p', 'q', 'r']}]
-    print(stitch_data(test_list))
+    print(join_dictionaries(test_list))
 
 def test_activity_levels():
     data_path = "./sample_activity_levels/new_format/2020.07.16.json"
     with open(data_path) as json_file:
         data = json.load(json_file)
     get_activity_levels(data, debug=True)
-        
-test_stitch_data()
\ No newline at end of file
+
+
+def test_moving_window_sums():
+    activity = np.random.rand(86400)
+    sums = moving_window_sums(activity, widths=(300, 3600))
+    for width in (300, 3600):
+        assert np.allclose(sums[width], np.correlate(activity, np.ones(width), 'valid'))
+
+def test_build_day_timeline():
+    data = {"1": {"start": "2020.07.14_000010", "end": "2020.07.14_000015", "timeElapsedInSeconds": 5, "numFrames": 2, "frames": [1.0, 1.0]},
+            "2": {"start": "2020.07.14_235958", "end": "2020.07.15_000003", "timeElapsedInSeconds": 5, "numFrames": 3, "frames": [2.0, 2.0, 2.0]}}
+    activity, total_frames = build_day_timeline(data)
+    assert len(activity) == 86400 and total_frames == 5
+    assert np.allclose(activity[10:15], 1) and activity[:10].sum() == 0 and activity[15:86398].sum() == 0
+    assert np.allclose(activity[86398:], 2)  # cut at midnight
+
+def test_bin_to_seconds():
+    # 2 Hz frames with a 1 second gap after the third second and a 4 second gap after the sixth
+    offsets = np.array([0.1, 0.6, 1.1, 1.6, 2.1, 2.6, 4.1, 4.6, 5.1, 5.6, 10.1])
+    values = np.array([1, 3, 2, 2, 2, 4, 1, 1, 5, 5, 9], dtype=float)
+    out = bin_to_seconds(offsets, values, 12)
+    assert np.allclose(out, [2, 2, 3, 2, 1, 5, 0, 0, 0, 0, 9, 0])
+
+def test_resample_segment():
+    legacy = {"timeElapsedInSeconds": 7207, "frames": list(np.random.rand(14000))}
+    assert len(resample_segment(legacy)) == 7207
+    timed = dict(legacy, timestamps=list(np.linspace(0, 7206.9, 14000)))
+    assert np.isclose(resample_segment(timed).mean(), np.mean(legacy["frames"]), rtol=0.01)
+
+def test_resample_short_segment():
+    """Visits of less than 4 frames without timestamps are interpolated, the FFT would overshoot"""
+    for frames in ([1.0], [1.0, 2.0], [0.0, 2.0, 1.0]):
+        out = resample_segment({"timeElapsedInSeconds": 7, "frames": frames})
+        assert len(out) == 7 and out[0] == frames[0]
+        assert min(frames) <= out.min() and out.max() <= max(frames)
+
+# test_join_dictionaries()
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+from activity_levels import (ACTIVITY_WINDOWS, DAY_SECONDS, HOURLY_WINDOW,
+                             LEVELS_SECONDS, TIME_FORMAT, resample_segment)
+
+"""
+Activity levels of the current day, kept up to date as displacement segments arrive.
+
+Instead of re-reading every json of the day at midnight and recomputing get_activity_levels,
+the NUC keeps one DailyActivityTimeline per room and per day. Each segment received by the
+TCP server is resampled and written into the timeline as soon as it is stored, and only the
+moving window sums overlapping the new seconds are recomputed, so the activity of the current
+day can be queried at any time. At midnight the finished day is saved in the same format as
+get_activity_levels.
+"""
+
+DATE_FORMAT = "%Y.%m.%d"
+
+
+class DailyActivityTimeline:
+    def __init__(self, date, room, windows=ACTIVITY_WINDOWS):
+        """
+        Args:
+            date (str): "%Y.%m.%d"
+            room (str): room type
+            windows (iterable of int, optional): widths in seconds of the moving windows kept up to date
+                besides the hourly one, for levels(). Defaults to ACTIVITY_WINDOWS.
+        """
+        self.date = date
+        self.room = room
+        self.windows = sorted(set(windows) | {HOURLY_WINDOW})
+        self.activity = np.zeros(DAY_SECONDS)
+        self.covered = np.zeros(DAY_SECONDS, dtype=bool)  # seconds for which a segment was received
+        self.sums = {width: np.zeros(DAY_SECONDS - width + 1) for width in self.windows}
+        self.start = None
+        self.end = None
+        self.num_frames = 0
+        self.segments = set()  # start of the segments already merged
+
+    def add_values(self, offset, values):
+        """Write per-second displacement values starting `offset` seconds after midnight,
+        and update the window sums that overlap them. Values past midnight are cut."""
+        end = min(offset + len(values), DAY_SECONDS)
+        if end <= offset:
+            return
+        self.activity[offset:end] = values[:end - offset]
+        self.covered[offset:end] = True
+
+        for width, sums in self.sums.items():
+            # windows starting in [first, last) contain at least one of the new seconds
+            first = max(0, offset - width + 1)
+            last = min(end, len(sums))
+            cumsum = np.concatenate(([0.0], np.cumsum(self.activity[first:last + width - 1])))
+            sums[first:last] = cumsum[width:width + last - first] - cumsum[:last - first]
+
+    def add_segment(self, segment):
+        """Merge a displacement segment as sent by an RPi, only the part within this day is kept.
+        The frames of a segment across midnight are split between the days by the time spent in each.
+        A segment already merged, e.g. received again after a lost ack, is ignored."""
+        if segment['start'] in self.segments:
+            return
+        self.segments.add(segment['start'])
+        midnight = datetime.strptime(self.date, DATE_FORMAT)
+        offset = int((datetime.strptime(segment['start'], TIME_FORMAT) - midnight).total_seconds())
+        values = resample_segment(segment)
+        elapsed = max(int(segment['timeElapsedInSeconds']), 1)
+        first = min(max(-offset, 0), elapsed)  # seconds of the segment before this day
+        last = min(max(DAY_SECONDS - offset, 0), elapsed)  # seconds of the segment before the next day
+        # frames up to a time of the segment are rounded the same way for both days, so they add up
+        frames = segment['numFrames']
+        self.num_frames += round(frames * last / elapsed) - round(frames * first / elapsed)
+        if offset < 0:
+            values = values[-offset:]
+            offset = 0
+        self.add_values(offset, values)
+        self.start = segment['start'] if self.start is None else min(self.start, segment['start'])
+        self.end = segment['end'] if self.end is None else max(self.end, segment['end'])
+
+    def levels(self, width=HOURLY_WINDOW):
+        """Activity over every window of `width` seconds, scaled like "out" of get_activity_levels"""
+        return self.sums[width][:LEVELS_SECONDS - width + 1] / (width / 10)
+
+    def to_dict(self, windows=()):
+        """Same content as the file saved by get_activity_levels with the same windows, which must
+        be kept by this timeline"""
+        dictionary = {
+            "start": self.start,
+            "end": self.end,
+            "numFrames": self.num_frames,
+            "out": self.levels().tolist(),
+        }
+        windows = sorted(set(windows) - {HOURLY_WINDOW})
+        if windows:
+            dictionary["windows"] = {str(w): self.levels(w).tolist() for w in windows}
+        return dictionary
+
+    def save(self, output_dir="analysis_results"):
+        folder = os.path.join(output_dir, self.date)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        path_to_save = os.path.join(folder, self.room + ".json")
+        print("saving analysis result to: ", path_to_save)
+        with open(path_to_save, 'w+') as outfile:
+            json.dump(self.to_dict(), outfile)
+        return path_to_save
+
+
+class ActivityTimelines:
+    def __init__(self, windows=ACTIVITY_WINDOWS):
+        """One DailyActivityTimeline per (date, room), created when the first segment arrives"""
+        self.windows = windows
+        self.timelines = {}
+
+    def get(self, date, room):
+        if (date, room) not in self.timelines:
+            self.timelines[(date, room)] = DailyActivityTimeline(date, room, self.windows)
+        return self.timelines[(date, room)]
+
+    def add_segment(self, room, segment):
+        """Merge a segment into the timeline of every day it covers"""
+        start = datetime.strptime(segment['start'], TIME_FORMAT)
+        day = start.date()
+        last_day = (start + timedelta(seconds=max(int(segment['timeElapsedInSeconds']) - 1, 0))).date()
+        while day <= last_day:
+            self.get(day.strftime(DATE_FORMAT), room).add_segment(segment)
+            day += timedelta(days=1)
+
+    def on_stored(self, path, received_json):
+        """Callback for AsyncServerProtocol.on_stored, the room is the folder the payload was saved in"""
+        room = os.path.basename(os.path.dirname(path))
+        self.add_segment(room, received_json)
+
+    def load_folder(self, data_dir, date=None):
+        """Rebuild the timelines from the json saved by the TCP server, e.g. after a restart.
+
+        Args:
+            data_dir (str): output_dir of the TCP server, with one folder per room
+            date (str, optional): only load segments starting on that day. Defaults to None, all of them.
+        """
+        for room in sorted(os.listdir(data_dir)):
+            room_dir = os.path.join(data_dir, room)
+            if not os.path.isdir(room_dir):
+                continue
+            for filename in sorted(os.listdir(room_dir)):
+                if filename.endswith(".json") and (date is None or filename.startswith(date)):
+                    with open(os.path.join(room_dir, filename)) as json_file:
+                        self.add_segment(room, json.load(json_file))
+
+    def save_finished_days(self, today, output_dir="analysis_results", rollup=None):
+        """Save and forget the timelines of every day before `today` ("%Y.%m.%d")
+
+        Args:
+            today (str): "%Y.%m.%d"
+            output_dir (str, optional): Defaults to "analysis_results".
+            rollup (RollupStore, optional): also add the finished days to it. Defaults to None.
+
+        Returns:
+            list of str: paths of the saved files
+        """
+        saved = []
+        for (date, room) in sorted(self.timelines):
+            if date < today:
+                timeline = self.timelines.pop((date, room))
+                saved.append(timeline.save(output_dir))
+                if rollup is not None:
+                    rollup.add_timeline(timeline)
+        return saved
+
+async def save_at_midnight(timelines, output_dir="analysis_results", rollup=None):
+    """Save the timelines of the previous day every midnight, replacing the nightly schedule_test.job"""
+    while True:
+        now = datetime.now()
+        await asyncio.sleep((datetime.combine(now.date() + timedelta(days=1), time()) - now).total_seconds())
+        timelines.save_finished_days(datetime.now().strftime(DATE_FORMAT), output_dir, rollup)
@@ -0,0 +1,67 @@
+import json
+import os
+import time
+from os import listdir
+from os.path import join
+
+import numpy as np
+
+from activity_levels import build_day_timeline, join_dictionaries, moving_window_sums
+from activity_timeline import ActivityTimelines
+
+data_path = "test_json"
+
+def test_incremental_matches_batch(room="bedroom"):
+    """Adding the segments one at a time gives the same windows as recomputing the whole day"""
+    segments = []
+    for filename in sorted(listdir(join(data_path, room))):
+        with open(join(data_path, room, filename)) as json_file:
+            segments.append(json.load(json_file))
+
+    timelines = ActivityTimelines()
+    start = time.time()
+    for segment in segments:
+        timelines.add_segment(room, segment)
+    print("{} segments merged in {:.4f}s".format(len(segments), time.time() - start))
+
+    activity, total_frames = build_day_timeline(join_dictionaries(segments))
+    timeline = timelines.get(segments[0]["start"][:10], room)
+    assert timeline.num_frames == total_frames
+    assert np.allclose(timeline.activity, activity)
+    for width, sums in moving_window_sums(activity, timeline.windows).items():
+        assert np.allclose(timeline.sums[width], sums)
+
+def test_segment_sent_twice():
+    """A segment stored, then loaded again from its folder after a restart, is only counted once"""
+    segment = {"start": "2020.08.01_100000", "end": "2020.08.01_100010",
+               "timeElapsedInSeconds": 10, "numFrames": 20, "frames": [1.0] * 20}
+    timelines = ActivityTimelines()
+    timelines.add_segment("toilet", segment)
+    timelines.add_segment("toilet", dict(segment))
+    timeline = timelines.get("2020.08.01", "toilet")
+    assert timeline.num_frames == 20 and timeline.activity.sum() == 10
+
+def test_segment_across_midnight():
+    timelines = ActivityTimelines(windows=(300,))
+    timelines.add_segment("toilet", {"start": "2020.08.01_235950", "end": "2020.08.02_000010",
+                                     "timeElapsedInSeconds": 20, "numFrames": 2, "frames": [1.0, 1.0]})
+    first, second = timelines.get("2020.08.01", "toilet"), timelines.get("2020.08.02", "toilet")
+    assert first.covered.sum() == 10 and second.covered.sum() == 10
+    assert second.covered[:10].all()
+    assert first.num_frames == 1 and second.num_frames == 1  # split by the time spent in each day
+    assert "windows" not in first.to_dict()  # "out" is the hourly series
+    assert len(first.to_dict()["out"]) == 82800  # like get_activity_levels always saved it
+    assert list(first.to_dict(windows=(300, 3600))["windows"]) == ["300"]
+
+    timelines.add_segment("toilet", {"start": "2020.08.02_235959", "end": "2020.08.03_000006",
+                                     "timeElapsedInSeconds": 7, "numFrames": 14, "frames": [1.0] * 14})
+    assert second.num_frames == 1 + 2 and timelines.get("2020.08.03", "toilet").num_frames == 12
+
+    saved = timelines.save_finished_days("2020.08.02", output_dir="test_analysis_results")
+    assert saved == [os.path.join("test_analysis_results", "2020.08.01", "toilet.json")]
+    assert list(timelines.timelines) == [("2020.08.02", "toilet"), ("2020.08.03", "toilet")]
+    os.remove(saved[0])
+
+# test_incremental_matches_batch()
+# test_segment_sent_twice()
+# test_segment_across_midnight()
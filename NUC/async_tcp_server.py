@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os.path import exists
+from struct import unpack
+
+from activity_timeline import DATE_FORMAT, ActivityTimelines, save_at_midnight
+from payload_codec import decode_payload
+from rollup_store import RollupStore
+from RoomMonitor import ROOM_TYPES
+
+"""
+Ingestion server for the analysis results sent by the RPis, replacing ServerProtocol in tcp_server.py.
+
+The protocol is unchanged: an 8 byte '>Q' length, the payload, and a 1 byte b'\\00' ack, so
+current clients keep working. The differences are that
+- many RPis can be connected at the same time, each handled by its own coroutine,
+- a client may keep its connection open and send several payloads on it, even before the
+  previous ones are acked. Acks are sent in the order the payloads were received,
+- every payload is read with a single readexactly(length) instead of growing a bytes object,
+- decoding (binary payloads from payload_codec, or json from older RPis) and writing the json
+  is done by a pool of worker processes, so the event loop only ever moves bytes. A payload is
+  acked once it has been stored.
+"""
+
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024  # a corrupt length prefix must not make us allocate terabytes
+
+
+def store_payload(output_dir, data):
+    """Decode one payload and save it to output_dir/room_type/start.json. Runs in a worker process.
+
+    Files are named after the start of the room visit and created exclusively, so workers do not
+    need to share a counter. A payload of a room and start that is already saved, e.g. sent again
+    by an RPi after a lost ack, is a duplicate and is not saved again.
+
+    Returns:
+        (str, dict): path of the saved file and the received json without "room_type",
+            None for a duplicate
+    """
+    # binary payloads from payload_codec, or json from older RPis
+    received_json = decode_payload(data)
+    room_type = received_json.pop("room_type")
+    room_dir = os.path.join(output_dir, room_type)
+    if not exists(room_dir):
+        os.makedirs(room_dir, exist_ok=True)
+
+    path_to_save = os.path.join(room_dir, str(received_json.get("start", "unknown")) + ".json")
+    try:
+        with open(path_to_save, 'x') as outfile:
+            json.dump(received_json, outfile)
+    except FileExistsError:
+        return path_to_save, None
+    return path_to_save, received_json
+
+
+class AsyncServerProtocol:
+
+    def __init__(self, output_dir, workers=None, max_payload=MAX_PAYLOAD_BYTES):
+        """
+        Args:
+            output_dir (str): folder of the saved json, with one subfolder per room type
+            workers (int, optional): number of worker processes. Defaults to None, the number of CPUs.
+            max_payload (int, optional): connections announcing a bigger payload are closed. Defaults to 64 MB.
+        """
+        self.output_dir = output_dir
+        self.max_payload = max_payload
+        self.executor = ProcessPoolExecutor(workers)
+        self.server = None
+        self.on_stored = []  # callbacks called with (path, received_json) once a payload is stored
+
+    async def listen(self, server_ip, server_port):
+        self.server = await asyncio.start_server(self.handle_client, server_ip, server_port)
+        return self.server
+
+    async def serve_forever(self, server_ip, server_port):
+        await self.listen(server_ip, server_port)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            print("closing port...")
+            self.close()
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        loop = asyncio.get_running_loop()
+        stored = asyncio.Queue()  # futures of the payloads received and not acked yet, in order
+        acker = asyncio.ensure_future(self.send_acks(stored, writer))
+        try:
+            while True:
+                try:
+                    bs = await reader.readexactly(8)
+                except asyncio.IncompleteReadError:
+                    break  # the client closed the connection between two payloads
+                (length,) = unpack('>Q', bs)
+                if length > self.max_payload:
+                    print("{}: payload of {} bytes is too big, closing the connection".format(addr, length))
+                    break
+                data = await reader.readexactly(length)
+                stored.put_nowait(loop.run_in_executor(self.executor, store_payload, self.output_dir, data))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print("{}: connection lost ({})".format(addr, e))
+        finally:
+            stored.put_nowait(None)
+            await acker
+            writer.close()
+
+    async def send_acks(self, stored, writer):
+        while True:
+            future = await stored.get()
+            if future is None:
+                return
+            try:
+                path_to_save, received_json = await future
+                if received_json is None:
+                    print("already saved: ", path_to_save)  # acked all the same, so the RPi stops resending
+                else:
+                    print("saving to: ", path_to_save)
+                    for callback in self.on_stored:
+                        callback(path_to_save, received_json)
+            except Exception as e:
+                # like the old server, a payload that cannot be decoded is acked and dropped,
+                # otherwise the client would send it again forever
+                print("Could not store payload: {}".format(e))
+            try:
+                # send our 0 ack
+                writer.write(b'\00')
+                await writer.drain()
+            except ConnectionError:
+                pass  # the payload is stored, the client will send it again and it will be acked as a duplicate
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        self.executor.shutdown()
+
+async def main(output_dir):
+    # activity of the current day is kept up to date as segments arrive
+    timelines = ActivityTimelines()
+    timelines.load_folder(output_dir, date=datetime.now().strftime(DATE_FORMAT))
+    sp = AsyncServerProtocol(output_dir)
+    sp.on_stored.append(timelines.on_stored)
+    # finished days are also kept at several resolutions for weekly and monthly analysis
+    asyncio.ensure_future(save_at_midnight(timelines, rollup=RollupStore("rollups")))
+    await sp.serve_forever('0.0.0.0', 9999)
+
+if __name__ == '__main__':
+    output_dir = "data"
+    for x in ROOM_TYPES:
+        foldername = os.path.join(output_dir, x)
+        if not exists(foldername):
+            os.makedirs(foldername)
+    asyncio.run(main(output_dir))
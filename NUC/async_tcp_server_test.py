@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from socket import *
+from struct import pack
+
+from async_tcp_server import AsyncServerProtocol
+from payload_codec import encode_payload
+
+
+def start_server(output_dir, workers=2):
+    """Run an AsyncServerProtocol on a free port in a background thread, returns the port"""
+    sp = AsyncServerProtocol(output_dir, workers=workers)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(sp.listen("127.0.0.1", 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server.sockets[0].getsockname()[1]
+
+def make_payload(client, i):
+    return json.dumps({"room_type": "bedroom", "start": "2020.08.01_{:02d}{:04d}".format(client, i),
+                       "end": "2020.08.01_000010", "timeElapsedInSeconds": 10, "numFrames": 2,
+                       "frames": [0.0, 1.5]}).encode("utf-8")
+
+def send_pipelined(port, client, num_payloads, acks):
+    """Send every payload on one connection before reading the acks"""
+    s = socket(AF_INET, SOCK_STREAM)
+    s.connect(("127.0.0.1", port))
+    for i in range(num_payloads):
+        data = make_payload(client, i)
+        s.sendall(pack('>Q', len(data)) + data)
+    received = b''
+    while len(received) < num_payloads:
+        received += s.recv(num_payloads)
+    acks[client] = received
+    s.close()
+
+def test_concurrent_clients(num_clients=10, num_payloads=5):
+    output_dir = tempfile.mkdtemp()
+    port = start_server(output_dir)
+    acks = {}
+    start = time.time()
+    clients = [threading.Thread(target=send_pipelined, args=(port, c, num_payloads, acks)) for c in range(num_clients)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    print("{} payloads stored in {:.3f}s".format(num_clients * num_payloads, time.time() - start))
+
+    assert all(acks[c] == b'\00' * num_payloads for c in range(num_clients))
+    saved = os.listdir(os.path.join(output_dir, "bedroom"))
+    assert len(saved) == num_clients * num_payloads
+    with open(os.path.join(output_dir, "bedroom", "2020.08.01_030004.json")) as f:
+        assert json.load(f)["frames"] == [0.0, 1.5]
+    shutil.rmtree(output_dir)
+
+def test_one_payload_per_connection():
+    """Old clients connect, send one payload, wait for the ack and close"""
+    output_dir = tempfile.mkdtemp()
+    port = start_server(output_dir)
+    data = make_payload(0, 0)
+    for i in range(2):  # the same payload sent again after a lost ack is acked and saved once
+        s = socket(AF_INET, SOCK_STREAM)
+        s.connect(("127.0.0.1", port))
+        s.sendall(pack('>Q', len(data)))
+        s.sendall(data)
+        assert s.recv(1) == b'\00'
+        s.shutdown(SHUT_WR)
+        s.close()
+    time.sleep(0.1)
+    assert os.listdir(os.path.join(output_dir, "bedroom")) == ["2020.08.01_000000.json"]
+    shutil.rmtree(output_dir)
+
+def test_binary_payload():
+    """Payloads from payload_codec are saved as the same json as before"""
+    output_dir = tempfile.mkdtemp()
+    port = start_server(output_dir)
+    data = encode_payload(json.loads(make_payload(0, 0)))
+    s = socket(AF_INET, SOCK_STREAM)
+    s.connect(("127.0.0.1", port))
+    s.sendall(pack('>Q', len(data)) + data)
+    assert s.recv(1) == b'\00'
+    s.close()
+    with open(os.path.join(output_dir, "bedroom", "2020.08.01_000000.json")) as f:
+        saved = json.load(f)
+    assert saved["frames"] == [0.0, 1.5] and saved["numFrames"] == 2 and "room_type" not in saved
+    shutil.rmtree(output_dir)
+
+# test_concurrent_clients()
+# test_one_payload_per_connection()
+# test_binary_payload()
@@ -0,0 +1,98 @@
+import heapq
+import itertools
+import time
+
+"""
+Deadlines of how long each resident may stay in a room before an alert is sent.
+
+DeadlineScheduler is a heap of (deadline, key) with lazy deletion: rescheduling a key pushes a new
+entry and bumps the key's generation instead of searching the heap, and entries of an older
+generation are skipped when they reach the top. pop_expired() therefore only looks at the
+entries that are due, and checking thousands of residents costs O(expired log n) instead of a
+scan of every resident. The heap is rebuilt when stale entries outnumber the live ones.
+"""
+
+
+class DeadlineScheduler:
+    def __init__(self):
+        self._heap = []  # (deadline, generation, key), the generation also breaks ties
+        self._live = {}  # key -> (generation, deadline, payload) of its current deadline
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, key):
+        return key in self._live
+
+    def schedule(self, key, deadline, payload=None):
+        """Set the deadline of key, replacing its previous one if any"""
+        generation = next(self._counter)
+        self._live[key] = (generation, deadline, payload)
+        heapq.heappush(self._heap, (deadline, generation, key))
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._compact()
+
+    def cancel(self, key):
+        self._live.pop(key, None)
+
+    def _is_live(self, entry):
+        live = self._live.get(entry[2])
+        return live is not None and live[0] == entry[1]
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._is_live(entry)]
+        heapq.heapify(self._heap)
+
+    def next_deadline(self):
+        """Earliest pending deadline, or None"""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now):
+        """(key, payload) of every deadline <= now, earliest first. They are removed from the scheduler."""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                expired.append((entry[2], self._live.pop(entry[2])[2]))
+        return expired
+
+
+class DwellMonitor:
+    def __init__(self, cutoff_minutes, on_alert, clock=time.monotonic):
+        """
+        Args:
+            cutoff_minutes (dict): room -> minutes a resident may stay in it, e.g. ROOM_CUTOFF_TIME_MINUTES
+            on_alert (function): called with (resident, room, minutes) when a resident stays too long
+            clock (function, optional): Defaults to time.monotonic.
+        """
+        self.cutoff_seconds = {room: minutes * 60 for room, minutes in cutoff_minutes.items()}
+        self.on_alert = on_alert
+        self.clock = clock
+        self.scheduler = DeadlineScheduler()
+
+    def enter(self, resident, room):
+        """Resident moved into room, its previous deadline is replaced"""
+        if room in self.cutoff_seconds:
+            self.scheduler.schedule(resident, self.clock() + self.cutoff_seconds[room], room)
+        else:
+            self.scheduler.cancel(resident)
+
+    def leave(self, resident):
+        self.scheduler.cancel(resident)
+
+    def timeout(self, max_timeout=1.0):
+        """Seconds until the next deadline, at most max_timeout, to wait for messages in the meantime"""
+        deadline = self.scheduler.next_deadline()
+        if deadline is None:
+            return max_timeout
+        return min(max(deadline - self.clock(), 0), max_timeout)
+
+    def check(self):
+        """Send the alerts that are due, returns how many were sent. Each stay is alerted once."""
+        expired = self.scheduler.pop_expired(self.clock())
+        for resident, room in expired:
+            self.on_alert(resident, room, self.cutoff_seconds[room] / 60)
+        return len(expired)
@@ -0,0 +1,65 @@
+import random
+import time
+
+from dwell_scheduler import DeadlineScheduler, DwellMonitor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_reschedule_and_cancel():
+    scheduler = DeadlineScheduler()
+    scheduler.schedule("a", 10, "bedroom")
+    scheduler.schedule("b", 5, "toilet")
+    scheduler.schedule("a", 20, "kitchen")  # replaces the deadline at 10
+    scheduler.schedule("c", 7)
+    scheduler.cancel("c")
+    assert scheduler.next_deadline() == 5
+    assert scheduler.pop_expired(15) == [("b", "toilet")]
+    assert scheduler.pop_expired(19) == []
+    assert scheduler.pop_expired(20) == [("a", "kitchen")]
+    assert len(scheduler) == 0 and scheduler.next_deadline() is None
+
+def test_dwell_alerts():
+    clock = FakeClock()
+    alerts = []
+    monitor = DwellMonitor({"bedroom": 60, "toilet": 30}, lambda *alert: alerts.append(alert), clock=clock)
+    monitor.enter("kjhouse", "toilet")
+    clock.now = 20 * 60
+    monitor.enter("kjhouse", "bedroom")  # moved before the toilet cutoff
+    assert monitor.timeout(max_timeout=3600) == 60 * 60
+    clock.now = 50 * 60
+    assert monitor.check() == 0
+    clock.now = 80 * 60
+    assert monitor.check() == 1 and alerts == [("kjhouse", "bedroom", 60)]
+    assert monitor.check() == 0  # alerted once per stay
+
+def test_check_cost(num_residents=100000, num_moves=200000):
+    """check() only pays for the expired deadlines, not for every resident"""
+    clock = FakeClock()
+    alerts = []
+    # the moves span 2000 seconds, so nothing is due before the clock jumps
+    monitor = DwellMonitor({"bedroom": 60, "livingroom": 45}, lambda *alert: alerts.append(alert), clock=clock)
+    rng = random.Random(0)
+    for i in range(num_moves):
+        clock.now = i * 0.01
+        monitor.enter(rng.randrange(num_residents), rng.choice(["bedroom", "livingroom"]))
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        monitor.check()  # nothing due yet
+    idle = (time.perf_counter() - start) / 1000
+    clock.now += 30 * 60
+    start = time.perf_counter()
+    fired = monitor.check()
+    busy = time.perf_counter() - start
+    print("{} residents: {:.2f} us per idle check, {} alerts in {:.4f}s".format(num_residents, idle * 1e6, fired, busy))
+    assert fired == len(alerts) > 0
+
+# test_reschedule_and_cancel()
+# test_dwell_alerts()
+# test_check_cost()
@@ -0,0 +1,209 @@
+import hashlib
+import threading
+from bisect import bisect
+from multiprocessing import Process, Queue
+
+from RoomMonitor import ROOM_TYPES
+from room_engine import NO_CHANGE, ROOM_INDEX, RoomEngine
+
+"""
+Room tracking for many houses from a single NUC service.
+
+Instead of one HOUSE_ID and one global state, the service subscribes to BPS_TOPICS and keeps a
+RoomEngine per house, created when its first message arrives. The (house, room) of a topic is
+parsed once and cached, so every later message costs a dict lookup plus the O(1) engine update,
+however many houses there are.
+
+With workers, houses are spread over worker processes by consistent hashing of the house ID.
+A house always lands on the same worker, so its state never needs to be shared, and adding a
+worker only moves about 1/workers of the houses.
+"""
+
+BPS_TOPICS = "bps/+/+"  # bps/<house id>/<room>
+STATE_TOPIC = "nuc/{}"  # room changes of a house, like main_new
+
+
+class HouseRouter:
+    def __init__(self, exclusive=True, sensor="bps"):
+        """
+        Args:
+            exclusive (bool, optional): see RoomEngine. Defaults to True.
+            sensor (str, optional): device type of the occupancy topics. Defaults to "bps".
+        """
+        self.exclusive = exclusive
+        self.sensor = sensor
+        self.houses = {}  # house id -> RoomEngine
+        self.routes = {}  # topic -> (RoomEngine, room index)
+
+    def house(self, house_id):
+        if house_id not in self.houses:
+            self.houses[house_id] = RoomEngine(house_id, exclusive=self.exclusive, sensor=self.sensor)
+        return self.houses[house_id]
+
+    def route(self, topic):
+        """(RoomEngine, room index) of a topic, or None if it is not an occupancy topic"""
+        route = self.routes.get(topic)
+        if route is None:
+            parts = topic.split("/")
+            if len(parts) != 3 or parts[0] != self.sensor or parts[2] not in ROOM_INDEX:
+                return None
+            route = self.routes[topic] = (self.house(parts[1]), ROOM_INDEX[parts[2]])
+        return route
+
+    def handle_message(self, topic, payload):
+        """Handle one MQTT message, payload is b"0" or b"1".
+
+        Returns:
+            (str, int): house id and index of the room the person moved to, or (None, NO_CHANGE)
+        """
+        route = self.route(topic)
+        if route is None or payload not in (b"0", b"1"):
+            return None, NO_CHANGE
+        engine, room = route
+        return engine.house_id, engine.update(room, payload == b"1")
+
+
+def hash_key(key):
+    return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    def __init__(self, nodes, replicas=64):
+        """
+        Args:
+            nodes (iterable): e.g. worker numbers
+            replicas (int, optional): points per node on the ring, more points spread keys more evenly. Defaults to 64.
+        """
+        self.replicas = replicas
+        self.nodes = set()
+        self._hashes = []
+        self._points = []
+        for node in nodes:
+            self.add_node(node)
+
+    def _build(self):
+        points = sorted((hash_key("{}#{}".format(node, i)), node) for node in self.nodes for i in range(self.replicas))
+        self._hashes = [h for h, node in points]
+        self._points = [node for h, node in points]
+
+    def add_node(self, node):
+        self.nodes.add(node)
+        self._build()
+
+    def remove_node(self, node):
+        self.nodes.discard(node)
+        self._build()
+
+    def get(self, key):
+        """Node owning key: the first point clockwise from the hash of key"""
+        return self._points[bisect(self._hashes, hash_key(key)) % len(self._points)]
+
+
+def shard_worker(inbox, changes, exclusive):
+    """Runs the HouseRouter of one shard, reports room changes as (house id, room) and None when it stops"""
+    router = HouseRouter(exclusive)
+    while True:
+        message = inbox.get()
+        if message is None:
+            changes.put(None)
+            return
+        house_id, room = router.handle_message(*message)
+        if room != NO_CHANGE:
+            changes.put((house_id, ROOM_TYPES[room]))
+
+
+class ShardedHouseRouter:
+    def __init__(self, workers, exclusive=True):
+        """HouseRouters in `workers` processes, houses are assigned with a ConsistentHashRing"""
+        self.ring = ConsistentHashRing(range(workers))
+        self.inboxes = [Queue() for _ in range(workers)]
+        self.changes = Queue()  # (house id, room) of every room change, from all workers
+        self.workers = [Process(target=shard_worker, args=(inbox, self.changes, exclusive), daemon=True)
+                        for inbox in self.inboxes]
+        self.topic_inboxes = {}  # topic -> inbox of the worker owning its house
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        """Stop the workers once they have handled every dispatched message.
+
+        Returns:
+            list: room changes not read from self.changes yet
+        """
+        for inbox in self.inboxes:
+            inbox.put(None)
+        # a worker only exits once everything it put in the queue has been read
+        remaining = []
+        stopped = 0
+        while stopped < len(self.workers):
+            change = self.changes.get()
+            if change is None:
+                stopped += 1
+            else:
+                remaining.append(change)
+        for worker in self.workers:
+            worker.join()
+        return remaining
+
+    def dispatch(self, topic, payload):
+        """Send a message to the worker owning its house, returns False for topics without a house"""
+        inbox = self.topic_inboxes.get(topic)
+        if inbox is None:
+            parts = topic.split("/")
+            if len(parts) != 3:
+                return False
+            inbox = self.topic_inboxes[topic] = self.inboxes[self.ring.get(parts[1])]
+        inbox.put((topic, payload))
+        return True
+
+
+def run(broker, port, workers=0):
+    """Track every house publishing on the broker, publishing room changes to STATE_TOPIC.
+
+    Args:
+        broker (str)
+        port (int)
+        workers (int, optional): number of worker processes, 0 to handle messages in the MQTT thread. Defaults to 0.
+    """
+    import paho.mqtt.client as mqtt
+    client = mqtt.Client()
+
+    if workers:
+        sharded = ShardedHouseRouter(workers)
+        sharded.start()
+
+        def publish_changes():
+            while True:
+                change = sharded.changes.get()
+                if change is None:
+                    continue  # a worker stopped
+                client.publish(STATE_TOPIC.format(change[0]), change[1])
+        threading.Thread(target=publish_changes, daemon=True).start()
+
+        def on_message(client, userdata, msg):
+            sharded.dispatch(msg.topic, msg.payload)
+    else:
+        router = HouseRouter()
+
+        def on_message(client, userdata, msg):
+            house_id, room = router.handle_message(msg.topic, msg.payload)
+            if room != NO_CHANGE:
+                client.publish(STATE_TOPIC.format(house_id), ROOM_TYPES[room])
+
+    def on_connect(client, userdata, flags, rc):
+        # subscribe again on every reconnection
+        print("Connection OK!" if rc == 0 else "Bad connection, Returned Code: {}".format(rc))
+        client.subscribe(BPS_TOPICS)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    print("Connecting to broker...", broker)
+    client.connect(broker, port)
+    client.loop_forever()
+
+if __name__ == '__main__':
+    import os
+    import sys
+    run(os.environ.get("MQTT_BROKER", "192.168.0.102"), int(os.environ.get("MQTT_PORT", 1883)), workers=int(sys.argv[1]) if len(sys.argv) > 1 else 0)
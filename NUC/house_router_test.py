@@ -0,0 +1,70 @@
+import random
+import time
+from collections import Counter
+
+from house_router import ConsistentHashRing, HouseRouter, ShardedHouseRouter
+from room_engine import NO_CHANGE
+from room_engine_test import simulate_bps_stream
+
+
+def interleaved_streams(num_houses, num_moves):
+    """Simulated BPS messages of num_houses houses, shuffled together keeping the order within a house"""
+    streams = [simulate_bps_stream("house{}".format(h), num_moves, seed=h) for h in range(num_houses)]
+    rng = random.Random(0)
+    positions = [0] * num_houses
+    messages = []
+    remaining = [h for h in range(num_houses) for _ in range(len(streams[h]))]
+    rng.shuffle(remaining)
+    for h in remaining:
+        messages.append(streams[h][positions[h]])
+        positions[h] += 1
+    return messages
+
+def test_houses_are_independent(num_houses=20, num_moves=200):
+    router = HouseRouter()
+    for topic, payload in interleaved_streams(num_houses, num_moves):
+        router.handle_message(topic, payload)
+    assert len(router.houses) == num_houses
+    for h in range(num_houses):
+        # same final room as a house tracked on its own
+        alone = HouseRouter()
+        for topic, payload in simulate_bps_stream("house{}".format(h), num_moves, seed=h):
+            alone.handle_message(topic, payload)
+        assert router.houses["house{}".format(h)].current == alone.houses["house{}".format(h)].current
+    assert router.handle_message("rpi/house0/bedroom", b"1") == (None, NO_CHANGE)
+    assert router.handle_message("bps/house0", b"1") == (None, NO_CHANGE)
+
+def test_consistent_hashing(num_houses=10000):
+    houses = ["house{}".format(h) for h in range(num_houses)]
+    ring = ConsistentHashRing(range(8))
+    before = {h: ring.get(h) for h in houses}
+    print("houses per worker:", sorted(Counter(before.values()).values()))
+    ring.add_node(8)
+    moved = sum(ring.get(h) != before[h] for h in houses)
+    print("houses moved when adding a worker: {:.1%}".format(moved / num_houses))
+    assert moved < num_houses / 4
+    assert all(ring.get(h) in (before[h], 8) for h in houses)
+
+def test_latency_bounded(num_moves=20):
+    """Time per message should not grow with the number of houses"""
+    for num_houses in (10, 100, 1000):
+        messages = interleaved_streams(num_houses, num_moves)
+        router = HouseRouter()
+        start = time.perf_counter()
+        for topic, payload in messages:
+            router.handle_message(topic, payload)
+        print("{} houses: {:.2f} us per message".format(num_houses, (time.perf_counter() - start) / len(messages) * 1e6))
+
+def test_sharded(num_houses=50, num_moves=50, workers=4):
+    sharded = ShardedHouseRouter(workers)
+    sharded.start()
+    for topic, payload in interleaved_streams(num_houses, num_moves):
+        sharded.dispatch(topic, payload)
+    changes = Counter(house_id for house_id, room in sharded.stop())
+    # every simulated move is a valid transition
+    assert changes == Counter({"house{}".format(h): num_moves for h in range(num_houses)})
+
+# test_houses_are_independent()
+# test_consistent_hashing()
+# test_latency_bounded()
+# test_sharded()
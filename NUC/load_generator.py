@@ -0,0 +1,256 @@
+import asyncio
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from multiprocessing import Process
+from struct import pack
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+from activity_levels import TIME_FORMAT
+from activity_timeline import ActivityTimelines
+from async_tcp_server import AsyncServerProtocol
+from house_router import BPS_TOPICS, STATE_TOPIC
+from house_router import run as run_house_router
+from mqtt_broker import LocalBroker
+from payload_codec import encode_payload
+from RoomMonitor import LIVING_ROOM, ROOM_TYPES
+from room_engine import declared_transitions
+
+"""
+End-to-end load test of the NUC on a single machine.
+
+BpsLoad publishes the BPS readings of num_houses houses with 5 rooms each, a person walking
+through valid transitions in every house, and times each move from the publish of its first
+reading to the room change published by the NUC on STATE_TOPIC. RpiLoad plays num_rpis MLX
+RPis sending displacement payloads to the ingestion server, and times each one from the start
+of the send to its ack, which the server only sends once the payload is stored.
+
+run_benchmark() starts a LocalBroker, house_router.run() and an AsyncServerProtocol on
+localhost and runs both loads against them, e.g. to find how many houses one NUC can follow:
+
+    python load_generator.py <houses> <moves per second per house> <rpis> <payloads per second per rpi> <seconds> <workers>
+"""
+
+RPI_START = datetime(2020, 8, 1)  # start of the first room visit sent by RpiLoad
+
+
+def latency_stats(latencies):
+    """Summary in milliseconds of a list of latencies in seconds"""
+    if not latencies:
+        return {"count": 0}
+    ms = np.asarray(latencies) * 1000
+    return {"count": len(ms), "mean": float(ms.mean()), "p50": float(np.percentile(ms, 50)),
+            "p95": float(np.percentile(ms, 95)), "p99": float(np.percentile(ms, 99)), "max": float(ms.max())}
+
+
+class BpsLoad:
+    def __init__(self, broker, port, num_houses, moves_per_second, seed=0):
+        """
+        Args:
+            broker (str)
+            port (int)
+            num_houses (int): houses are named house0, house1...
+            moves_per_second (float): room changes per second in each house
+            seed (int, optional): Defaults to 0.
+        """
+        self.broker = broker
+        self.port = port
+        self.houses = ["house{}".format(h) for h in range(num_houses)]
+        self.moves_per_second = moves_per_second
+        self.rng = random.Random(seed)
+        self.next_rooms = defaultdict(list)
+        for source, destination in declared_transitions():
+            self.next_rooms[source].append(destination)
+        self.rooms = {house: LIVING_ROOM for house in self.houses}
+        self.pending = defaultdict(deque)  # house -> (room, publish time) of the moves not seen on STATE_TOPIC yet
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def on_state(self, client, userdata, msg):
+        now = time.perf_counter()
+        house = msg.topic.split("/")[1]
+        room = msg.payload.decode("utf-8")
+        with self.lock:
+            pending = self.pending[house]
+            # moves are seen in order, a move that was skipped is not waited for anymore
+            while pending:
+                expected, sent = pending.popleft()
+                if expected == room:
+                    self.latencies.append(now - sent)
+                    break
+
+    def connect(self, client):
+        client.connect(self.broker, self.port)
+        client.loop_start()
+
+    def run(self, duration):
+        """Publish moves for duration seconds, then wait up to a second for the last room changes.
+
+        Returns:
+            dict: messages published, moves, room changes seen and their latency_stats
+        """
+        subscribed = threading.Event()
+        subscriber = mqtt.Client()
+        subscriber.on_message = self.on_state
+        subscriber.on_subscribe = lambda client, userdata, mid, granted_qos: subscribed.set()
+        self.connect(subscriber)
+        subscriber.subscribe(STATE_TOPIC.format("+"))
+        publisher = mqtt.Client()
+        self.connect(publisher)
+        subscribed.wait(5)  # room changes of the first moves would be missed otherwise
+
+        rate = self.moves_per_second * len(self.houses)
+        moves = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            # houses take turns, at an overall rate of `rate` moves per second
+            delay = start + moves / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            house = self.houses[moves % len(self.houses)]
+            previous = self.rooms[house]
+            room = self.rooms[house] = self.rng.choice(self.next_rooms[previous])
+            with self.lock:
+                self.pending[house].append((room, time.perf_counter()))
+            # the person is seen in the new room before leaving the previous one
+            publisher.publish("bps/{}/{}".format(house, room), b"1")
+            publisher.publish("bps/{}/{}".format(house, previous), b"0")
+            moves += 1
+        elapsed = time.perf_counter() - start
+
+        deadline = time.perf_counter() + 1
+        while time.perf_counter() < deadline and any(self.pending.values()):
+            time.sleep(0.01)
+        publisher.loop_stop()
+        subscriber.loop_stop()
+        publisher.disconnect()
+        subscriber.disconnect()
+        return {"messages": 2 * moves, "moves": moves, "moves_per_second": moves / elapsed,
+                "state_changes": len(self.latencies), "latency_ms": latency_stats(self.latencies)}
+
+
+def make_rpi_payload(rpi, i, num_frames, rng):
+    """Encoded displacement payload of the i-th room visit of an RPi, num_frames frames at 2 fps.
+    Visits of an RPi follow each other from RPI_START, offset by a second per RPi so that RPis
+    of the same room send different visits."""
+    frames = np.round(rng.choice([0, 0, 0, 1, np.sqrt(2)], num_frames), 3).tolist()
+    seconds = num_frames / 2
+    start = RPI_START + timedelta(seconds=i * seconds + rpi)
+    return encode_payload({"room_type": ROOM_TYPES[rpi % len(ROOM_TYPES)], "start": start.strftime(TIME_FORMAT),
+                           "end": (start + timedelta(seconds=seconds)).strftime(TIME_FORMAT),
+                           "timeElapsedInSeconds": seconds, "numFrames": num_frames, "frames": frames,
+                           "timestamps": (np.arange(num_frames) * 0.5).tolist()})
+
+
+class RpiLoad:
+    def __init__(self, server_ip, server_port, num_rpis, payloads_per_second, num_frames=7200, seed=0):
+        """
+        Args:
+            server_ip (str)
+            server_port (int)
+            num_rpis (int): one connection each
+            payloads_per_second (float): payloads sent per second by each RPi
+            num_frames (int, optional): frames per payload. Defaults to 7200, an hour at 2 fps.
+            seed (int, optional): Defaults to 0.
+        """
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.num_rpis = num_rpis
+        self.payloads_per_second = payloads_per_second
+        self.num_frames = num_frames
+        self.seed = seed
+        self.latencies = []
+        self.sent_bytes = 0
+        self.lock = threading.Lock()
+
+    def run_rpi(self, rpi, duration):
+        rng = np.random.default_rng(self.seed + rpi)
+        s = socket.create_connection((self.server_ip, self.server_port))
+        start = time.perf_counter()
+        i = 0
+        while time.perf_counter() - start < duration:
+            delay = start + i / self.payloads_per_second - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            data = make_rpi_payload(rpi, i, self.num_frames, rng)
+            sent = time.perf_counter()
+            s.sendall(pack('>Q', len(data)) + data)
+            if s.recv(1) != b'\00':
+                break
+            with self.lock:
+                self.latencies.append(time.perf_counter() - sent)
+                self.sent_bytes += len(data)
+            i += 1
+        s.close()
+
+    def run(self, duration):
+        """Send payloads from every RPi for duration seconds, waiting for each ack before the next payload.
+
+        Returns:
+            dict: payloads stored, bytes sent and latency_stats of the acks
+        """
+        rpis = [threading.Thread(target=self.run_rpi, args=(rpi, duration)) for rpi in range(self.num_rpis)]
+        start = time.perf_counter()
+        for rpi in rpis:
+            rpi.start()
+        for rpi in rpis:
+            rpi.join()
+        elapsed = time.perf_counter() - start
+        return {"payloads": len(self.latencies), "payloads_per_second": len(self.latencies) / elapsed,
+                "bytes": self.sent_bytes, "latency_ms": latency_stats(self.latencies)}
+
+
+def run_benchmark(num_houses=100, moves_per_second=0.1, num_rpis=4, payloads_per_second=1, duration=10, workers=0):
+    """Run BpsLoad and RpiLoad at the same time against a local broker, house router and ingestion server
+
+    Args:
+        workers (int, optional): worker processes of the house router, 0 to route in its MQTT thread. Defaults to 0.
+
+    Returns:
+        dict: "bps" and "rpi" results of the loads
+    """
+    broker = LocalBroker()
+    broker_port = broker.start()
+    router = Process(target=run_house_router, args=("127.0.0.1", broker_port, workers), daemon=True)
+    router.start()
+
+    output_dir = tempfile.mkdtemp()
+    sp = AsyncServerProtocol(output_dir)
+    timelines = ActivityTimelines()  # stored payloads are merged like in async_tcp_server.main
+    sp.on_stored.append(timelines.on_stored)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(sp.listen("127.0.0.1", 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    # moves published before the house router subscribed would never be seen
+    deadline = time.perf_counter() + 10
+    while time.perf_counter() < deadline and not any(BPS_TOPICS in f for f in list(broker.subscriptions.values())):
+        time.sleep(0.01)
+
+    results = {}
+    rpi_load = RpiLoad("127.0.0.1", server.sockets[0].getsockname()[1], num_rpis, payloads_per_second)
+    rpi_thread = threading.Thread(target=lambda: results.update(rpi=rpi_load.run(duration)))
+    rpi_thread.start()
+    results["bps"] = BpsLoad("127.0.0.1", broker_port, num_houses, moves_per_second).run(duration)
+    rpi_thread.join()
+    results["broker"] = {"received": broker.received, "delivered": broker.delivered}
+    results["rpi"]["timelines"] = len(timelines.timelines)
+
+    router.terminate()
+    loop.call_soon_threadsafe(sp.close)
+    broker.stop()
+    shutil.rmtree(output_dir)
+    return results
+
+if __name__ == '__main__':
+    import json
+    import sys
+    defaults = [100, 0.1, 4, 1, 10, 0]
+    args = [type(d)(a) for d, a in zip(defaults, sys.argv[1:])] + defaults[len(sys.argv) - 1:]
+    print(json.dumps(run_benchmark(*args), indent=4))
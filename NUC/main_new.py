@@ -1,3 +1,4 @@
+import os
 import time
 from   datetime import datetime
 import serial
@@ -5,6 +6,10 @@ import numpy as np
 import math
 import pdb
 
+from dwell_scheduler import DwellMonitor
+from room_engine import NO_CHANGE, ROOM_TYPES, RoomEngine
+from shared_state import SharedRoomState
+
 
 BED_ROOM = "bedroom"
 LIVING_ROOM = "livingroom"
@@ -12,35 +17,19 @@ KITCHEN = "kitchen"
 OUTSIDE = "exit"
 TOILET = "toilet"
 ROOMS = [LIVING_ROOM, BED_ROOM, OUTSIDE, TOILET, KITCHEN]
-VALID_TRANSITIONS = {
-    BED_ROOM: [LIVING_ROOM, TOILET],
-    LIVING_ROOM: [BED_ROOM, KITCHEN, OUTSIDE, TOILET],
-    KITCHEN: [LIVING_ROOM],
-    OUTSIDE: [LIVING_ROOM],
-    TOILET: [LIVING_ROOM, BED_ROOM]
-}
 
 # used for connecting clients, subscribing and publishing to topics
-BROKER = '192.168.0.102' 
-PORT   = 1883
+# MQTT_BROKER / MQTT_PORT point the NUC at another broker, e.g. mqtt_broker.py for tests
+BROKER = os.environ.get("MQTT_BROKER", '192.168.0.102')
+PORT   = int(os.environ.get("MQTT_PORT", 1883))
 HOUSE_ID = "kjhouse"
 DEVICE_TYPE = "NUC"
 BPS_SENSOR = "bps"
 MLX_SENSOR = "mlx"
+STATE_TOPIC = "/".join(["nuc", HOUSE_ID])  # the room the person moved to
+ALERT_TOPIC = "/".join(["nuc", HOUSE_ID, "alert"])  # the room, when the person stays in it past its cutoff time
+SHARED_STATE_NAME = "nuc_" + HOUSE_ID  # other processes can attach to SharedRoomState(SHARED_STATE_NAME, create=False)
 
-from multiprocessing import Process, Manager
-manager = Manager()
-Global = manager.Namespace()
-
-# to contain the status of all BPS in real time
-binary_dict = manager.dict()
-binary_dict = {
-    BED_ROOM: 0,
-    LIVING_ROOM: 0,
-    KITCHEN: 0,
-    OUTSIDE: 0,
-    TOILET: 0
-}
 # if the person has stayed in a particular room for more than the cutoff time for that room, a notification is sent to the MQTT
 ROOM_CUTOFF_TIME_MINUTES = {
     BED_ROOM: 60,
@@ -49,12 +38,26 @@ ROOM_CUTOFF_TIME_MINUTES = {
     OUTSIDE: 60,
     TOILET: 60,
 }
-Global.last_visited = LIVING_ROOM
-Global.last_entered_time = datetime.now()
+
+# after the connection to the broker is lost, reconnection is retried with a doubling delay
+RECONNECT_DELAY_SECONDS = 1
+MAX_RECONNECT_DELAY_SECONDS = 60
+
+# MQTT handling and the dwell timers run in a single thread, so the state is plain local objects:
+# the BPS occupancy bitmap and the room the person is in, moving on valid transitions only
+room_engine = RoomEngine(HOUSE_ID, initial_room=LIVING_ROOM, exclusive=False)
+last_entered_time = datetime.now()
+dwell_monitor = None
+shared_state = None
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print ("Connection OK!")
+        # Subscribe to topics for bps sensors, on every connection as the broker may not keep them
+        for room in ROOMS:
+            print("Subscribing to ", room)
+            print("/".join([BPS_SENSOR, HOUSE_ID, room]))
+            client.subscribe("/".join([BPS_SENSOR, HOUSE_ID, room]))
     else:
         print("Bad connection, Returned Code: ", rc)
 
@@ -62,51 +65,42 @@ def on_disconnect(client, userdata, flags, rc=0):
     print("Disconnected result code " + str(rc))
 
 def on_message(client,userdata, msg):
+    global last_entered_time
     try:
-        # print("while true - id(binary_dict): {0}".format(id(binary_dict)))
-        topic=msg.topic
-        device_type, house_id, current_room = topic.split("/")
-
-        m_decode=str(msg.payload.decode("utf-8","ignore"))
-        """
-        print("-----")
-        print("topic: {0}; m_decode: {1}".format(topic, m_decode))
-        print("binary_dict: {0};".format(binary_dict))
-        print("Global.last_entered_time: {0}".format(Global.last_entered_time))
-        print("Global.last_visited: {0}".format(Global.last_visited))
-        """
-        if m_decode == "0" or m_decode == "1":
-            binary_dict[current_room] = int(m_decode)
+        last_visited = room_engine.current_room
+        new_room = room_engine.handle_message(msg.topic, msg.payload)
 
         # if the person has moved rooms
-        if Global.last_visited != current_room and m_decode == "1":
-            if is_valid_transition(current_room):
-                print("nuc - person travels from {0} to {1}".format(Global.last_visited, current_room))
-                Global.last_entered_time = datetime.now()
-                Global.last_visited = current_room
-
-                # activate respective MLX sensors according to the room where the person is in
-                topic = "nuc/kjhouse"
-                client.publish(topic, Global.last_visited)
-                """
-                for room in ROOMS:
-                    topic = "/".join([MLX_SENSOR, HOUSE_ID, room])
-                    if room == Global.last_visited:
-                        client.publish(topic, "1")
-                    else:
-                        client.publish(topic, "0")
-                """
-                
+        if new_room != NO_CHANGE:
+            current_room = ROOM_TYPES[new_room]
+            print("nuc - person travels from {0} to {1}".format(last_visited, current_room))
+            last_entered_time = datetime.now()
+            dwell_monitor.enter(HOUSE_ID, current_room)
+
+            # activate respective MLX sensors according to the room where the person is in
+            client.publish(STATE_TOPIC, current_room)
+            """
+            for room in ROOMS:
+                topic = "/".join([MLX_SENSOR, HOUSE_ID, room])
+                if room == current_room:
+                    client.publish(topic, "1")
+                else:
+                    client.publish(topic, "0")
+            """
+
+        # mirror the state for the other processes on the NUC
+        shared_state.write(room_engine.current, last_entered_time.timestamp(), room_engine.occupancy)
+
     except Exception as e:
         print("ERROR: {0}".format(e))
         pdb.set_trace()
 
-def is_valid_transition(current_room):
-    return current_room in VALID_TRANSITIONS[Global.last_visited]
-
-def mqtt_worker():
+def send_dwell_alert(client, resident, room, minutes):
+    print("nuc - person has been in {0} for more than {1} minutes".format(room, minutes))
+    client.publish(ALERT_TOPIC, room)
 
-    # to run as a separate process
+def run():
+    global dwell_monitor, shared_state
     import paho.mqtt.client as mqtt
     # MQTT Setup
     client = mqtt.Client()
@@ -116,33 +110,46 @@ def mqtt_worker():
     client.on_disconnect = on_disconnect
     client.on_message    = on_message
 
+    shared_state = SharedRoomState(SHARED_STATE_NAME)
+    shared_state.write(room_engine.current, last_entered_time.timestamp(), room_engine.occupancy)
+
     print("Connecting to broker...", BROKER)
     client.connect(BROKER, PORT)
 
-    # Subscribe to topics for bps sensors
-    for room in ROOMS:
-        print("Subscribing to ", room)
-        print("/".join([BPS_SENSOR, HOUSE_ID, room]))
-        client.subscribe("/".join([BPS_SENSOR, HOUSE_ID, room]))
-
-    client.publish("/".join([DEVICE_TYPE, HOUSE_ID, room]), "Started NUC!")
-    client.loop_forever()
-
-mqtt_worker_process = Process(target=mqtt_worker)
-mqtt_worker_process.start()
+    client.publish("/".join([DEVICE_TYPE, HOUSE_ID, ROOMS[-1]]), "Started NUC!")
 
-while True:
+    # room cutoff times are checked between messages, waking up for the next deadline only
+    dwell_monitor = DwellMonitor(ROOM_CUTOFF_TIME_MINUTES,
+                                 on_alert=lambda resident, room, minutes: send_dwell_alert(client, resident, room, minutes))
+    dwell_monitor.enter(HOUSE_ID, room_engine.current_room)
+    reconnect_delay = RECONNECT_DELAY_SECONDS
+    reconnect_at = None  # time of the next reconnection attempt, while the connection is lost
     try:
-        # print("binary_dict: {0}; Global.last_entered_time: {1}".format(binary_dict, Global.last_entered_time))
-        cutoff_duration_minutes = ROOM_CUTOFF_TIME_MINUTES[Global.last_visited]
-        current_duration = datetime.now()-Global.last_entered_time
-        # print("binary_dict: {0}; current_duration(seconds): {1}; cutoff_duration_minutes: {2}".format(binary_dict, current_duration, cutoff_duration_minutes))
-        if current_duration.total_seconds() >= cutoff_duration_minutes * 60:
-            print("PONG")
-            mqtt_worker_process.terminate()
-            exit(0)
+        while True:
+            if reconnect_at is None:
+                rc = client.loop(timeout=dwell_monitor.timeout())
+                if rc != mqtt.MQTT_ERR_SUCCESS:
+                    print("Connection lost, Returned Code: ", rc)
+                    reconnect_at = time.time()
+            else:
+                # wait for the next attempt, waking up for the dwell deadlines in the meantime
+                time.sleep(max(min(reconnect_at - time.time(), dwell_monitor.timeout()), 0))
+                if time.time() >= reconnect_at:
+                    try:
+                        print("Reconnecting to broker...", BROKER)
+                        client.reconnect()
+                        reconnect_at = None
+                        reconnect_delay = RECONNECT_DELAY_SECONDS
+                    except OSError as e:
+                        print("Reconnection failed: {0}, retrying in {1}s".format(e, reconnect_delay))
+                        reconnect_at = time.time() + reconnect_delay
+                        reconnect_delay = min(2 * reconnect_delay, MAX_RECONNECT_DELAY_SECONDS)
+            dwell_monitor.check()
     except KeyboardInterrupt:
         print("Interrupt received.")
-        mqtt_worker_process.terminate()
-        exit(0)
+    finally:
+        client.disconnect()
+        shared_state.close()
 
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,166 @@
+import asyncio
+import struct
+import threading
+
+"""
+Minimal MQTT 3.1.1 broker, standing in for mosquitto in tests and benchmarks on a single machine.
+
+It implements what the BPS, RPis and NUC use: CONNECT, SUBSCRIBE / UNSUBSCRIBE with + and #
+wildcards, PUBLISH at QoS 0, 1 and 2 (acked as the protocol requires, and always forwarded at
+QoS 0), PINGREQ and DISCONNECT. Retained messages, wills, sessions and authentication are not
+supported. Point the services at it with the MQTT_BROKER and MQTT_PORT environment variables.
+
+The subscribers of a topic are looked up once and cached until the subscriptions change, so
+routing a message costs a dict lookup whatever the number of subscriptions.
+"""
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    """Whether topic matches topic_filter, e.g. "bps/+/+" matches "bps/kjhouse/bedroom" """
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+def encode_length(length):
+    """Remaining length of the fixed header, 7 bits per byte"""
+    encoded = bytearray()
+    while True:
+        length, byte = divmod(length, 128)
+        encoded.append(byte | (128 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+def packet(packet_type, body, flags=0):
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+def encode_string(s):
+    data = s.encode("utf-8")
+    return struct.pack(">H", len(data)) + data
+
+def decode_string(body, offset):
+    (length,) = struct.unpack_from(">H", body, offset)
+    return body[offset + 2:offset + 2 + length].decode("utf-8"), offset + 2 + length
+
+
+class LocalBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        """
+        Args:
+            host (str, optional): Defaults to "127.0.0.1".
+            port (int, optional): Defaults to 0, a free port, see self.port once started.
+        """
+        self.host = host
+        self.port = port
+        self.subscriptions = {}  # writer -> set of topic filters
+        self.routes = {}  # topic -> subscribed writers, cleared when subscriptions change
+        self.received = 0  # PUBLISH packets received
+        self.delivered = 0  # PUBLISH packets forwarded to subscribers
+        self.loop = None
+        self.server = None
+
+    def start(self):
+        """Run the broker in a background thread, returns the port it listens on"""
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle_client, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def close(self):
+        self.server.close()
+        for writer in list(self.subscriptions):
+            writer.close()
+        await self.server.wait_closed()
+        while self.subscriptions:
+            await asyncio.sleep(0.01)  # until every handle_client returned
+
+    def subscribers(self, topic):
+        writers = self.routes.get(topic)
+        if writers is None:
+            writers = self.routes[topic] = [writer for writer, filters in self.subscriptions.items()
+                                            if any(topic_matches(f, topic) for f in filters)]
+        return writers
+
+    def publish(self, topic, payload):
+        message = packet(PUBLISH, encode_string(topic) + payload)
+        for writer in self.subscribers(topic):
+            if not writer.is_closing():
+                writer.write(message)
+                self.delivered += 1
+
+    async def read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 127) * multiplier
+            multiplier *= 128
+            if not byte & 128:
+                break
+        return header >> 4, header & 15, await reader.readexactly(length)
+
+    async def handle_client(self, reader, writer):
+        self.subscriptions[writer] = set()
+        try:
+            while True:
+                packet_type, flags, body = await self.read_packet(reader)
+                if packet_type == PUBLISH:
+                    self.received += 1
+                    qos = flags >> 1 & 3
+                    topic, offset = decode_string(body, 0)
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        writer.write(packet(PUBACK if qos == 1 else PUBREC, packet_id))
+                    self.publish(topic, body[offset:])
+                elif packet_type == PUBREL:
+                    writer.write(packet(PUBCOMP, body[:2]))
+                elif packet_type == CONNECT:
+                    writer.write(packet(CONNACK, b"\x00\x00"))
+                elif packet_type == SUBSCRIBE:
+                    offset = 2
+                    granted = bytearray()
+                    while offset < len(body):
+                        topic_filter, offset = decode_string(body, offset)
+                        offset += 1  # requested QoS, messages are forwarded at QoS 0
+                        self.subscriptions[writer].add(topic_filter)
+                        granted.append(0)
+                    self.routes.clear()
+                    writer.write(packet(SUBACK, body[:2] + bytes(granted)))
+                elif packet_type == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        topic_filter, offset = decode_string(body, offset)
+                        self.subscriptions[writer].discard(topic_filter)
+                    self.routes.clear()
+                    writer.write(packet(UNSUBACK, body[:2]))
+                elif packet_type == PINGREQ:
+                    writer.write(packet(PINGRESP, b""))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # the client went away
+        finally:
+            del self.subscriptions[writer]
+            self.routes.clear()
+            writer.close()
+
+if __name__ == '__main__':
+    import sys
+    broker = LocalBroker("0.0.0.0", int(sys.argv[1]) if len(sys.argv) > 1 else 1883)
+    print("Listening on port", broker.start())
+    threading.Event().wait()
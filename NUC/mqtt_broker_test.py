@@ -0,0 +1,50 @@
+import time
+
+import paho.mqtt.client as mqtt
+
+from load_generator import run_benchmark
+from mqtt_broker import LocalBroker, topic_matches
+
+
+def test_topic_matches():
+    assert topic_matches("bps/+/+", "bps/kjhouse/bedroom")
+    assert topic_matches("bps/#", "bps/kjhouse/bedroom")
+    assert topic_matches("nuc/kjhouse", "nuc/kjhouse")
+    assert not topic_matches("bps/+", "bps/kjhouse/bedroom")
+    assert not topic_matches("bps/+/+", "nuc/kjhouse/alert")
+    assert not topic_matches("nuc/kjhouse/alert", "nuc/kjhouse")
+
+def test_publish_subscribe():
+    broker = LocalBroker()
+    port = broker.start()
+    received = []
+    subscriber = mqtt.Client()
+    subscriber.on_message = lambda client, userdata, msg: received.append((msg.topic, msg.payload))
+    subscriber.connect("127.0.0.1", port)
+    subscriber.loop_start()
+    subscriber.subscribe("bps/+/+")
+    publisher = mqtt.Client()
+    publisher.connect("127.0.0.1", port)
+    publisher.loop_start()
+    time.sleep(0.5)
+    publisher.publish("bps/kjhouse/bedroom", b"1")
+    publisher.publish("nuc/kjhouse", b"bedroom")
+    publisher.publish("bps/kjhouse/toilet", b"0", qos=1)
+    deadline = time.time() + 5
+    while len(received) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert received == [("bps/kjhouse/bedroom", b"1"), ("bps/kjhouse/toilet", b"0")]
+    publisher.loop_stop()
+    subscriber.loop_stop()
+    broker.stop()
+
+def test_end_to_end(num_houses=50, moves_per_second=1, duration=3):
+    results = run_benchmark(num_houses, moves_per_second, num_rpis=2, payloads_per_second=2, duration=duration)
+    print(results)
+    assert results["bps"]["state_changes"] == results["bps"]["moves"] > 0
+    assert results["rpi"]["payloads"] > 0
+    assert results["rpi"]["timelines"] == 2  # the payloads were merged, one room per RPi, all on 2020.08.01
+
+# test_topic_matches()
+# test_publish_subscribe()
+# test_end_to_end()
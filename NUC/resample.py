@@ -0,0 +1,41 @@
+import numpy as np
+import scipy.fft
+import scipy.signal
+
+"""
+Resampling of a displacement series to a given number of samples, e.g. one per second of a
+room visit, for payloads without per-frame timestamps.
+
+scipy.signal.resample treats the series as periodic, so it is padded by reflection on both
+ends before the transform, which stops the ends ringing from the signal wrapping around, and
+padded to a fast FFT length, which avoids the slow transforms of lengths with large prime
+factors. Series too short to pad are interpolated linearly instead.
+
+This file is the same in MLX90640/ and NUC/, keep them in sync.
+"""
+
+MIN_FFT_LENGTH = 4  # shorter series get no padding and overshoot, e.g. [1, 2]
+
+
+def fft_resample(values, length):
+    """Resample values to length samples
+
+    Args:
+        values (list or np.array): at least one value
+        length (int): number of samples of the output
+
+    Returns:
+        np.array: float64 array of length values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n < MIN_FFT_LENGTH:
+        return np.interp(np.arange(length) * n / length, np.arange(n), values)
+    pad = n // 4
+    fast_length = scipy.fft.next_fast_len(int(np.ceil((n + 2 * pad) * length / n)))
+    padded_length = max(int(round(fast_length * n / length)), n + pad)
+    padded = np.pad(values, (pad, padded_length - n - pad), mode='reflect')
+    out = scipy.signal.resample(padded, fast_length)
+    start = int(round(pad * fast_length / padded_length))
+    out = out[start:start + length]
+    return np.pad(out, (0, length - len(out)), mode='edge')
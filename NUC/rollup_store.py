@@ -0,0 +1,176 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from activity_levels import DAY_SECONDS, TIME_FORMAT
+from activity_timeline import DATE_FORMAT, ActivityTimelines
+
+"""
+Long term store of per-room activity at several resolutions.
+
+The activity of every finished day is kept at each level of ROLLUP_LEVELS (bin widths in
+seconds: second, minute, 30 minutes, day). A store is a folder with one subfolder per room, and
+for every level three flat binary files indexed by bin number since the first day of the store:
+- <level>.sum: float32, sum of the per-second displacement over the bin
+- <level>.max: float32, maximum per-second displacement in the bin
+- <level>.count: uint32, number of seconds of the bin for which a segment was received
+Coarser levels are computed once when a day is added, so a query only reads the slice of the
+coarsest level that divides the requested resolution, e.g. 90 days of 30 minute bins is a
+single read of 4320 values.
+"""
+
+ROLLUP_LEVELS = (1, 60, 1800, DAY_SECONDS)
+ROLLUP_FIELDS = {"sum": np.float32, "max": np.float32, "count": np.uint32}
+META_FILE = "meta.json"
+
+
+def to_datetime(t):
+    """datetime from a "%Y.%m.%d_%H%M%S" or "%Y.%m.%d" string, datetimes are returned as they are"""
+    if isinstance(t, datetime):
+        return t
+    return datetime.strptime(t, TIME_FORMAT if "_" in t else DATE_FORMAT)
+
+
+class RollupStore:
+    def __init__(self, path, origin=None, levels=ROLLUP_LEVELS):
+        """
+        Args:
+            path (str): folder of the store, created if absent. An existing store is opened for appending.
+            origin (str, optional): "%Y.%m.%d" of the first day that can be stored, ignored for an existing
+                store. Defaults to None, the first day added.
+            levels (tuple of int, optional): bin widths in seconds, each dividing DAY_SECONDS.
+                Ignored for an existing store. Defaults to ROLLUP_LEVELS.
+        """
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            origin = meta["origin"]
+            levels = meta["levels"]
+        for level in levels:
+            if DAY_SECONDS % level:
+                raise ValueError("Rollup level {} does not divide a day".format(level))
+        self.levels = sorted(levels)
+        self.origin = None if origin is None else to_datetime(origin)
+        self._arrays = {}  # read-only memmaps, dropped when the file is written to
+
+    def _save_meta(self):
+        with open(os.path.join(self.path, META_FILE), "w") as meta_file:
+            json.dump({"origin": self.origin.strftime(DATE_FORMAT), "levels": self.levels}, meta_file)
+
+    def _file(self, room, level, field):
+        return os.path.join(self.path, room, "{}.{}".format(level, field))
+
+    def rooms(self):
+        return sorted(f for f in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, f)))
+
+    def add_day(self, room, date, activity, covered=None):
+        """Store one day of per-second activity of a room, replacing that day if it was already stored.
+
+        Args:
+            room (str)
+            date (str): "%Y.%m.%d"
+            activity (np.ndarray): DAY_SECONDS displacement values, e.g. DailyActivityTimeline.activity
+            covered (np.ndarray, optional): DAY_SECONDS booleans, seconds for which data was received.
+                Defaults to None, every second.
+        """
+        day = to_datetime(date)
+        if self.origin is None:
+            self.origin = day
+            self._save_meta()
+        day_index = (day - self.origin).days
+        if day_index < 0:
+            raise ValueError("{} is before the first day of the store, {}".format(date, self.origin.strftime(DATE_FORMAT)))
+        if not os.path.exists(os.path.join(self.path, room)):
+            os.makedirs(os.path.join(self.path, room))
+
+        activity = np.asarray(activity, dtype=np.float64)
+        covered = np.ones(DAY_SECONDS, dtype=bool) if covered is None else np.asarray(covered, dtype=bool)
+        for level in self.levels:
+            bins = DAY_SECONDS // level
+            rollup = {
+                "sum": activity.reshape(bins, level).sum(axis=1),
+                "max": np.where(covered, activity, 0).reshape(bins, level).max(axis=1),
+                "count": covered.reshape(bins, level).sum(axis=1),
+            }
+            for field, dtype in ROLLUP_FIELDS.items():
+                values = rollup[field].astype(dtype)
+                self._arrays.pop((room, level, field), None)
+                mode = "r+b" if os.path.exists(self._file(room, level, field)) else "wb"
+                with open(self._file(room, level, field), mode) as rollup_file:
+                    # missing days before this one are left as zeros
+                    rollup_file.seek(day_index * values.nbytes)
+                    rollup_file.write(values.tobytes())
+
+    def add_timeline(self, timeline):
+        """Store a DailyActivityTimeline"""
+        self.add_day(timeline.room, timeline.date, timeline.activity, timeline.covered)
+
+    def _array(self, room, level, field):
+        key = (room, level, field)
+        if key not in self._arrays:
+            path = self._file(room, level, field)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                return np.zeros(0, dtype=ROLLUP_FIELDS[field])
+            self._arrays[key] = np.memmap(path, dtype=ROLLUP_FIELDS[field], mode="r")
+        return self._arrays[key]
+
+    def query(self, room, start, end, resolution=1800):
+        """Activity of a room in bins of `resolution` seconds over [start, end).
+
+        Reads the coarsest level dividing the resolution, and only the bins within the range.
+        Bins of days that were never stored have a count of 0.
+
+        Args:
+            room (str)
+            start (str or datetime): "%Y.%m.%d_%H%M%S" or "%Y.%m.%d", rounded down to a bin
+            end (str or datetime): same format, rounded up to a bin
+            resolution (int, optional): bin width in seconds, a multiple of one of the levels. Defaults to 1800.
+
+        Returns:
+            dict: "times" (bin starts in seconds since the epoch), "sum", "max", "count" and "mean",
+                the mean activity over the covered seconds of each bin (0 if none)
+        """
+        level = max(l for l in self.levels if resolution % l == 0)
+        factor = resolution // level
+        if self.origin is None:
+            first_bin, num_bins = 0, 0
+        else:
+            start_seconds = (to_datetime(start) - self.origin).total_seconds()
+            end_seconds = (to_datetime(end) - self.origin).total_seconds()
+            first_bin = int(start_seconds // resolution)
+            num_bins = max(int(-(-end_seconds // resolution)) - first_bin, 0)
+
+        result = {}
+        for field, dtype in ROLLUP_FIELDS.items():
+            array = self._array(room, level, field)
+            values = np.zeros(num_bins * factor, dtype=dtype)
+            # part of the range that is stored, the rest stays zero
+            lo = first_bin * factor
+            hi = lo + len(values)
+            stored_lo, stored_hi = max(lo, 0), min(hi, len(array))
+            if stored_hi > stored_lo:
+                values[stored_lo - lo:stored_hi - lo] = array[stored_lo:stored_hi]
+            values = values.reshape(num_bins, factor)
+            result[field] = values.max(axis=1) if field == "max" else values.sum(axis=1, dtype=np.float64 if field == "sum" else np.uint64)
+
+        result["mean"] = result["sum"] / np.maximum(result["count"], 1)
+        origin = 0 if self.origin is None else time.mktime(self.origin.timetuple())
+        result["times"] = origin + (first_bin + np.arange(num_bins)) * float(resolution)
+        return result
+
+
+def rollup_data_folder(data_dir, store):
+    """Add every day found in the json saved by the TCP server to a RollupStore, e.g. to build a store
+    from the data received before it existed. Returns the (date, room) pairs added."""
+    timelines = ActivityTimelines(windows=())
+    timelines.load_folder(data_dir)
+    for key in sorted(timelines.timelines):
+        store.add_timeline(timelines.timelines[key])
+    return sorted(timelines.timelines)
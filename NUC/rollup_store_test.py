@@ -0,0 +1,62 @@
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from activity_levels import DAY_SECONDS
+from rollup_store import RollupStore, rollup_data_folder
+
+
+def make_store(num_days=90, room="livingroom"):
+    path = tempfile.mkdtemp()
+    store = RollupStore(path)
+    days = {}
+    first_day = datetime(2020, 5, 1)
+    for d in range(num_days):
+        date = (first_day + timedelta(days=d)).strftime("%Y.%m.%d")
+        activity = np.random.rand(DAY_SECONDS)
+        covered = np.random.rand(DAY_SECONDS) > 0.5
+        activity[~covered] = 0
+        store.add_day(room, date, activity, covered)
+        days[date] = (activity, covered)
+    return store, days
+
+def test_query_levels(room="livingroom"):
+    store, days = make_store(num_days=3, room=room)
+    activity = np.concatenate([days[d][0] for d in sorted(days)])
+    covered = np.concatenate([days[d][1] for d in sorted(days)])
+
+    for resolution in (1, 60, 1800, 3600):
+        result = store.query(room, "2020.05.01_120000", "2020.05.03", resolution)
+        start, end = 12 * 3600, 2 * DAY_SECONDS
+        assert np.allclose(result["sum"], activity[start:end].reshape(-1, resolution).sum(axis=1), rtol=1e-5)
+        assert np.allclose(result["max"], activity[start:end].reshape(-1, resolution).max(axis=1))
+        assert np.array_equal(result["count"], covered[start:end].reshape(-1, resolution).sum(axis=1))
+
+    # days that were never stored are empty
+    result = store.query(room, "2020.04.30", "2020.05.10", DAY_SECONDS)
+    assert result["count"][0] == 0 and (result["count"][1:4] > 0).all() and (result["count"][4:] == 0).all()
+    shutil.rmtree(store.path)
+
+def test_query_speed(num_days=90):
+    store, days = make_store(num_days)
+    store = RollupStore(store.path)  # reopen, nothing cached
+    start = time.time()
+    result = store.query("livingroom", "2020.05.01", "2020.07.30", 1800)
+    print("{} days of 30 minute bins queried in {:.4f}s".format(num_days, time.time() - start))
+    assert len(result["sum"]) == num_days * 48
+    shutil.rmtree(store.path)
+
+def test_rollup_data_folder():
+    store = RollupStore(tempfile.mkdtemp())
+    added = rollup_data_folder("test_json", store)
+    print(added)
+    result = store.query("bedroom", "2020.07.14", "2020.07.15", DAY_SECONDS)
+    assert result["count"][0] > 0
+    shutil.rmtree(store.path)
+
+# test_query_levels()
+# test_query_speed()
+# test_rollup_data_folder()
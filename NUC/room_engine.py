@@ -0,0 +1,102 @@
+from RoomMonitor import LIVING_ROOM, ROOM_TYPES, RoomMonitor
+
+"""
+Room tracking from the BPS occupancy messages, driven by integer lookup tables.
+
+Rooms are numbered by their position in ROOM_TYPES, and the BPS readings of a house are kept as
+a bitmap with bit i set when room i is occupied. The valid moves are read once from the
+transitions declared in RoomMonitor and turned into two flat tables:
+- VALID[current * NUM_ROOMS + room]: 1 if the person can go from current to room
+- NEXT_ROOM[current << NUM_ROOMS | occupancy]: room to move to for an occupancy bitmap, or -1.
+  Only bitmaps with a single occupied room lead somewhere, as in __main__.bps_callback.
+Handling a message is then a dict lookup of the topic, two bit operations and one table lookup,
+with no string building or comparison.
+"""
+
+NUM_ROOMS = len(ROOM_TYPES)
+ROOM_INDEX = {room: i for i, room in enumerate(ROOM_TYPES)}
+NO_CHANGE = -1
+
+
+def declared_transitions(machine=RoomMonitor):
+    """(source, destination) room names of every transition declared in a StateMachine class"""
+    transitions = set()
+    for transition in machine().transitions:
+        source = getattr(transition.source, "name", None)
+        for destination in transition.destinations:
+            # combined transitions like liv2x are skipped, their parts are listed too
+            if source in ROOM_INDEX and getattr(destination, "name", None) in ROOM_INDEX:
+                transitions.add((source, destination.name))
+    return transitions
+
+def build_tables(transitions):
+    """VALID and NEXT_ROOM tables from (source, destination) room names"""
+    valid = [0] * (NUM_ROOMS * NUM_ROOMS)
+    for source, destination in transitions:
+        valid[ROOM_INDEX[source] * NUM_ROOMS + ROOM_INDEX[destination]] = 1
+
+    next_room = [NO_CHANGE] * (NUM_ROOMS << NUM_ROOMS)
+    for current in range(NUM_ROOMS):
+        for room in range(NUM_ROOMS):
+            if valid[current * NUM_ROOMS + room]:
+                next_room[current << NUM_ROOMS | 1 << room] = room
+    return valid, next_room
+
+VALID, NEXT_ROOM = build_tables(declared_transitions())
+
+
+class RoomEngine:
+    def __init__(self, house_id, initial_room=LIVING_ROOM, exclusive=True, sensor="bps"):
+        """
+        Args:
+            house_id (str)
+            initial_room (str, optional): Defaults to LIVING_ROOM, the initial state of RoomMonitor.
+            exclusive (bool, optional): only move once the person is detected in a single room, like
+                __main__. Otherwise move as soon as a room the person can go to becomes occupied, like
+                main_new. Defaults to True.
+            sensor (str, optional): device type of the occupancy topics. Defaults to "bps".
+        """
+        self.house_id = house_id
+        self.exclusive = exclusive
+        self.current = ROOM_INDEX[initial_room]
+        self.occupancy = 0
+        # topic -> bit of the room, so that messages are dispatched without splitting the topic
+        self.topic_bits = {"/".join([sensor, house_id, room]): i for i, room in enumerate(ROOM_TYPES)}
+
+    @property
+    def current_room(self):
+        return ROOM_TYPES[self.current]
+
+    def update(self, room, occupied):
+        """Record the reading of the BPS of room (index in ROOM_TYPES).
+
+        Returns:
+            int: index of the room the person moved to, or NO_CHANGE
+        """
+        if occupied:
+            self.occupancy |= 1 << room
+        else:
+            self.occupancy &= ~(1 << room)
+
+        if self.exclusive:
+            room = NEXT_ROOM[self.current << NUM_ROOMS | self.occupancy]
+        elif not (occupied and VALID[self.current * NUM_ROOMS + room]):
+            room = NO_CHANGE
+        if room != NO_CHANGE:
+            self.current = room
+        return room
+
+    def handle_message(self, topic, payload):
+        """Handle one MQTT message, payload is b"0" or b"1". Other topics and payloads are ignored.
+
+        Returns:
+            int: index of the room the person moved to, or NO_CHANGE
+        """
+        room = self.topic_bits.get(topic)
+        if room is None:
+            return NO_CHANGE
+        if payload == b"1":
+            return self.update(room, True)
+        if payload == b"0":
+            return self.update(room, False)
+        return NO_CHANGE
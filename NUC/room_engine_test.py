@@ -0,0 +1,88 @@
+import math
+import random
+import time
+
+from RoomMonitor import LIVING_ROOM, ROOM_TYPES
+from room_engine import NO_CHANGE, RoomEngine, declared_transitions
+
+
+def simulate_bps_stream(house_id="kjhouse", num_moves=10000, seed=0):
+    """(topic, payload) messages of a person walking through valid transitions,
+    the BPS of the new room goes to 1 before the one of the previous room goes to 0"""
+    rng = random.Random(seed)
+    transitions = sorted(declared_transitions())
+    room = LIVING_ROOM
+    stream = []
+    for _ in range(num_moves):
+        new_room = rng.choice([d for s, d in transitions if s == room])
+        stream.append(("bps/{}/{}".format(house_id, new_room), b"1"))
+        stream.append(("bps/{}/{}".format(house_id, room), b"0"))
+        room = new_room
+    return stream
+
+def load_bps_stream(path):
+    """Messages recorded with `mosquitto_sub -v -t 'bps/#' > path`, one "topic payload" per line"""
+    stream = []
+    with open(path) as f:
+        for line in f:
+            topic, payload = line.split()
+            stream.append((topic, payload.encode("utf-8")))
+    return stream
+
+def legacy_handle(state, topic, payload):
+    """Room tracking as __main__ did it: string parsing, weighted dict and log based power of two test"""
+    device_type, house_id, room_type = topic.split("/")
+    m_decode = payload.decode("utf-8", "ignore")
+    if m_decode == "0" or m_decode == "1":
+        state["binary"][room_type] = int(m_decode)
+    value = sum(state["weights"][x] * state["binary"][x] for x in state["weights"])
+    if value == 0 or math.ceil(math.log10(value) / math.log10(2)) != math.floor(math.log10(value) / math.log10(2)):
+        return None
+    new = [x for x in state["weights"] if state["weights"][x] == value][0]
+    if new != state["last"] and (state["last"], new) in state["transitions"]:
+        state["last"] = new
+        return new
+    return None
+
+def test_engine_matches_legacy(num_moves=2000):
+    stream = simulate_bps_stream(num_moves=num_moves)
+    engine = RoomEngine("kjhouse")
+    state = {"weights": {room: 2 ** i for i, room in enumerate(ROOM_TYPES)}, "binary": {room: 0 for room in ROOM_TYPES},
+             "last": LIVING_ROOM, "transitions": declared_transitions()}
+    for topic, payload in stream:
+        new_room = engine.handle_message(topic, payload)
+        expected = legacy_handle(state, topic, payload)
+        assert (ROOM_TYPES[new_room] if new_room != NO_CHANGE else None) == expected
+    assert engine.current_room == state["last"]
+
+def test_non_exclusive():
+    """Like main_new: move as soon as a reachable room is occupied, whatever the other rooms read"""
+    engine = RoomEngine("kjhouse", exclusive=False)
+    assert engine.handle_message("bps/kjhouse/bedroom", b"1") == ROOM_TYPES.index("bedroom")
+    assert engine.handle_message("bps/kjhouse/kitchen", b"1") == NO_CHANGE  # not reachable from the bedroom
+    assert engine.handle_message("bps/otherhouse/toilet", b"1") == NO_CHANGE
+    assert engine.handle_message("bps/kjhouse/toilet", b"1") == ROOM_TYPES.index("toilet")
+
+def test_throughput(stream=None, num_moves=100000):
+    """Messages per second of the engine against the legacy string based handling.
+    Pass a recorded stream from load_bps_stream to replay it instead of a simulated one."""
+    stream = simulate_bps_stream(num_moves=num_moves) if stream is None else stream
+    engine = RoomEngine("kjhouse")
+    start = time.perf_counter()
+    for topic, payload in stream:
+        engine.handle_message(topic, payload)
+    engine_rate = len(stream) / (time.perf_counter() - start)
+
+    state = {"weights": {room: 2 ** i for i, room in enumerate(ROOM_TYPES)}, "binary": {room: 0 for room in ROOM_TYPES},
+             "last": LIVING_ROOM, "transitions": declared_transitions()}
+    start = time.perf_counter()
+    for topic, payload in stream:
+        legacy_handle(state, topic, payload)
+    legacy_rate = len(stream) / (time.perf_counter() - start)
+    print("RoomEngine: {:.0f} msg/s, legacy: {:.0f} msg/s".format(engine_rate, legacy_rate))
+    assert engine_rate > legacy_rate
+
+# test_engine_matches_legacy()
+# test_non_exclusive()
+# test_throughput()
+# test_throughput(load_bps_stream("bps.log"))
@@ -0,0 +1,79 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+"""
+Room state of a house published in shared memory, for other processes on the NUC to read.
+
+The NUC service keeps its state in plain local variables, and only mirrors the few values other
+processes need into a small SharedMemory struct. There is a single writer, so no lock is needed:
+the struct is a seqlock. The writer makes the sequence number odd, writes the fields and makes it
+even again, and a reader retries until it read the same even sequence number before and after
+copying the fields.
+"""
+
+SEQUENCE = 0
+ROOM = 1  # index in ROOM_TYPES, -1 if unknown
+ENTERED_TIME = 2  # time.time() when the person entered the room
+OCCUPANCY = 3  # BPS occupancy bitmap
+NUM_FIELDS = 4
+
+
+class SharedRoomState:
+    def __init__(self, name=None, create=True):
+        """
+        Args:
+            name (str, optional): name of the shared memory block. Defaults to None, a random name.
+            create (bool, optional): create the block, otherwise attach to an existing one. A block of
+                that name left by a writer that did not close() it, e.g. after a crash, is taken over.
+                Defaults to True.
+        """
+        if create and name is not None:
+            self.shm = self._create_or_take_over(name)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name, create=create, size=NUM_FIELDS * 8)
+        self.name = self.shm.name
+        self._owner = create
+        self._fields = np.ndarray((NUM_FIELDS,), dtype=np.float64, buffer=self.shm.buf)
+        if create:
+            self._fields[:] = 0
+            self._fields[ROOM] = -1
+
+    @staticmethod
+    def _create_or_take_over(name):
+        try:
+            return shared_memory.SharedMemory(name=name, create=True, size=NUM_FIELDS * 8)
+        except FileExistsError:
+            pass
+        shm = shared_memory.SharedMemory(name=name)
+        if shm.size >= NUM_FIELDS * 8:
+            print("Taking over shared memory {} left by a previous run".format(name))
+            return shm  # readers still attached to it keep getting the updates
+        shm.close()
+        shm.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=NUM_FIELDS * 8)
+
+    def write(self, room, entered_time, occupancy):
+        fields = self._fields
+        fields[SEQUENCE] += 1  # odd, readers retry
+        fields[ROOM] = room
+        fields[ENTERED_TIME] = entered_time
+        fields[OCCUPANCY] = occupancy
+        fields[SEQUENCE] += 1
+
+    def read(self):
+        """(room, entered_time, occupancy) as last written"""
+        while True:
+            sequence = self._fields[SEQUENCE]
+            if sequence % 2 == 0:
+                room, entered_time, occupancy = self._fields[ROOM:OCCUPANCY + 1]
+                if self._fields[SEQUENCE] == sequence:
+                    return int(room), float(entered_time), int(occupancy)
+            time.sleep(0)
+
+    def close(self):
+        del self._fields
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
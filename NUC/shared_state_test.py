@@ -0,0 +1,86 @@
+import time
+from multiprocessing import Manager, Process, Queue
+
+from RoomMonitor import LIVING_ROOM, ROOM_TYPES
+from room_engine import NO_CHANGE, RoomEngine
+from room_engine_test import simulate_bps_stream
+from shared_state import SharedRoomState
+
+
+def manager_handle(Global, topic, payload):
+    """Room tracking as main_new did it: every read and write of the state is a round trip to the Manager process"""
+    device_type, house_id, room_type = topic.split("/")
+    binary_dict = Global.binary_dict
+    binary_dict[room_type] = int(payload.decode("utf-8", "ignore"))
+    Global.binary_dict = binary_dict
+    occupied = [room for room, value in binary_dict.items() if value == 1]
+    if len(occupied) == 1 and occupied[0] != Global.last_visited:
+        Global.last_visited = occupied[0]
+        Global.last_entered_time = time.time()
+        return occupied[0]
+    return None
+
+def read_state(name, queue):
+    state = SharedRoomState(name, create=False)
+    queue.put(state.read())
+    state.close()
+
+def test_cross_process_read():
+    state = SharedRoomState()
+    state.write(ROOM_TYPES.index("toilet"), 1234.5, 0b100)
+    queue = Queue()
+    reader = Process(target=read_state, args=(state.name, queue))
+    reader.start()
+    assert queue.get(timeout=10) == (ROOM_TYPES.index("toilet"), 1234.5, 0b100)
+    reader.join()
+    state.close()
+
+def test_restart_without_close(name="nuc_test_restart"):
+    """A writer that was killed leaves its block behind, the next one takes it over"""
+    crashed = SharedRoomState(name)
+    crashed.write(ROOM_TYPES.index("toilet"), 1234.5, 0b100)
+    crashed.shm.close()  # no close(), the block is not unlinked
+    reader = SharedRoomState(name, create=False)
+
+    state = SharedRoomState(name)
+    assert state.read() == (-1, 0.0, 0)
+    state.write(ROOM_TYPES.index("kitchen"), 42.0, 0b1)
+    assert reader.read() == (ROOM_TYPES.index("kitchen"), 42.0, 0b1)
+    reader.close()
+    state.close()
+    state = SharedRoomState(name)  # closed properly this time
+    state.close()
+
+def test_latency(num_moves=2000):
+    """Time per BPS message with the state in a Manager versus local objects mirrored to shared memory"""
+    stream = simulate_bps_stream("kjhouse", num_moves)
+
+    with Manager() as manager:
+        Global = manager.Namespace()
+        Global.binary_dict = {room: int(room == LIVING_ROOM) for room in ROOM_TYPES}
+        Global.last_visited = LIVING_ROOM
+        Global.last_entered_time = time.time()
+        legacy_moves = 0
+        start = time.perf_counter()
+        for topic, payload in stream:
+            legacy_moves += manager_handle(Global, topic, payload) is not None
+        legacy = (time.perf_counter() - start) / len(stream)
+
+    engine = RoomEngine("kjhouse", initial_room=LIVING_ROOM, exclusive=False)
+    state = SharedRoomState()
+    moves = 0
+    start = time.perf_counter()
+    for topic, payload in stream:
+        room = engine.handle_message(topic, payload)
+        if room != NO_CHANGE:
+            moves += 1
+            state.write(room, time.time(), engine.occupancy)
+    local = (time.perf_counter() - start) / len(stream)
+    state.close()
+
+    print("manager: {:.2f} us per message, local: {:.2f} us per message".format(legacy * 1e6, local * 1e6))
+    assert moves == legacy_moves == num_moves
+
+# test_cross_process_read()
+# test_restart_without_close()
+# test_latency()
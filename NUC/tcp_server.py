@@ -3,6 +3,7 @@ import os
 from socket import *
 from struct import unpack
 from os.path import exists
+from payload_codec import decode_payload
 from RoomMonitor import ROOM_TYPES
 
 
@@ -40,8 +41,7 @@ class ServerProtocol:
                     connection.shutdown(SHUT_WR)
                     connection.close()
 
-                decoded_data = data.decode("utf-8")
-                received_json = json.loads(decoded_data)
+                received_json = decode_payload(data)
                 print("received_json: {0}".format(received_json))
                 print("type(received_json): {0}".format(type(received_json)))
                 
@@ -1,40 +1,56 @@
-import os
-from socket import *
-from struct import unpack
+import asyncio
 import json
+from struct import unpack
+
+"""
+Test server for tcp_client.py, on the same asyncio design as NUC/async_tcp_server.py.
+
+The protocol is unchanged: an 8 byte '>Q' length, the payload, and a 1 byte b'\\00' ack. Every
+client connection is handled by its own coroutine, so many clients can send at the same time,
+a connection may carry several payloads, acked in order, and every payload is read with a
+single readexactly(length). Payloads are only printed, so they are decoded on the event loop.
+"""
+
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024  # a corrupt length prefix must not make us allocate terabytes
+
 
 class ServerProtocol:
 
-    def __init__(self):
-        self.socket = None
+    def __init__(self, max_payload=MAX_PAYLOAD_BYTES):
+        self.server = None
         self.output_dir = '.'
         self.file_num = 1
+        self.max_payload = max_payload
 
-    def listen(self, server_ip, server_port):
-        self.socket = socket(AF_INET, SOCK_STREAM)
-        self.socket.bind((server_ip, server_port))
-        self.socket.listen(1)
+    async def listen(self, server_ip, server_port):
+        self.server = await asyncio.start_server(self.handle_client, server_ip, server_port)
+        return self.server
+
+    async def handle_data(self):
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            print("closing port...")
+            self.close()
 
-    def handle_data(self):
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info("peername")
         try:
             while True:
-                (connection, addr) = self.socket.accept()
                 try:
-                    bs = connection.recv(8)
-                    (length,) = unpack('>Q', bs)
-                    data = b''
-                    while len(data) < length:
-                        to_read = length - len(data)
-                        received_data = connection.recv(
-                            4096 if to_read > 4096 else to_read)
-                        data += received_data
-
-                    # send our 0 ack
-                    assert len(b'\00') == 1
-                    connection.sendall(b'\00')
-                finally:
-                    connection.shutdown(SHUT_WR)
-                    connection.close()
+                    bs = await reader.readexactly(8)
+                except asyncio.IncompleteReadError:
+                    break  # the client closed the connection between two payloads
+                (length,) = unpack('>Q', bs)
+                if length > self.max_payload:
+                    print("{}: payload of {} bytes is too big, closing the connection".format(addr, length))
+                    break
+                data = await reader.readexactly(length)
+
+                # send our 0 ack
+                writer.write(b'\00')
+                await writer.drain()
 
                 decoded_data = data.decode("utf-8")
                 received_json = json.loads(decoded_data)
@@ -42,17 +58,20 @@ class ServerProtocol:
                 print("type(received_json): {0}".format(type(received_json)))
 
                 self.file_num += 1
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print("{}: connection lost ({})".format(addr, e))
         finally:
-            print("closing port...")
-            self.close()
+            writer.close()
 
     def close(self):
-        self.socket.close()
-        self.socket = None
+        if self.server is not None:
+            self.server.close()
+            self.server = None
 
-        # could handle a bad ack here, but we'll assume it's fine.
+async def main():
+    sp = ServerProtocol()
+    await sp.listen('0.0.0.0', 9999)
+    await sp.handle_data()
 
 if __name__ == '__main__':
-    sp = ServerProtocol()
-    sp.listen('0.0.0.0', 9999)
-    sp.handle_data()
+    asyncio.run(main())